@@ -330,6 +330,8 @@ CREATE TABLE `paragony` (
   `rabat` decimal(10,2) NOT NULL,
   `opis` text DEFAULT NULL,
   `obraz` longblob DEFAULT NULL,
+  `obraz_hash` char(64) DEFAULT NULL,
+  `phash` bigint(20) UNSIGNED DEFAULT NULL,
   `data_dodania` timestamp NOT NULL DEFAULT current_timestamp() ON UPDATE current_timestamp()
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci;
 
@@ -503,9 +505,10 @@ ALTER TABLE `miasta`
 --
 ALTER TABLE `paragony`
   ADD PRIMARY KEY (`id_paragonu`),
-  ADD KEY `Paragony_fk1` (`id_uzytkownika`),
+  ADD KEY `paragony_uzytkownik_data` (`id_uzytkownika`, `data_dodania`),
   ADD KEY `Paragony_fk2` (`id_firmy`),
-  ADD KEY `Paragony_fk3` (`id_miasta`);
+  ADD KEY `Paragony_fk3` (`id_miasta`),
+  ADD KEY `paragony_uzytkownik_phash` (`id_uzytkownika`, `phash`);
 
 --
 -- Indeksy dla tabeli `powiadomienia`
@@ -521,7 +524,7 @@ ALTER TABLE `powiadomienia`
 --
 ALTER TABLE `produkty`
   ADD PRIMARY KEY (`id_produktu`),
-  ADD KEY `Produkty_fk1` (`id_paragonu`),
+  ADD KEY `produkty_paragon_kategoria_cena` (`id_paragonu`, `id_kategorii`, `cena`),
   ADD KEY `Produkty_fk8` (`id_kategorii`),
   ADD KEY `Produkty_fk9` (`id_kodu`);
 
@@ -665,7 +668,10 @@ CREATE TABLE `logi` (
   `user_status_at_log` varchar(20) DEFAULT NULL,
   `details` text DEFAULT NULL,
   PRIMARY KEY (`id`),
-  KEY `fk_logi_uzytkownik` (`id_uzytkownika`),
+  KEY `logi_uzytkownik_czas` (`id_uzytkownika`, `timestamp`),
+  KEY `logi_uzytkownik_akcja_czas` (`id_uzytkownika`, `action`, `timestamp`),
+  KEY `logi_uzytkownik_status_czas` (`id_uzytkownika`, `user_status_at_log`, `timestamp`),
+  FULLTEXT KEY `logi_details_ft` (`details`),
   CONSTRAINT `logi_ibfk_1` FOREIGN KEY (`id_uzytkownika`) REFERENCES `uzytkownicy` (`id_uzytkownika`) ON DELETE SET NULL ON UPDATE CASCADE
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci;
 
@@ -673,6 +679,104 @@ CREATE TABLE `logi` (
 -- Dumping data for table `logi`
 --
 
+-- --------------------------------------------------------
+
+--
+-- Struktura tabeli dla tabeli `klasyfikacje_produktow`
+--
+
+CREATE TABLE `klasyfikacje_produktow` (
+  `nazwa_znormalizowana` varchar(255) COLLATE utf8mb4_bin NOT NULL,
+  `id_kategorii` int(11) NOT NULL,
+  `zrodlo` enum('ai','manual') NOT NULL DEFAULT 'ai',
+  `data_aktualizacji` timestamp NOT NULL DEFAULT current_timestamp() ON UPDATE current_timestamp(),
+  PRIMARY KEY (`nazwa_znormalizowana`),
+  KEY `fk_klasyfikacje_kategoria` (`id_kategorii`),
+  CONSTRAINT `klasyfikacje_produktow_ibfk_1` FOREIGN KEY (`id_kategorii`) REFERENCES `kategorie` (`id_kategorii`) ON DELETE CASCADE ON UPDATE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci;
+
+-- --------------------------------------------------------
+
+--
+-- Struktura tabeli dla tabeli `klasyfikacje_uzytkownika`
+--
+
+CREATE TABLE `klasyfikacje_uzytkownika` (
+  `id_uzytkownika` int(11) NOT NULL,
+  `nazwa_znormalizowana` varchar(255) COLLATE utf8mb4_bin NOT NULL,
+  `id_kategorii` int(11) NOT NULL,
+  `data_aktualizacji` timestamp NOT NULL DEFAULT current_timestamp() ON UPDATE current_timestamp(),
+  PRIMARY KEY (`id_uzytkownika`, `nazwa_znormalizowana`),
+  KEY `klasyfikacje_uzytkownika_nazwa` (`nazwa_znormalizowana`, `id_kategorii`),
+  KEY `fk_klasyfikacje_uzytkownika_kategoria` (`id_kategorii`),
+  CONSTRAINT `klasyfikacje_uzytkownika_ibfk_1` FOREIGN KEY (`id_uzytkownika`) REFERENCES `uzytkownicy` (`id_uzytkownika`) ON DELETE CASCADE ON UPDATE CASCADE,
+  CONSTRAINT `klasyfikacje_uzytkownika_ibfk_2` FOREIGN KEY (`id_kategorii`) REFERENCES `kategorie` (`id_kategorii`) ON DELETE CASCADE ON UPDATE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci;
+
+-- --------------------------------------------------------
+
+--
+-- Struktura tabeli dla tabeli `paragony_obrazy`
+--
+
+CREATE TABLE `paragony_obrazy` (
+  `id_paragonu` int(11) NOT NULL,
+  `wariant` enum('thumb','medium','original') NOT NULL,
+  `format` varchar(8) NOT NULL,
+  `obraz_hash` char(64) NOT NULL,
+  `szerokosc` int(11) DEFAULT NULL,
+  `wysokosc` int(11) DEFAULT NULL,
+  `rozmiar` int(11) DEFAULT NULL,
+  `data_utworzenia` timestamp NOT NULL DEFAULT current_timestamp(),
+  PRIMARY KEY (`id_paragonu`, `wariant`, `format`),
+  CONSTRAINT `paragony_obrazy_ibfk_1` FOREIGN KEY (`id_paragonu`) REFERENCES `paragony` (`id_paragonu`) ON DELETE CASCADE ON UPDATE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci;
+
+
+-- --------------------------------------------------------
+
+--
+-- Struktura tabeli dla tabeli `wydatki_dzien_kategoria`
+--
+
+CREATE TABLE `wydatki_dzien_kategoria` (
+  `id_uzytkownika` int(11) NOT NULL,
+  `dzien` date NOT NULL,
+  `id_kategorii` int(11) NOT NULL,
+  `suma` decimal(12,2) NOT NULL DEFAULT 0.00,
+  `liczba_produktow` int(11) NOT NULL DEFAULT 0,
+  PRIMARY KEY (`id_uzytkownika`, `dzien`, `id_kategorii`),
+  KEY `wydatki_dzien_kategoria_kategoria` (`id_uzytkownika`, `id_kategorii`, `dzien`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci;
+
+-- --------------------------------------------------------
+
+--
+-- Struktura tabeli dla tabeli `wydatki_miesiac_sklep`
+--
+
+CREATE TABLE `wydatki_miesiac_sklep` (
+  `id_uzytkownika` int(11) NOT NULL,
+  `miesiac` date NOT NULL,
+  `id_firmy` int(11) NOT NULL,
+  `suma` decimal(12,2) NOT NULL DEFAULT 0.00,
+  `liczba_paragonow` int(11) NOT NULL DEFAULT 0,
+  PRIMARY KEY (`id_uzytkownika`, `miesiac`, `id_firmy`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci;
+
+-- --------------------------------------------------------
+
+--
+-- Struktura tabeli dla tabeli `wydatki_do_przeliczenia`
+--
+
+CREATE TABLE `wydatki_do_przeliczenia` (
+  `id_uzytkownika` int(11) NOT NULL,
+  `dzien` date NOT NULL,
+  `oznaczono` timestamp NOT NULL DEFAULT current_timestamp(),
+  PRIMARY KEY (`id_uzytkownika`, `dzien`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci;
+
 
 COMMIT;
 
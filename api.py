@@ -4,55 +4,151 @@ API - obsługa logiki biznesowej aplikacji
 Obsługuje polskie znaki: ą, ć, ę, ł, ń, ó, ś, ź, ż
 """
 import base64
+import io
 from decimal import Decimal
 from flask import jsonify, json, session
 from datetime import datetime
 import random
+import re
 import pyttsx3
 from db import DatabaseHelper
+from services import reference_cache, category_memo, pagination, rollups
+from services.audit_log import log_user_action
+from services.user_status import get_user_status
+from services.blob_store import get_blob_store, content_hash
 from PIL import Image
 import os
 import requests
 from datetime import datetime, timedelta
 
+# Najkrótsze słowo w indeksie FULLTEXT (innodb_ft_min_token_size)
+FULLTEXT_MIN_TOKEN = 3
 
-def log_user_action(user_id, action, user_status, details=None):
-    """Store a single audit log entry."""
-    try:
-        DatabaseHelper.execute(
-            """
-            INSERT INTO logi (id_uzytkownika, action, user_status_at_log, details)
-            VALUES (:user_id, :action, :status, :details)
-            """,
-            {
-                "user_id": user_id,
-                "action": action,
-                "status": user_status,
-                "details": details,
-            },
-        )
-    except Exception as e:
-        print(f"Error logging user action: {e}")
 
+def _slowa_fulltext(tekst):
+    """Fraza wyszukiwania logów jako zapytanie BOOLEAN MODE: każde słowo wymagane, jako prefiks"""
+    slowa = [slowo for slowo in re.findall(r"\w+", tekst or "") if len(slowo) >= FULLTEXT_MIN_TOKEN]
+    return " ".join(f"+{slowo}*" for slowo in slowa)
+
+
+def zapytanie_logow(id_uzytkownika, page=0, size=50, details_search=None, date_from=None, date_to=None,
+                    user_status=None, action=None, cursor=None):
+    """
+    Zapytanie listy logów /logi z filtrami (używane też przez flask explain-queries)
+
+    Returns:
+        (zapytanie, parametry)
+
+    Raises:
+        pagination.NieprawidlowyKursor: gdy kursor jest uszkodzony
+    """
+    # Budowanie zapytania z warunkami
+    where_clauses = ["l.id_uzytkownika = :id_uzytkownika"]
+    params = {
+        "id_uzytkownika": id_uzytkownika,
+        "size": size,
+    }
+    if cursor is not None:
+        stronicowanie = "LIMIT :size"
+        if cursor:
+            po_czasie, po_id = pagination.odkoduj(cursor, 'logi', datetime.fromisoformat, int)
+            # Warunek l.timestamp <= ... pozwala użyć zakresu na indeksie (id_uzytkownika, timestamp)
+            where_clauses.append("l.timestamp <= :po_czasie AND (l.timestamp < :po_czasie OR l.id < :po_id)")
+            params["po_czasie"] = po_czasie
+            params["po_id"] = po_id
+    else:
+        stronicowanie = "LIMIT :size OFFSET :offset"
+        params["offset"] = page * size
+    
+    # Filtr po details: słowa (prefiksy) z indeksu FULLTEXT; krótkie frazy - dawne LIKE
+    if details_search:
+        slowa = _slowa_fulltext(details_search)
+        if slowa:
+            where_clauses.append("MATCH(l.details) AGAINST (:details_search IN BOOLEAN MODE)")
+            params["details_search"] = slowa
+        else:
+            where_clauses.append("l.details LIKE :details_search")
+            params["details_search"] = f"%{details_search}%"
+    
+    # Filtr po dacie początkowej
+    if date_from:
+        where_clauses.append("l.timestamp >= :date_from")
+        params["date_from"] = date_from
+    
+    # Filtr po dacie końcowej
+    if date_to:
+        where_clauses.append("l.timestamp <= :date_to")
+        params["date_to"] = date_to
+    
+    # Filtr po statusie użytkownika
+    if user_status:
+        where_clauses.append("l.user_status_at_log = :user_status")
+        params["user_status"] = user_status
+    
+    # Filtr po akcji
+    if action:
+        where_clauses.append("l.action = :action")
+        params["action"] = action
+    
+    query = f"""
+        SELECT 
+            l.id,
+            l.id_uzytkownika,
+            l.timestamp,
+            l.action,
+            l.user_status_at_log,
+            l.details
+        FROM 
+            logi l
+        WHERE 
+            {' AND '.join(where_clauses)}
+        ORDER BY 
+            l.timestamp DESC, l.id DESC
+        {stronicowanie}
+    """
+    return query, params
+
+
+# Raport wydatków w kategoriach za okres (agregat dzień x kategoria); filtr kategorii wstawiany między części
+RAPORT_Z_FILTREM_SQL = """
+    SELECT k.nazwa AS kategoria, SUM(w.suma) AS suma_cen
+    FROM wydatki_dzien_kategoria w
+    JOIN kategorie k ON w.id_kategorii = k.id_kategorii
+    WHERE w.id_uzytkownika = :id_uzytkownika
+    AND w.dzien BETWEEN :start_date AND :end_date
+"""
+RAPORT_Z_FILTREM_GRUPOWANIE = """
+    GROUP BY k.nazwa
+    ORDER BY suma_cen DESC
+"""
 
-def get_user_status(user_id):
-    """Fetch latest user status for logging."""
-    try:
-        record = DatabaseHelper.fetch_one(
-            "SELECT status FROM uzytkownicy WHERE id_uzytkownika = :user_id",
-            {"user_id": user_id},
-        )
-        return record.get("status", "unknown") if record else "unknown"
-    except Exception as e:
-        print(f"Error getting user status: {e}")
-        return "unknown"
 
 class Api:
     @staticmethod
-    def paragony(id_uzytkownika, page, size):
-        offset = page * size
-        print(offset)
-        query = """SELECT 
+    def paragony(id_uzytkownika, page, size, cursor=None):
+        """
+        Lista paragonów od najnowszego
+        
+        Args:
+            cursor: Kursor z poprzedniej strony ('' = pierwsza strona) - stronicowanie
+                    po id_paragonu i odpowiedź {"items", "next_cursor"}; None - dawne
+                    page/size z OFFSET (tablica, kursor tylko w nagłówku X-Next-Cursor)
+        
+        Raises:
+            pagination.NieprawidlowyKursor: gdy kursor jest uszkodzony
+        """
+        params = {"id_uzytkownika": id_uzytkownika, "size": size}
+        if cursor is not None:
+            warunek = ""
+            stronicowanie = "LIMIT :size"
+            if cursor:
+                params["po_id_paragonu"] = pagination.odkoduj(cursor, 'paragony', int)[0]
+                warunek = "AND p.id_paragonu < :po_id_paragonu"
+        else:
+            warunek = ""
+            stronicowanie = "LIMIT :size OFFSET :offset"
+            params["offset"] = page * size
+        query = f"""SELECT 
                 p.id_paragonu, 
                 f.nazwa AS nazwa_firmy, 
                 m.nazwa AS nazwa_miasta, 
@@ -70,14 +166,11 @@ class Api:
                     miasta m ON p.id_miasta = m.id_miasta
                 WHERE 
                     p.id_uzytkownika = :id_uzytkownika
+                    {warunek}
                 ORDER BY    
                     p.id_paragonu DESC
-                LIMIT :size OFFSET :offset"""
-        paragony = DatabaseHelper.fetch_all(query, {
-            "id_uzytkownika": id_uzytkownika, 
-            "size": size, 
-            "offset": offset
-        })
+                {stronicowanie}"""
+        paragony = DatabaseHelper.fetch_all(query, params)
         
         # Log działania
         user_status = get_user_status(id_uzytkownika)
@@ -85,13 +178,21 @@ class Api:
             id_uzytkownika,
             "fetch_receipts_list",
             user_status,
-            json.dumps({"page": page, "size": size, "count": len(paragony) if paragony else 0}, ensure_ascii=False)
+            json.dumps({"page": page, "size": size, "cursor": cursor is not None, "count": len(paragony) if paragony else 0}, ensure_ascii=False)
         )
         
-        return json.dumps(paragony, ensure_ascii=False)
+        kursor = pagination.nastepny(paragony, size, 'paragony', lambda wiersz: [wiersz['id_paragonu']])
+        return pagination.odpowiedz(paragony, kursor, koperta=cursor is not None)
     
     @staticmethod
-    def paragon(id_uzytkownika, id_paragonu):
+    def paragon(id_uzytkownika, id_paragonu, include_image=False):
+        """
+        Szczegóły paragonu
+        
+        Args:
+            include_image: Dołącz obraz jako base64 w polu 'obraz' (dawny format).
+                           Domyślnie zwracany jest tylko 'obraz_url' do /paragon/<id>/obraz.
+        """
         paragon = DatabaseHelper.fetch_all("""SELECT 
         p.id_paragonu, 
         f.nazwa AS nazwa_firmy, 
@@ -102,7 +203,8 @@ class Api:
         p.rabat, 
         p.opis, 
         p.data_dodania,
-        p.obraz
+        p.obraz_hash,
+        """ + ("p.obraz" if include_image else "p.obraz IS NOT NULL AS ma_obraz") + """
         FROM 
             paragony p
         JOIN 
@@ -116,11 +218,25 @@ class Api:
                 "id_uzytkownika": id_uzytkownika, 
                 "id_paragonu": id_paragonu
             })
+        if paragon and len(paragon) > 0:
+            ma_obraz = paragon[0].pop('ma_obraz', None)
+            ma_obraz = bool(paragon[0].get('obraz_hash') or ma_obraz or paragon[0].get('obraz'))
+            paragon[0]['obraz_url'] = f"/paragon/{paragon[0]['id_paragonu']}/obraz" if ma_obraz else None
+        
         # Convert obraz (image bytes) to base64 string for JSON serialization
-        if paragon and len(paragon) > 0 and paragon[0].get('obraz'):
-            obraz_data = paragon[0]['obraz']
+        if include_image and paragon and len(paragon) > 0:
+            obraz_data = paragon[0].get('obraz')
+            if paragon[0].get('obraz_hash'):
+                # Nowe paragony: obraz w magazynie plików, w wierszu tylko skrót
+                try:
+                    obraz_data = get_blob_store().get(paragon[0]['obraz_hash'])
+                except Exception as e:
+                    print(f"Brak obrazu {paragon[0]['obraz_hash']} w magazynie: {e}")
+                    obraz_data = None
             if isinstance(obraz_data, bytes):
                 paragon[0]['obraz'] = base64.b64encode(obraz_data).decode('utf-8')
+            else:
+                paragon[0]['obraz'] = None
         
         # Log działania
         user_status = get_user_status(id_uzytkownika)
@@ -134,6 +250,50 @@ class Api:
         print(json.dumps(paragon, ensure_ascii=False))
         return json.dumps(paragon, ensure_ascii=False)
     
+    @staticmethod
+    def obrazParagonu(id_uzytkownika, id_paragonu, wariant=None, accept=None):
+        """
+        Zwraca obraz paragonu użytkownika do wysłania strumieniem
+        
+        Args:
+            wariant: 'thumb' | 'medium' | 'original' (None - obraz główny 800px)
+            accept: Nagłówek Accept klienta (wybór JPEG / WebP / AVIF)
+        
+        Returns:
+            (etag, źródło, mimetype) gdzie źródło to ścieżka pliku albo obiekt plikowy,
+            lub None gdy paragon nie istnieje / nie ma obrazu
+        """
+        wiersz = DatabaseHelper.fetch_one(
+            """SELECT obraz_hash, obraz IS NOT NULL AS ma_obraz
+               FROM paragony
+               WHERE id_paragonu = :id_paragonu AND id_uzytkownika = :id_uzytkownika""",
+            {"id_paragonu": id_paragonu, "id_uzytkownika": id_uzytkownika}
+        )
+        if not wiersz:
+            return None
+        store = get_blob_store()
+        if wariant:
+            from services import renditions
+            znaleziony = renditions.znajdz_wariant(id_paragonu, wariant, accept)
+            if znaleziony and store.exists(znaleziony[0]):
+                digest, mimetype = znaleziony
+                sciezka = store.path(digest)
+                return digest, (sciezka if sciezka else store.open(digest)), mimetype
+            # Wariantów jeszcze nie ma (stary paragon / trwa generowanie) - obraz główny
+        if wiersz.get('obraz_hash'):
+            if not store.exists(wiersz['obraz_hash']):
+                return None
+            sciezka = store.path(wiersz['obraz_hash'])
+            return wiersz['obraz_hash'], (sciezka if sciezka else store.open(wiersz['obraz_hash'])), 'image/jpeg'
+        if wiersz.get('ma_obraz'):
+            # Paragon sprzed migracji - obraz wciąż w kolumnie LONGBLOB
+            stary = DatabaseHelper.fetch_one(
+                "SELECT obraz FROM paragony WHERE id_paragonu = :id_paragonu",
+                {"id_paragonu": id_paragonu}
+            )
+            return content_hash(stary['obraz']), io.BytesIO(stary['obraz']), 'image/jpeg'
+        return None
+    
     @staticmethod
     def produkty(id_uzytkownika, id_paragonu):
         produkty = DatabaseHelper.fetch_all("""SELECT 
@@ -182,22 +342,14 @@ class Api:
             id_uzytkownika = paragon_owner['id_uzytkownika'] if paragon_owner else None
             
             # pobierz z bazy danych id_firmy dla nazwy firmy
-            firma = DatabaseHelper.fetch_one(
-                "SELECT id_firmy FROM firmy WHERE nazwa = :nazwa",
-                {'nazwa': updated_data['nazwa_Firmy']}
-            )
-            if not firma:
+            id_firmy = reference_cache.firmy.id_for(updated_data['nazwa_Firmy'], case_insensitive=True)
+            if id_firmy is None:
                 return jsonify({'status': 'error', 'message': 'Company not found.'})
-            id_firmy = firma['id_firmy']
             
             # pobierz z bazy danych id_miasta dla nazwy miasta
-            miasto = DatabaseHelper.fetch_one(
-                "SELECT id_miasta FROM miasta WHERE nazwa = :nazwa",
-                {'nazwa': updated_data['nazwa_Miasta']}
-            )
-            if not miasto:
+            id_miasta = reference_cache.miasta.id_for(updated_data['nazwa_Miasta'], case_insensitive=True)
+            if id_miasta is None:
                 return jsonify({'status': 'error', 'message': 'City not found.'})
-            id_miasta = miasto['id_miasta']
             
             # pobierz wszystkie ceny produktów z paragonu i zaktualizuj sumęZOperacji
             ceny = DatabaseHelper.fetch_all(
@@ -208,28 +360,29 @@ class Api:
             
             print(id_firmy)
             print(id_miasta)
-            DatabaseHelper.execute("""
-                UPDATE paragony 
-                SET 
-                    id_firmy = :id_firmy,
-                    id_miasta = :id_miasta,
-                    ulica = :ulica, 
-                    suma = :suma,
-                    sumaZOperacji = :sumaZOperacji, 
-                    rabat = :rabat, 
-                    opis = :opis 
-                WHERE 
-                    id_paragonu = :id_paragonu
-            """, {
-                'id_firmy': id_firmy,
-                'id_miasta': id_miasta,
-                'ulica': updated_data['ulica'],
-                'suma': updated_data['suma'],
-                'sumaZOperacji': suma,
-                'rabat': updated_data['rabat'],
-                'opis': updated_data['opis'],
-                'id_paragonu': id_paragonu
-            })
+            with rollups.sledz_paragon(id_paragonu):
+                DatabaseHelper.execute("""
+                    UPDATE paragony 
+                    SET 
+                        id_firmy = :id_firmy,
+                        id_miasta = :id_miasta,
+                        ulica = :ulica, 
+                        suma = :suma,
+                        sumaZOperacji = :sumaZOperacji, 
+                        rabat = :rabat, 
+                        opis = :opis 
+                    WHERE 
+                        id_paragonu = :id_paragonu
+                """, {
+                    'id_firmy': id_firmy,
+                    'id_miasta': id_miasta,
+                    'ulica': updated_data['ulica'],
+                    'suma': updated_data['suma'],
+                    'sumaZOperacji': suma,
+                    'rabat': updated_data['rabat'],
+                    'opis': updated_data['opis'],
+                    'id_paragonu': id_paragonu
+                })
             
             # Log działania
             if id_uzytkownika:
@@ -279,50 +432,53 @@ class Api:
             return jsonify({'status': 'error', 'message': str(e)})
 
     @staticmethod
-    def update_produkt(id_produktu, updated_data):
+    def update_produkt(id_produktu, updated_data, id_zalogowanego):
         print(updated_data)
         try:
-            # Pobierz id_uzytkownika dla logowania
+            # Właściciel produktu: edytować może tylko on (także do logowania)
             produkt_owner = DatabaseHelper.fetch_one(
-                """SELECT p.id_uzytkownika 
+                """SELECT p.id_uzytkownika, pr.id_kategorii, pr.id_paragonu 
                    FROM produkty pr 
                    JOIN paragony p ON pr.id_paragonu = p.id_paragonu 
                    WHERE pr.id_produktu = :id_produktu""",
                 {'id_produktu': id_produktu}
             )
-            id_uzytkownika = produkt_owner['id_uzytkownika'] if produkt_owner else None
+            if not produkt_owner or produkt_owner['id_uzytkownika'] != id_zalogowanego:
+                return jsonify({'status': 'error', 'message': 'Product not found.'}), 404
+            id_uzytkownika = produkt_owner['id_uzytkownika']
             
             # pobierz z bazy danych id_kategorii dla nazwy kategorii
-            kategoria = DatabaseHelper.fetch_one(
-                "SELECT id_kategorii FROM kategorie WHERE nazwa = :nazwa",
-                {'nazwa': updated_data['nazwa_Kategorii']}
-            )
-            if not kategoria:
+            id_kategorii = reference_cache.kategorie.id_for(updated_data['nazwa_Kategorii'], case_insensitive=True)
+            if id_kategorii is None:
                 return jsonify({'status': 'error', 'message': 'Category not found.'})
-            id_kategorii = kategoria['id_kategorii']
             print(id_kategorii)
             
-            DatabaseHelper.execute("""
-                UPDATE produkty 
-                SET 
-                    nazwa = :nazwa, 
-                    cena = :cena, 
-                    ilosc = :ilosc, 
-                    jednostka = :jednostka,
-                    typ_podatku = :typ_podatku,
-                    id_kategorii = :id_kategorii
-                WHERE 
-                    id_produktu = :id_produktu
-            """, {
-                'nazwa': updated_data['nazwa_Produktu'],
-                'cena': updated_data['cena'],
-                'ilosc': updated_data['ilosc'],
-                'jednostka': updated_data['jednostka'],
-                'typ_podatku': updated_data['typ_Podatku'],
-                'id_kategorii': id_kategorii,
-                'id_produktu': id_produktu
-            })
-            Api.update_sumaZOperacji(id_produktu)
+            with rollups.sledz_paragon(produkt_owner['id_paragonu']):
+                DatabaseHelper.execute("""
+                    UPDATE produkty 
+                    SET 
+                        nazwa = :nazwa, 
+                        cena = :cena, 
+                        ilosc = :ilosc, 
+                        jednostka = :jednostka,
+                        typ_podatku = :typ_podatku,
+                        id_kategorii = :id_kategorii
+                    WHERE 
+                        id_produktu = :id_produktu
+                """, {
+                    'nazwa': updated_data['nazwa_Produktu'],
+                    'cena': updated_data['cena'],
+                    'ilosc': updated_data['ilosc'],
+                    'jednostka': updated_data['jednostka'],
+                    'typ_podatku': updated_data['typ_Podatku'],
+                    'id_kategorii': id_kategorii,
+                    'id_produktu': id_produktu
+                })
+                Api.update_sumaZOperacji(id_produktu)
+            
+            # Ręczna zmiana kategorii uczy pamięć klasyfikacji (poprawka tego użytkownika)
+            if produkt_owner.get('id_kategorii') != id_kategorii:
+                category_memo.memo.record_manual(updated_data['nazwa_Produktu'], id_kategorii, id_uzytkownika)
             
             # Log działania
             if id_uzytkownika:
@@ -350,8 +506,9 @@ class Api:
             )
             id_uzytkownika = paragon_owner['id_uzytkownika'] if paragon_owner else None
             
-            DatabaseHelper.execute("DELETE FROM produkty WHERE id_paragonu = :id_paragonu", {'id_paragonu': id_paragonu})
-            DatabaseHelper.execute("DELETE FROM paragony WHERE id_paragonu = :id_paragonu", {'id_paragonu': id_paragonu})
+            with rollups.sledz_paragon(id_paragonu):
+                DatabaseHelper.execute("DELETE FROM produkty WHERE id_paragonu = :id_paragonu", {'id_paragonu': id_paragonu})
+                DatabaseHelper.execute("DELETE FROM paragony WHERE id_paragonu = :id_paragonu", {'id_paragonu': id_paragonu})
             
             # Log działania
             if id_uzytkownika:
@@ -373,7 +530,7 @@ class Api:
         try:
             # Pobierz id_uzytkownika przed usunięciem
             produkt_owner = DatabaseHelper.fetch_one(
-                """SELECT p.id_uzytkownika, pr.nazwa 
+                """SELECT p.id_uzytkownika, pr.nazwa, pr.id_paragonu 
                    FROM produkty pr 
                    JOIN paragony p ON pr.id_paragonu = p.id_paragonu 
                    WHERE pr.id_produktu = :id_produktu""",
@@ -382,7 +539,8 @@ class Api:
             id_uzytkownika = produkt_owner['id_uzytkownika'] if produkt_owner else None
             nazwa_produktu = produkt_owner['nazwa'] if produkt_owner else None
             
-            DatabaseHelper.execute("DELETE FROM produkty WHERE id_produktu = :id_produktu", {'id_produktu': id_produktu})
+            with rollups.sledz_paragon(produkt_owner['id_paragonu'] if produkt_owner else None):
+                DatabaseHelper.execute("DELETE FROM produkty WHERE id_produktu = :id_produktu", {'id_produktu': id_produktu})
             
             # Log działania
             if id_uzytkownika:
@@ -402,7 +560,7 @@ class Api:
     @staticmethod
     def pobierzKategorie():
         try:
-            kategorie = DatabaseHelper.fetch_all("SELECT * FROM kategorie", {})
+            kategorie = reference_cache.kategorie.rows()
             return json.dumps(kategorie, ensure_ascii=False)
         except Exception as e:
             print(e)
@@ -411,7 +569,7 @@ class Api:
     @staticmethod
     def pobierzMiasta():
         try:
-            miasta = DatabaseHelper.fetch_all("SELECT * FROM miasta", {})
+            miasta = reference_cache.miasta.rows()
             return json.dumps(miasta, ensure_ascii=False)
         except Exception as e:
             print(e)
@@ -420,7 +578,7 @@ class Api:
     @staticmethod
     def pobierzFirmy():
         try:
-            firmy = DatabaseHelper.fetch_all("SELECT * FROM firmy", {})
+            firmy = reference_cache.firmy.rows()
             return json.dumps(firmy, ensure_ascii=False)
         except Exception as e:
             print(e)
@@ -482,6 +640,8 @@ GROUP BY
         
     @staticmethod
     def produktyUser1(id_uzytkownika):
+        # Wydatki bieżącego miesiąca z agregatu dzień x kategoria (zakres półotwarty wg zegara bazy)
+        rollups.napraw(id_uzytkownika)
         modified_limity = DatabaseHelper.fetch_all("""SELECT
     l.id,
     l.id_uzytkownika,
@@ -495,19 +655,17 @@ JOIN
     kategorie k ON l.id_kategorii = k.id_kategorii
 LEFT JOIN (
     SELECT
-        pr.id_uzytkownika,
-        p.id_kategorii,
-        SUM(p.cena) AS Wydano
+        w.id_uzytkownika,
+        w.id_kategorii,
+        SUM(w.suma) AS Wydano
     FROM
-        produkty p
-    JOIN
-        paragony pr ON p.id_paragonu = pr.id_paragonu
+        wydatki_dzien_kategoria w
     WHERE
-        pr.id_uzytkownika = :id_uzytkownika
-        AND MONTH(pr.data_dodania) = MONTH(CURDATE())
-        AND YEAR(pr.data_dodania) = YEAR(CURDATE())
+        w.id_uzytkownika = :id_uzytkownika
+        AND w.dzien >= """ + rollups.POCZATEK_MIESIACA_SQL + """
+        AND w.dzien < """ + rollups.KONIEC_MIESIACA_SQL + """
     GROUP BY
-        pr.id_uzytkownika, p.id_kategorii
+        w.id_uzytkownika, w.id_kategorii
 ) s ON l.id_uzytkownika = s.id_uzytkownika AND l.id_kategorii = s.id_kategorii
 WHERE
     l.id_uzytkownika = :id_uzytkownika""", {'id_uzytkownika': id_uzytkownika})
@@ -572,14 +730,10 @@ WHERE
     def update_limit(limit, nazwaKategorii, id_uzytkownika):
         try:
             # pobierz z bazy danych id_kategorii dla nazwy kategorii
-            kategoria = DatabaseHelper.fetch_one(
-                "SELECT * from kategorie WHERE nazwa = :nazwa",
-                {'nazwa': nazwaKategorii}
-            )
-            if not kategoria:
+            id_kategorii = reference_cache.kategorie.id_for(nazwaKategorii, case_insensitive=True)
+            if id_kategorii is None:
                 return jsonify({'status': 'error', 'message': 'Category not found.'})
             
-            id_kategorii = kategoria['id_kategorii']
             DatabaseHelper.execute(
                 "UPDATE limity SET limity = :limit WHERE id_uzytkownika = :id_uzytkownika AND id_kategorii = :id_kategorii",
                 {'limit': limit, 'id_uzytkownika': id_uzytkownika, 'id_kategorii': id_kategorii}
@@ -702,26 +856,26 @@ WHERE
     @staticmethod
     def raport(id_uzytkownika, start_date_str, end_date_str):
         try:
+            rollups.napraw(id_uzytkownika)
             query = """
-                SELECT k.nazwa AS kategoria, DATE(par.data_dodania) AS data, SUM(p.cena) AS suma_cen
-                FROM produkty p
-                JOIN kategorie k ON p.id_kategorii = k.id_kategorii
-                JOIN paragony par ON p.id_paragonu = par.id_paragonu
-                WHERE par.id_uzytkownika = :id_uzytkownika
+                SELECT k.nazwa AS kategoria, w.dzien AS data, SUM(w.suma) AS suma_cen
+                FROM wydatki_dzien_kategoria w
+                JOIN kategorie k ON w.id_kategorii = k.id_kategorii
+                WHERE w.id_uzytkownika = :id_uzytkownika
             """
             params = {'id_uzytkownika': id_uzytkownika}
             
             if start_date_str:
                 start_date = datetime.strptime(start_date_str, '%Y-%m-%d').date()
-                query += " AND DATE(par.data_dodania) >= :start_date"
+                query += " AND w.dzien >= :start_date"
                 params['start_date'] = start_date
             if end_date_str:
                 end_date = datetime.strptime(end_date_str, '%Y-%m-%d').date()
-                query += " AND DATE(par.data_dodania) <= :end_date"
+                query += " AND w.dzien <= :end_date"
                 params['end_date'] = end_date
 
             query += """
-                GROUP BY k.nazwa, DATE(par.data_dodania)
+                GROUP BY k.nazwa, w.dzien
                 ORDER BY data ASC, suma_cen DESC;
             """
             raport = DatabaseHelper.fetch_all(query, params)
@@ -747,30 +901,21 @@ WHERE
     @staticmethod
     def raport_z_filtrem(id_uzytkownika, start_date_str, end_date_str, category_ids_str):
         try:
+            rollups.napraw(id_uzytkownika)
             start_date = datetime.strptime(start_date_str, '%Y-%m-%d').date()
             end_date = datetime.strptime(end_date_str, '%Y-%m-%d').date()
             category_ids = [int(x) for x in category_ids_str.split(',')] if category_ids_str else []
 
-            query = """
-                SELECT k.nazwa AS kategoria, SUM(p.cena) AS suma_cen
-                FROM produkty p
-                JOIN kategorie k ON p.id_kategorii = k.id_kategorii
-                JOIN paragony par ON p.id_paragonu = par.id_paragonu
-                WHERE par.id_uzytkownika = :id_uzytkownika
-                AND DATE(par.data_dodania) BETWEEN :start_date AND :end_date
-            """
+            query = RAPORT_Z_FILTREM_SQL
             params = {'id_uzytkownika': id_uzytkownika, 'start_date': start_date, 'end_date': end_date}
             
             if category_ids:
                 placeholders = ','.join([f':cat{i}' for i in range(len(category_ids))])
-                query += f" AND k.id_kategorii IN ({placeholders})"
+                query += f" AND w.id_kategorii IN ({placeholders})"
                 for i, cat_id in enumerate(category_ids):
                     params[f'cat{i}'] = cat_id
 
-            query += """
-                GROUP BY k.nazwa
-                ORDER BY suma_cen DESC;
-            """
+            query += RAPORT_Z_FILTREM_GRUPOWANIE
             raport = DatabaseHelper.fetch_all(query, params)
             return json.dumps(raport, ensure_ascii=False)
         except Exception as e:
@@ -799,14 +944,13 @@ WHERE
     @staticmethod
     def pobierzRaportWydatkowKategorieMiesiace(id_uzytkownika, id_kategorii, months=None):
         try:
+            rollups.napraw(id_uzytkownika)
             query = """
                 SELECT
-                    DATE_FORMAT(par.data_dodania, '%%Y-%%m') AS miesiac,
-                    SUM(p.cena) AS suma_cen
-                FROM produkty p
-                JOIN kategorie k ON p.id_kategorii = k.id_kategorii
-                JOIN paragony par ON p.id_paragonu = par.id_paragonu
-                WHERE par.id_uzytkownika = :id_uzytkownika AND p.id_kategorii = :id_kategorii
+                    DATE_FORMAT(w.dzien, '%Y-%m') AS miesiac,
+                    SUM(w.suma) AS suma_cen
+                FROM wydatki_dzien_kategoria w
+                WHERE w.id_uzytkownika = :id_uzytkownika AND w.id_kategorii = :id_kategorii
             """
             params = {'id_uzytkownika': id_uzytkownika, 'id_kategorii': id_kategorii}
 
@@ -814,12 +958,12 @@ WHERE
                 today = datetime.now()
                 first = today.replace(day=1)
                 cutoff_date = first - timedelta(days=months * 30)
-                query += " AND par.data_dodania >= :cutoff_date"
-                params['cutoff_date'] = cutoff_date
+                query += " AND w.dzien >= :cutoff_date"
+                params['cutoff_date'] = cutoff_date.date()
 
             query += """
-                GROUP BY DATE_FORMAT(par.data_dodania, '%%Y-%%m')
-                ORDER BY DATE_FORMAT(par.data_dodania, '%%Y-%%m')
+                GROUP BY DATE_FORMAT(w.dzien, '%Y-%m')
+                ORDER BY DATE_FORMAT(w.dzien, '%Y-%m')
             """
             print("Query: ", query)
             print("Params: ", params)
@@ -1066,7 +1210,7 @@ WHERE
     
     @staticmethod
     def pobierz_logi(id_uzytkownika, page=0, size=50, details_search=None, 
-                     date_from=None, date_to=None, user_status=None, action=None):
+                     date_from=None, date_to=None, user_status=None, action=None, cursor=None):
         """
         Pobiera logi użytkownika z paginacją i filtrowaniem
         
@@ -1078,59 +1222,12 @@ WHERE
         :param date_to: Data końcowa filtrowania (format: YYYY-MM-DD lub YYYY-MM-DD HH:MM:SS)
         :param user_status: Status użytkownika do filtrowania (opcjonalny)
         :param action: Akcja do filtrowania (opcjonalny)
-        :return: Lista logów w formacie JSON
-        """
-        offset = page * size
-        
-        # Budowanie zapytania z warunkami
-        where_clauses = ["l.id_uzytkownika = :id_uzytkownika"]
-        params = {
-            "id_uzytkownika": id_uzytkownika,
-            "size": size,
-            "offset": offset
-        }
-        
-        # Filtr po details (wyszukiwanie częściowe)
-        if details_search:
-            where_clauses.append("l.details LIKE :details_search")
-            params["details_search"] = f"%{details_search}%"
-        
-        # Filtr po dacie początkowej
-        if date_from:
-            where_clauses.append("l.timestamp >= :date_from")
-            params["date_from"] = date_from
-        
-        # Filtr po dacie końcowej
-        if date_to:
-            where_clauses.append("l.timestamp <= :date_to")
-            params["date_to"] = date_to
-        
-        # Filtr po statusie użytkownika
-        if user_status:
-            where_clauses.append("l.user_status_at_log = :user_status")
-            params["user_status"] = user_status
-        
-        # Filtr po akcji
-        if action:
-            where_clauses.append("l.action = :action")
-            params["action"] = action
-        
-        query = f"""
-            SELECT 
-                l.id,
-                l.id_uzytkownika,
-                l.timestamp,
-                l.action,
-                l.user_status_at_log,
-                l.details
-            FROM 
-                logi l
-            WHERE 
-                {' AND '.join(where_clauses)}
-            ORDER BY 
-                l.timestamp DESC
-            LIMIT :size OFFSET :offset
+        :param cursor: Kursor z poprzedniej strony ('' = pierwsza) - stronicowanie po (timestamp, id)
+                       i odpowiedź {"items", "next_cursor"}; None - dawne page/size z OFFSET
+        :return: (JSON, nagłówki) - kursor następnej strony także w X-Next-Cursor
         """
+        query, params = zapytanie_logow(id_uzytkownika, page, size, details_search,
+                                        date_from, date_to, user_status, action, cursor)
         
         logi = DatabaseHelper.fetch_all(query, params)
         
@@ -1142,4 +1239,5 @@ WHERE
                     log['timestamp'] = log['timestamp'].isoformat()
                 # Jeśli już jest stringiem, zostaw bez zmian
         
-        return json.dumps(logi, ensure_ascii=False)
+        kursor = pagination.nastepny(logi, size, 'logi', lambda wiersz: [wiersz['timestamp'], wiersz['id']])
+        return pagination.odpowiedz(logi, kursor, koperta=cursor is not None)
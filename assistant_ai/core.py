@@ -3,7 +3,6 @@
 Główna logika Wirtualnego Asystenta AI
 """
 
-import google.generativeai as genai
 from datetime import datetime
 from typing import Dict, List, Any, Optional
 import json
@@ -22,6 +21,7 @@ from .tools.product_nutrition_tools import ProductNutritionTools
 from .prompts import get_system_prompt
 from .intent_analyzer import IntentAnalyzer
 from .rag_knowledge import get_rag_knowledge_base
+from services import llm_client
 
 
 class VirtualAssistant:
@@ -38,11 +38,12 @@ class VirtualAssistant:
         self.user_id = user_id
         self.api_key = api_key
         
-        # Konfiguracja Gemini
-        genai.configure(api_key=api_key)
-        self.model = genai.GenerativeModel(
+        # Model z puli klientów per klucz API (bez globalnego genai.configure)
+        self.model = llm_client.pool.get_model(
+            api_key,
             GEMINI_MODEL_NAME,
-            generation_config=GEMINI_GENERATION_CONFIG
+            generation_config=GEMINI_GENERATION_CONFIG,
+            safety_settings=None
         )
         
         # Inicjalizacja narzędzi
@@ -56,7 +57,7 @@ class VirtualAssistant:
         
         # Inicjalizacja analizatora intencji
         self.tools_definition = get_tools_definition()
-        self.intent_analyzer = IntentAnalyzer(self.model, self.tools_definition)
+        self.intent_analyzer = IntentAnalyzer(self.model, self.tools_definition, api_key)
         
         # Inicjalizacja bazy wiedzy RAG
         self.rag_kb = get_rag_knowledge_base()
@@ -72,9 +73,10 @@ class VirtualAssistant:
         # Wyślij prompt systemowy jako pierwszą wiadomość użytkownika
         # Model Gemini nie ma specjalnego "system message", więc symulujemy to
         try:
-            self.chat.send_message(
-                f"[INSTRUKCJA SYSTEMOWA - Przeczytaj i zapamiętaj na całą rozmowę]\n\n{system_prompt}\n\n[Odpowiedz krótko: 'Rozumiem, jestem gotowy do pomocy']"
-            )
+            with llm_client.pool.timed(self.api_key):
+                self.chat.send_message(
+                    f"[INSTRUKCJA SYSTEMOWA - Przeczytaj i zapamiętaj na całą rozmowę]\n\n{system_prompt}\n\n[Odpowiedz krótko: 'Rozumiem, jestem gotowy do pomocy']"
+                )
         except Exception as e:
             print(f"Błąd inicjalizacji kontekstu: {e}")
     
@@ -163,8 +165,9 @@ class VirtualAssistant:
             
             full_message = "\n".join(context_parts)
             
-            # Użyj self.chat.send_message - automatycznie zachowuje historię
-            response = self.chat.send_message(full_message)
+            # Użyj self.chat.send_message - automatycznie zachowuje historię (czas liczony w puli Gemini)
+            with llm_client.pool.timed(self.api_key):
+                response = self.chat.send_message(full_message)
             response_text = response.text.strip()
             
             # Usuń ewentualne znaczniki systemowe z odpowiedzi (failsafe)
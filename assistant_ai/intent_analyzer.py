@@ -4,25 +4,29 @@ Moduł analizy intencji użytkownika
 """
 
 from datetime import datetime, timedelta
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 import json
 import re
 import google.generativeai as genai
 
+from services import llm_client
+
 
 class IntentAnalyzer:
     """Klasa analizująca intencje użytkownika na podstawie wiadomości"""
     
-    def __init__(self, model: genai.GenerativeModel, tools_definition: list):
+    def __init__(self, model: genai.GenerativeModel, tools_definition: list, api_key: Optional[str] = None):
         """
         Inicjalizacja analizatora intencji
         
         Args:
             model: Model Gemini do analizy
             tools_definition: Definicja dostępnych narzędzi
+            api_key: Klucz modelu (limit zapytań do Gemini per klucz)
         """
         self.model = model
         self.tools_definition = tools_definition
+        self.api_key = api_key
     
     def analyze_intent(self, message: str) -> Dict[str, Any]:
         """
@@ -68,7 +72,8 @@ Odpowiedz w formacie JSON:
         
         try:
             # Wywołaj model do analizy
-            response = self.model.generate_content(analysis_prompt)
+            with llm_client.pool.timed(self.api_key):
+                response = self.model.generate_content(analysis_prompt)
             response_text = response.text.strip()
             
             # Wydobądź JSON z odpowiedzi
@@ -5,6 +5,33 @@ Funkcje narzędzi związanych z budżetem i limitami wydatków
 
 from typing import Dict, Optional
 from db import DatabaseHelper
+from services import rollups
+
+
+# Wydatki bieżącego miesiąca (wg zegara bazy) z agregatu dzień x kategoria (tylko paragony użytkownika)
+WYDATKI_BIEZACY_MIESIAC = f"""
+    LEFT JOIN (
+        SELECT id_kategorii, SUM(suma) AS wydano
+        FROM wydatki_dzien_kategoria
+        WHERE id_uzytkownika = :user_id
+        AND dzien >= {rollups.POCZATEK_MIESIACA_SQL} AND dzien < {rollups.KONIEC_MIESIACA_SQL}
+        GROUP BY id_kategorii
+    ) w ON w.id_kategorii = l.id_kategorii
+"""
+
+ZAPYTANIE_STATUS_LIMITOW = f"""
+    SELECT 
+        k.nazwa as kategoria,
+        l.limity as limit_kwota,
+        COALESCE(w.wydano, 0) as wydano,
+        l.limity - COALESCE(w.wydano, 0) as pozostalo,
+        ROUND((COALESCE(w.wydano, 0) / l.limity * 100), 2) as procent_wykorzystania
+    FROM limity l
+    JOIN kategorie k ON l.id_kategorii = k.id_kategorii
+    {WYDATKI_BIEZACY_MIESIAC}
+    WHERE l.id_uzytkownika = :user_id
+    ORDER BY procent_wykorzystania DESC
+    """
 
 
 class BudgetTools:
@@ -21,45 +48,24 @@ class BudgetTools:
     
     def get_budget_status(self, category: Optional[str] = None) -> Dict:
         """Pobiera status budżetu/limitów"""
+        rollups.napraw(self.user_id)
+        params = {'user_id': self.user_id}
         if category:
-            query = """
+            query = f"""
             SELECT 
                 k.nazwa as kategoria,
                 l.limity as limit_kwota,
-                COALESCE(SUM(pr.cena), 0) as wydano,
-                l.limity - COALESCE(SUM(pr.cena), 0) as pozostalo
+                COALESCE(w.wydano, 0) as wydano,
+                l.limity - COALESCE(w.wydano, 0) as pozostalo
             FROM limity l
             JOIN kategorie k ON l.id_kategorii = k.id_kategorii
-            LEFT JOIN produkty pr ON pr.id_kategorii = k.id_kategorii
-            LEFT JOIN paragony p ON pr.id_paragonu = p.id_paragonu 
-                AND p.id_uzytkownika = l.id_uzytkownika
-                AND MONTH(p.data_dodania) = MONTH(CURRENT_DATE())
-                AND YEAR(p.data_dodania) = YEAR(CURRENT_DATE())
+            {WYDATKI_BIEZACY_MIESIAC}
             WHERE l.id_uzytkownika = :user_id
             AND k.nazwa LIKE :category
-            GROUP BY k.nazwa, l.limity
             """
-            params = {'user_id': self.user_id, 'category': f"%{category}%"}
+            params['category'] = f"%{category}%"
         else:
-            query = """
-            SELECT 
-                k.nazwa as kategoria,
-                l.limity as limit_kwota,
-                COALESCE(SUM(pr.cena), 0) as wydano,
-                l.limity - COALESCE(SUM(pr.cena), 0) as pozostalo,
-                ROUND((COALESCE(SUM(pr.cena), 0) / l.limity * 100), 2) as procent_wykorzystania
-            FROM limity l
-            JOIN kategorie k ON l.id_kategorii = k.id_kategorii
-            LEFT JOIN produkty pr ON pr.id_kategorii = k.id_kategorii
-            LEFT JOIN paragony p ON pr.id_paragonu = p.id_paragonu 
-                AND p.id_uzytkownika = l.id_uzytkownika
-                AND MONTH(p.data_dodania) = MONTH(CURRENT_DATE())
-                AND YEAR(p.data_dodania) = YEAR(CURRENT_DATE())
-            WHERE l.id_uzytkownika = :user_id
-            GROUP BY k.nazwa, l.limity
-            ORDER BY procent_wykorzystania DESC
-            """
-            params = {'user_id': self.user_id}
+            query = ZAPYTANIE_STATUS_LIMITOW
         
         results = DatabaseHelper.fetch_all(query, params)
         
@@ -3,8 +3,59 @@
 Funkcje narzędzi związanych z wydatkami i zakupami
 """
 
+from datetime import date, timedelta
 from typing import Dict, Optional
 from db import DatabaseHelper
+from services import rollups
+
+
+# Zapytania na poziomie modułu - flask explain-queries sprawdza plany tych samych tekstów SQL.
+# Filtry dat to półotwarte zakresy na samej kolumnie (indeks paragony (id_uzytkownika, data_dodania))
+ZAPYTANIE_WYDATKI_OKRES = """
+    SELECT 
+        p.id_paragonu,
+        p.data_dodania,
+        p.suma,
+        f.nazwa as sklep,
+        m.nazwa as miasto
+    FROM paragony p
+    LEFT JOIN firmy f ON p.id_firmy = f.id_firmy
+    LEFT JOIN miasta m ON p.id_miasta = m.id_miasta
+    WHERE p.id_uzytkownika = :user_id
+    AND p.data_dodania >= CAST(:start_date AS DATE) AND p.data_dodania < CAST(:end_date AS DATE) + INTERVAL 1 DAY
+    ORDER BY p.data_dodania DESC
+    """
+
+ZAPYTANIE_WYDATKI_KATEGORII = """
+    SELECT 
+        pr.id_produktu,
+        pr.nazwa as nazwa_produktu,
+        pr.cena,
+        p.data_dodania,
+        f.nazwa as sklep
+    FROM produkty pr
+    JOIN paragony p ON pr.id_paragonu = p.id_paragonu
+    JOIN kategorie k ON pr.id_kategorii = k.id_kategorii
+    LEFT JOIN firmy f ON p.id_firmy = f.id_firmy
+    WHERE p.id_uzytkownika = :user_id
+    AND k.nazwa LIKE :category
+    AND p.data_dodania >= CAST(:start_date AS DATE) AND p.data_dodania < CAST(:end_date AS DATE) + INTERVAL 1 DAY
+    ORDER BY p.data_dodania DESC
+    """
+
+# Agregat miesiąc x sklep; liczymy pełne miesiące od miesiąca sprzed N miesięcy (wg zegara bazy)
+ZAPYTANIE_TRENDY_MIESIECZNE = f"""
+    SELECT 
+        DATE_FORMAT(w.miesiac, '%Y-%m') as miesiac,
+        SUM(w.liczba_paragonow) as liczba_paragonow,
+        SUM(w.suma) as suma_wydatkow,
+        SUM(w.suma) / NULLIF(SUM(w.liczba_paragonow), 0) as sredni_paragon
+    FROM wydatki_miesiac_sklep w
+    WHERE w.id_uzytkownika = :user_id
+    AND w.miesiac >= {rollups.POCZATEK_MIESIACA_SQL} - INTERVAL :months MONTH
+    GROUP BY w.miesiac
+    ORDER BY w.miesiac ASC
+    """
 
 
 class ExpenseTools:
@@ -31,22 +82,7 @@ class ExpenseTools:
                 'error': 'Wymagane są daty start_date i end_date'
             }
         
-        query = """
-        SELECT 
-            p.id_paragonu,
-            p.data_dodania,
-            p.suma,
-            f.nazwa as sklep,
-            m.nazwa as miasto
-        FROM paragony p
-        LEFT JOIN firmy f ON p.id_firmy = f.id_firmy
-        LEFT JOIN miasta m ON p.id_miasta = m.id_miasta
-        WHERE p.id_uzytkownika = :user_id
-        AND DATE(p.data_dodania) BETWEEN :start_date AND :end_date
-        ORDER BY p.data_dodania DESC
-        """
-        
-        results = DatabaseHelper.fetch_all(query, {
+        results = DatabaseHelper.fetch_all(ZAPYTANIE_WYDATKI_OKRES, {
             'user_id': self.user_id,
             'start_date': start_date,
             'end_date': end_date
@@ -74,24 +110,7 @@ class ExpenseTools:
                 'error': 'Wymagane są parametry: category, start_date, end_date'
             }
         
-        query = """
-        SELECT 
-            pr.id_produktu,
-            pr.nazwa as nazwa_produktu,
-            pr.cena,
-            p.data_dodania,
-            f.nazwa as sklep
-        FROM produkty pr
-        JOIN paragony p ON pr.id_paragonu = p.id_paragonu
-        JOIN kategorie k ON pr.id_kategorii = k.id_kategorii
-        LEFT JOIN firmy f ON p.id_firmy = f.id_firmy
-        WHERE p.id_uzytkownika = :user_id
-        AND k.nazwa LIKE :category
-        AND DATE(p.data_dodania) BETWEEN :start_date AND :end_date
-        ORDER BY p.data_dodania DESC
-        """
-        
-        results = DatabaseHelper.fetch_all(query, {
+        results = DatabaseHelper.fetch_all(ZAPYTANIE_WYDATKI_KATEGORII, {
             'user_id': self.user_id,
             'category': f"%{category}%",
             'start_date': start_date,
@@ -133,7 +152,7 @@ class ExpenseTools:
         LEFT JOIN produkty pr ON p.id_paragonu = pr.id_paragonu
         WHERE p.id_uzytkownika = :user_id
         AND f.nazwa LIKE :store_name
-        AND DATE(p.data_dodania) BETWEEN :start_date AND :end_date
+        AND p.data_dodania >= CAST(:start_date AS DATE) AND p.data_dodania < CAST(:end_date AS DATE) + INTERVAL 1 DAY
         GROUP BY p.id_paragonu, p.data_dodania, p.suma, f.nazwa
         ORDER BY p.data_dodania DESC
         """
@@ -178,7 +197,7 @@ class ExpenseTools:
             LEFT JOIN produkty pr ON p.id_paragonu = pr.id_paragonu
             LEFT JOIN kategorie k ON pr.id_kategorii = k.id_kategorii
             WHERE p.id_uzytkownika = :user_id
-            AND DATE(p.data_dodania) BETWEEN :start_date AND :end_date
+            AND p.data_dodania >= CAST(:start_date AS DATE) AND p.data_dodania < CAST(:end_date AS DATE) + INTERVAL 1 DAY
             GROUP BY k.nazwa
             ORDER BY suma_wydatkow DESC
             """
@@ -192,7 +211,7 @@ class ExpenseTools:
             FROM paragony p
             LEFT JOIN firmy f ON p.id_firmy = f.id_firmy
             WHERE p.id_uzytkownika = :user_id
-            AND DATE(p.data_dodania) BETWEEN :start_date AND :end_date
+            AND p.data_dodania >= CAST(:start_date AS DATE) AND p.data_dodania < CAST(:end_date AS DATE) + INTERVAL 1 DAY
             GROUP BY f.nazwa
             ORDER BY suma_wydatkow DESC
             """
@@ -206,7 +225,7 @@ class ExpenseTools:
                 MAX(p.suma) as max_wydatek
             FROM paragony p
             WHERE p.id_uzytkownika = :user_id
-            AND DATE(p.data_dodania) BETWEEN :start_date AND :end_date
+            AND p.data_dodania >= CAST(:start_date AS DATE) AND p.data_dodania < CAST(:end_date AS DATE) + INTERVAL 1 DAY
             """
         
         results = DatabaseHelper.fetch_all(query, {
@@ -247,7 +266,7 @@ class ExpenseTools:
         LEFT JOIN firmy f ON p.id_firmy = f.id_firmy
         LEFT JOIN miasta m ON p.id_miasta = m.id_miasta
         WHERE p.id_uzytkownika = :user_id
-        AND DATE(p.data_dodania) BETWEEN :start_date AND :end_date
+        AND p.data_dodania >= CAST(:start_date AS DATE) AND p.data_dodania < CAST(:end_date AS DATE) + INTERVAL 1 DAY
         ORDER BY p.suma DESC
         LIMIT :limit
         """
@@ -287,7 +306,7 @@ class ExpenseTools:
         FROM paragony p
         JOIN firmy f ON p.id_firmy = f.id_firmy
         WHERE p.id_uzytkownika = :user_id
-        AND DATE(p.data_dodania) BETWEEN :start_date AND :end_date
+        AND p.data_dodania >= CAST(:start_date AS DATE) AND p.data_dodania < CAST(:end_date AS DATE) + INTERVAL 1 DAY
         GROUP BY f.nazwa
         ORDER BY liczba_wizyt DESC
         """
@@ -432,7 +451,7 @@ class ExpenseTools:
         FROM paragony p
         JOIN firmy f ON p.id_firmy = f.id_firmy
         WHERE p.id_uzytkownika = :user_id
-        AND DATE(p.data_dodania) BETWEEN :start_date AND :end_date
+        AND p.data_dodania >= CAST(:start_date AS DATE) AND p.data_dodania < CAST(:end_date AS DATE) + INTERVAL 1 DAY
         GROUP BY f.nazwa
         ORDER BY suma_wydatkow DESC
         LIMIT :limit
@@ -474,7 +493,7 @@ class ExpenseTools:
         JOIN paragony p ON pr.id_paragonu = p.id_paragonu
         JOIN kategorie k ON pr.id_kategorii = k.id_kategorii
         WHERE p.id_uzytkownika = :user_id
-        AND DATE(p.data_dodania) BETWEEN :start_date AND :end_date
+        AND p.data_dodania >= CAST(:start_date AS DATE) AND p.data_dodania < CAST(:end_date AS DATE) + INTERVAL 1 DAY
         GROUP BY k.nazwa
         ORDER BY suma_wydatkow DESC
         """
@@ -504,22 +523,10 @@ class ExpenseTools:
         if months is None or months <= 0:
             months = 6
         
-        query = """
-        SELECT 
-            DATE_FORMAT(p.data_dodania, '%Y-%m') as miesiac,
-            COUNT(p.id_paragonu) as liczba_paragonow,
-            SUM(p.suma) as suma_wydatkow,
-            AVG(p.suma) as sredni_paragon
-        FROM paragony p
-        WHERE p.id_uzytkownika = :user_id
-        AND p.data_dodania >= DATE_SUB(CURDATE(), INTERVAL :months MONTH)
-        GROUP BY DATE_FORMAT(p.data_dodania, '%Y-%m')
-        ORDER BY miesiac ASC
-        """
-        
-        results = DatabaseHelper.fetch_all(query, {
+        rollups.napraw(self.user_id)
+        results = DatabaseHelper.fetch_all(ZAPYTANIE_TRENDY_MIESIECZNE, {
             'user_id': self.user_id,
-            'months': months
+            'months': int(months)
         })
         
         # Oblicz trend (wzrostowy/spadkowy)
@@ -561,7 +568,7 @@ class ExpenseTools:
             AVG(p.suma) as sredni_wydatek
         FROM paragony p
         WHERE p.id_uzytkownika = :user_id
-        AND DATE(p.data_dodania) BETWEEN :start_date AND :end_date
+        AND p.data_dodania >= CAST(:start_date AS DATE) AND p.data_dodania < CAST(:end_date AS DATE) + INTERVAL 1 DAY
         GROUP BY dzien_tygodnia, numer_dnia
         ORDER BY numer_dnia
         """
@@ -586,7 +593,7 @@ class ExpenseTools:
             AVG(p.suma) as sredni_wydatek
         FROM paragony p
         WHERE p.id_uzytkownika = :user_id
-        AND DATE(p.data_dodania) BETWEEN :start_date AND :end_date
+        AND p.data_dodania >= CAST(:start_date AS DATE) AND p.data_dodania < CAST(:end_date AS DATE) + INTERVAL 1 DAY
         GROUP BY pora_dnia
         ORDER BY 
             CASE pora_dnia
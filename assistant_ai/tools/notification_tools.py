@@ -5,6 +5,35 @@ Funkcje narzędzi związanych z powiadomieniami użytkownika
 
 from typing import Dict, Optional
 from db import DatabaseHelper
+from services import rollups
+
+
+# Na poziomie modułu - flask explain-queries sprawdza plan tego samego tekstu SQL;
+# bieżący miesiąc jako półotwarty zakres na data_dodania (wg zegara bazy), żeby działał indeks
+ZAPYTANIE_ALERTY_LIMITOW = f"""
+    SELECT 
+        k.nazwa as kategoria,
+        l.limity as limit_kwota,
+        COALESCE(SUM(pr.cena), 0) as wydano,
+        l.limity - COALESCE(SUM(pr.cena), 0) as pozostalo,
+        ROUND((COALESCE(SUM(pr.cena), 0) / l.limity * 100), 2) as procent_wykorzystania,
+        CASE 
+            WHEN COALESCE(SUM(pr.cena), 0) >= l.limity THEN 'exceeded'
+            WHEN COALESCE(SUM(pr.cena), 0) >= l.limity * 0.75 THEN 'warning'
+            ELSE 'ok'
+        END as status
+    FROM limity l
+    JOIN kategorie k ON l.id_kategorii = k.id_kategorii
+    LEFT JOIN produkty pr ON pr.id_kategorii = k.id_kategorii
+    LEFT JOIN paragony p ON pr.id_paragonu = p.id_paragonu 
+        AND p.id_uzytkownika = l.id_uzytkownika
+        AND p.data_dodania >= {rollups.POCZATEK_MIESIACA_SQL}
+        AND p.data_dodania < {rollups.KONIEC_MIESIACA_SQL}
+    WHERE l.id_uzytkownika = :user_id
+    GROUP BY k.nazwa, l.limity
+    HAVING status != 'ok'
+    ORDER BY procent_wykorzystania DESC
+    """
 
 
 class NotificationTools:
@@ -66,32 +95,7 @@ class NotificationTools:
         Returns:
             Dict z alertami budżetowymi
         """
-        query = """
-        SELECT 
-            k.nazwa as kategoria,
-            l.limity as limit_kwota,
-            COALESCE(SUM(pr.cena), 0) as wydano,
-            l.limity - COALESCE(SUM(pr.cena), 0) as pozostalo,
-            ROUND((COALESCE(SUM(pr.cena), 0) / l.limity * 100), 2) as procent_wykorzystania,
-            CASE 
-                WHEN COALESCE(SUM(pr.cena), 0) >= l.limity THEN 'exceeded'
-                WHEN COALESCE(SUM(pr.cena), 0) >= l.limity * 0.75 THEN 'warning'
-                ELSE 'ok'
-            END as status
-        FROM limity l
-        JOIN kategorie k ON l.id_kategorii = k.id_kategorii
-        LEFT JOIN produkty pr ON pr.id_kategorii = k.id_kategorii
-        LEFT JOIN paragony p ON pr.id_paragonu = p.id_paragonu 
-            AND p.id_uzytkownika = l.id_uzytkownika
-            AND MONTH(p.data_dodania) = MONTH(CURRENT_DATE())
-            AND YEAR(p.data_dodania) = YEAR(CURRENT_DATE())
-        WHERE l.id_uzytkownika = :user_id
-        GROUP BY k.nazwa, l.limity
-        HAVING status != 'ok'
-        ORDER BY procent_wykorzystania DESC
-        """
-        
-        alerts = DatabaseHelper.fetch_all(query, {'user_id': self.user_id})
+        alerts = DatabaseHelper.fetch_all(ZAPYTANIE_ALERTY_LIMITOW, {'user_id': self.user_id})
         
         # Kategoryzuj alerty
         exceeded = [a for a in alerts if a.get('status') == 'exceeded']
@@ -206,11 +206,11 @@ class ProductNutritionTools:
         params = {'user_id': self.user_id}
         
         if start_date:
-            where_clauses.append("DATE(p.data_dodania) >= :start_date")
+            where_clauses.append("p.data_dodania >= CAST(:start_date AS DATE)")
             params['start_date'] = start_date
         
         if end_date:
-            where_clauses.append("DATE(p.data_dodania) <= :end_date")
+            where_clauses.append("p.data_dodania < CAST(:end_date AS DATE) + INTERVAL 1 DAY")
             params['end_date'] = end_date
         
         where_clause = " AND ".join(where_clauses)
@@ -132,11 +132,11 @@ class ReceiptTools:
             params['max_amount'] = max_amount
         
         if start_date:
-            where_clauses.append("DATE(p.data_dodania) >= :start_date")
+            where_clauses.append("p.data_dodania >= CAST(:start_date AS DATE)")
             params['start_date'] = start_date
         
         if end_date:
-            where_clauses.append("DATE(p.data_dodania) <= :end_date")
+            where_clauses.append("p.data_dodania < CAST(:end_date AS DATE) + INTERVAL 1 DAY")
             params['end_date'] = end_date
         
         if city:
@@ -49,11 +49,11 @@ class UserLogsTools:
         params = {'user_id': self.user_id, 'limit': limit}
         
         if start_date:
-            where_clauses.append("DATE(l.timestamp) >= :start_date")
+            where_clauses.append("l.timestamp >= CAST(:start_date AS DATE)")
             params['start_date'] = start_date
         
         if end_date:
-            where_clauses.append("DATE(l.timestamp) <= :end_date")
+            where_clauses.append("l.timestamp < CAST(:end_date AS DATE) + INTERVAL 1 DAY")
             params['end_date'] = end_date
         
         if action_type:
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark przetwarzania obrazu paragonu: dawna ścieżka vs PreprocessedImage
+Obsługuje polskie znaki: ą, ć, ę, ł, ń, ó, ś, ź, ż
+
+Mierzy czas CPU (time.process_time) na jeden paragon od odebrania base64
+do uzyskania wejścia OCR i obrazu archiwalnego oraz zdekodowanego obrazu
+dla generatora wariantów. Samo generowanie wariantów jest w obu ścieżkach
+identyczne, więc nie jest mierzone.
+
+Uruchomienie (z katalogu głównego repozytorium):
+    python benchmarks/bench_image_pipeline.py
+    python benchmarks/bench_image_pipeline.py --image zdjecie_paragonu.jpg -n 20
+"""
+import argparse
+import base64
+import io
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image, ImageDraw, ImageOps  # noqa: E402
+
+from services.image_pipeline import PreprocessedImage, do_rgb  # noqa: E402
+
+
+def syntetyczny_paragon(szerokosc: int, wysokosc: int) -> bytes:
+    """Zdjęcie paragonu z telefonu: szum, wiersze "tekstu" i orientacja EXIF=6"""
+    random.seed(0)
+    img = Image.effect_noise((szerokosc, wysokosc), 24).convert('RGB')
+    draw = ImageDraw.Draw(img)
+    for y in range(40, wysokosc - 40, 36):
+        x = 60
+        while x < szerokosc - 120:
+            dlugosc = random.randint(20, 140)
+            draw.rectangle((x, y, x + dlugosc, y + 18), fill=(30, 30, 30))
+            x += dlugosc + random.randint(12, 40)
+    exif = Image.Exif()
+    exif[0x0112] = 6
+    buffer = io.BytesIO()
+    img.save(buffer, format='JPEG', quality=92, exif=exif)
+    return buffer.getvalue()
+
+
+def _zapis_jak_gemini(img: Image.Image) -> bytes:
+    """google-generativeai koduje przekazany obraz PIL (bez nazwy pliku) jako bezstratny WebP"""
+    buffer = io.BytesIO()
+    Image.init()
+    if 'WEBP' in Image.SAVE:
+        img.save(buffer, format='WEBP', lossless=True)
+    else:
+        img.save(buffer, format='JPEG')
+    return buffer.getvalue()
+
+
+def dawna_sciezka(dane_base64: str):
+    # routes/api.py: dekodowanie i ponowne kodowanie base64
+    dane = base64.b64encode(base64.b64decode(dane_base64))
+    # paragonik: dekodowanie, RGB, nieużywany zapis JPEG, obraz PIL do Gemini
+    imgB = base64.b64decode(dane)
+    img = do_rgb(Image.open(io.BytesIO(imgB)))
+    img.save(io.BytesIO(), format='JPEG')
+    _zapis_jak_gemini(img)
+    # dodajParagon: ponowne dekodowanie, EXIF, RGB, miniatura 800px, JPEG q50
+    with Image.open(io.BytesIO(imgB)) as zrodlo:
+        archiwum = do_rgb(ImageOps.exif_transpose(zrodlo))
+        archiwum.thumbnail((800, 800))
+        archiwum.save(io.BytesIO(), format='JPEG', quality=50)
+    # renditions: trzecie dekodowanie, EXIF i RGB
+    with Image.open(io.BytesIO(imgB)) as zrodlo:
+        do_rgb(ImageOps.exif_transpose(zrodlo)).load()
+
+
+def nowa_sciezka(dane_base64: str):
+    obraz = PreprocessedImage(base64.b64decode(dane_base64))
+    obraz.ocr_blob()
+    obraz.archiwum
+    obraz.image
+
+
+def zmierz(funkcja, dane_base64: str, iteracje: int) -> float:
+    funkcja(dane_base64)  # rozgrzewka
+    start = time.process_time()
+    for _ in range(iteracje):
+        funkcja(dane_base64)
+    return (time.process_time() - start) / iteracje * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--image', help='Plik ze zdjęciem paragonu (domyślnie obraz syntetyczny)')
+    parser.add_argument('--width', type=int, default=3024)
+    parser.add_argument('--height', type=int, default=4032)
+    parser.add_argument('-n', '--iterations', type=int, default=10)
+    args = parser.parse_args()
+
+    if args.image:
+        with open(args.image, 'rb') as handle:
+            surowe = handle.read()
+    else:
+        surowe = syntetyczny_paragon(args.width, args.height)
+    dane_base64 = base64.b64encode(surowe).decode('ascii')
+
+    print(f"Obraz: {len(surowe)} bajtów, iteracje: {args.iterations}")
+    dawna = zmierz(dawna_sciezka, dane_base64, args.iterations)
+    nowa = zmierz(nowa_sciezka, dane_base64, args.iterations)
+    print(f"Dawna ścieżka:    {dawna:8.1f} ms CPU / paragon")
+    print(f"PreprocessedImage: {nowa:8.1f} ms CPU / paragon")
+    print(f"Oszczędność:      {dawna - nowa:8.1f} ms CPU / paragon ({(dawna - nowa) / dawna * 100:.0f}%)")
+
+
+if __name__ == '__main__':
+    main()
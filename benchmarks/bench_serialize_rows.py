@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark serializacji wierszy: dawne serialize_row vs RowSerializer
+Obsługuje polskie znaki: ą, ć, ę, ł, ń, ó, ś, ź, ż
+
+Wiersze to prawdziwe obiekty Row z SQLAlchemy - zapytanie na SQLite
+w pamięci z typami kolumn (Numeric, DateTime) zwraca Decimal i datetime
+jak PyMySQL z MariaDB. Mierzony jest tylko czas CPU (time.process_time)
+zamiany pobranych wierszy na listę słowników (fetch_all) albo krotek
+(fetch_tuples), bez samego zapytania.
+
+Uruchomienie (z katalogu głównego repozytorium):
+    python benchmarks/bench_serialize_rows.py
+    python benchmarks/bench_serialize_rows.py --rows 100000 -n 5
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import DateTime, Integer, Numeric, String, create_engine, text  # noqa: E402
+
+from db import DatabaseHelper, RowSerializer  # noqa: E402
+
+# Kolumny jak w historii cen produktów / raportach: liczby, tekst, kwota, data, NULL-e
+ZAPYTANIE = text(
+    "SELECT id_produktu, id_paragonu, nazwa, cena, data_dodania, nazwa_firmy, id_kategorii, opis FROM produkty"
+).columns(
+    id_produktu=Integer, id_paragonu=Integer, nazwa=String, cena=Numeric(10, 2, asdecimal=True),
+    data_dodania=DateTime, nazwa_firmy=String, id_kategorii=Integer, opis=String,
+)
+
+
+def pobierz_wiersze(liczba: int):
+    random.seed(0)
+    engine = create_engine('sqlite://')
+    with engine.begin() as connection:
+        connection.execute(text(
+            """CREATE TABLE produkty (id_produktu INTEGER, id_paragonu INTEGER, nazwa TEXT, cena NUMERIC,
+               data_dodania DATETIME, nazwa_firmy TEXT, id_kategorii INTEGER, opis TEXT)"""
+        ))
+        start = datetime(2025, 1, 1)
+        connection.execute(
+            text("""INSERT INTO produkty VALUES (:id_produktu, :id_paragonu, :nazwa, :cena,
+                    :data_dodania, :nazwa_firmy, :id_kategorii, :opis)"""),
+            [{
+                'id_produktu': numer,
+                'id_paragonu': numer // 12,
+                'nazwa': random.choice(['Mleko 3,2%', 'Chleb żytni', 'Masło extra', 'Jabłka', 'Kawa ziarnista']),
+                'cena': str(Decimal(random.randint(99, 9999)) / 100),
+                'data_dodania': start + timedelta(minutes=numer * 7),
+                'nazwa_firmy': random.choice(['Biedronka', 'Lidl', 'Żabka', 'Auchan']),
+                'id_kategorii': random.randint(1, 40),
+                'opis': None if numer % 5 else 'promocja',
+            } for numer in range(liczba)],
+        )
+        return connection.execute(ZAPYTANIE).fetchall()
+
+
+def dawna_sciezka(wiersze):
+    # DatabaseHelper.serialize_row sprzed RowSerializer: nazwa i typ sprawdzane w każdej komórce
+    wynik = []
+    for row in wiersze:
+        keep_bytes_fields = ['password', 'obraz']
+        slownik = {}
+        for key, value in row._mapping.items():
+            if key in keep_bytes_fields and isinstance(value, bytes):
+                slownik[key] = value
+            elif isinstance(value, bytes):
+                try:
+                    slownik[key] = value.decode('utf-8')
+                except UnicodeDecodeError:
+                    slownik[key] = value.decode('latin1')
+            else:
+                slownik[key] = DatabaseHelper.serialize_value(value)
+        wynik.append(slownik)
+    return wynik
+
+
+def nowa_sciezka(wiersze):
+    return DatabaseHelper.serialize_rows(wiersze)
+
+
+def krotki(wiersze):
+    return RowSerializer(wiersze[0]._fields, wiersze).tuples(wiersze)
+
+
+def zmierz(funkcja, wiersze, iteracje: int) -> float:
+    funkcja(wiersze)  # rozgrzewka
+    start = time.process_time()
+    for _ in range(iteracje):
+        funkcja(wiersze)
+    return (time.process_time() - start) / iteracje * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--rows', type=int, default=20000)
+    parser.add_argument('-n', '--iterations', type=int, default=10)
+    args = parser.parse_args()
+
+    wiersze = pobierz_wiersze(args.rows)
+    if dawna_sciezka(wiersze) != nowa_sciezka(wiersze):
+        raise SystemExit("Wyniki dawnej i nowej serializacji się różnią")
+
+    print(f"Wiersze: {len(wiersze)}, kolumny: {len(wiersze[0]._fields)}, iteracje: {args.iterations}")
+    dawna = zmierz(dawna_sciezka, wiersze, args.iterations)
+    nowa = zmierz(nowa_sciezka, wiersze, args.iterations)
+    tuple_ms = zmierz(krotki, wiersze, args.iterations)
+    print(f"Dawne serialize_row:      {dawna:8.1f} ms CPU")
+    print(f"RowSerializer (słowniki): {nowa:8.1f} ms CPU ({dawna / nowa:.1f}x)")
+    print(f"RowSerializer (krotki):   {tuple_ms:8.1f} ms CPU ({dawna / tuple_ms:.1f}x)")
+
+
+if __name__ == '__main__':
+    main()
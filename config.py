@@ -40,6 +40,86 @@ class Config:
     # Gemini API Configuration — set GEMINI_API_KEY in environment
     GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
 
+    # Asynchroniczna kolejka skanowania paragonów (plik SQLite + przesłane obrazy)
+    RECEIPT_QUEUE_DIR = os.getenv('RECEIPT_QUEUE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'receipt_queue'))
+    RECEIPT_QUEUE_WORKERS = int(os.getenv('RECEIPT_QUEUE_WORKERS', 2))
+
+    # Cache wyników OCR (JSON paragonu wg SHA-256 obrazu) i jego maksymalny rozmiar w bajtach
+    OCR_CACHE_DIR = os.getenv('OCR_CACHE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'ocr_cache'))
+    OCR_CACHE_MAX_BYTES = int(os.getenv('OCR_CACHE_MAX_BYTES', 50 * 1024 * 1024))
+
+    # Odległość Hamminga (z 64 bitów dHash), do której obraz jest duplikatem już przed OCR (bez Gemini)
+    PHASH_EXACT_DISTANCE = int(os.getenv('PHASH_EXACT_DISTANCE', 2))
+    # Maksymalna odległość Hamminga dla kandydata na duplikat; dalszy od PHASH_EXACT_DISTANCE blokuje
+    # zapis tylko przy zgodnej sumie i liczbie pozycji odczytanych przez OCR
+    PHASH_MAX_DISTANCE = int(os.getenv('PHASH_MAX_DISTANCE', 6))
+
+    # Import wielu paragonów: wątki OCR/zapisu i maksymalna liczba zdjęć w jednym imporcie
+    BATCH_IMPORT_WORKERS = int(os.getenv('BATCH_IMPORT_WORKERS', 4))
+    BATCH_IMPORT_MAX_ITEMS = int(os.getenv('BATCH_IMPORT_MAX_ITEMS', 50))
+
+    # Limit zapytań do Gemini na minutę dla jednego klucza API w pracy w tle (import, kolejka skanów; 0 = bez limitu)
+    GEMINI_REQUESTS_PER_MINUTE = int(os.getenv('GEMINI_REQUESTS_PER_MINUTE', 15))
+
+    # Wspólna pula wątków do równoległej klasyfikacji miasta, firmy i kategorii
+    CLASSIFICATION_WORKERS = int(os.getenv('CLASSIFICATION_WORKERS', 6))
+
+    # Czas życia (s) cache słowników firmy/miasta/kategorie w pamięci procesu
+    REFERENCE_CACHE_TTL = int(os.getenv('REFERENCE_CACHE_TTL', 300))
+
+    # Minimalny wynik (0-1) lokalnego dopasowania firmy/miasta, poniżej pytamy Gemini
+    FUZZY_MATCH_THRESHOLD = float(os.getenv('FUZZY_MATCH_THRESHOLD', 0.85))
+
+    # Ilu użytkowników musi ręcznie wybrać tę samą kategorię dla nazwy, by poprawka objęła wszystkich
+    CATEGORY_MANUAL_AGREEMENT = int(os.getenv('CATEGORY_MANUAL_AGREEMENT', 3))
+
+    # Prompty klasyfikacji: budżet tokenów (znaki/4), produktów w jednej paczce, kandydatów na nazwę
+    PROMPT_TOKEN_BUDGET = int(os.getenv('PROMPT_TOKEN_BUDGET', 2000))
+    PROMPT_CHUNK_ITEMS = int(os.getenv('PROMPT_CHUNK_ITEMS', 40))
+    PROMPT_CANDIDATES_PER_ITEM = int(os.getenv('PROMPT_CANDIDATES_PER_ITEM', 5))
+
+    # Lokalny klasyfikator kategorii (flask train-classifier); poniżej progu pewności pytamy Gemini.
+    # Próg wybiera trening (trafność na odłożonych nazwach >= LOCAL_CLASSIFIER_TARGET_ACCURACY);
+    # LOCAL_CLASSIFIER_THRESHOLD go nadpisuje, a bez żadnego progu poziom lokalny jest wyłączony
+    LOCAL_CLASSIFIER_PATH = os.getenv('LOCAL_CLASSIFIER_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'category_model.json'))
+    LOCAL_CLASSIFIER_THRESHOLD = float(os.getenv('LOCAL_CLASSIFIER_THRESHOLD')) if os.getenv('LOCAL_CLASSIFIER_THRESHOLD') else None
+    LOCAL_CLASSIFIER_TARGET_ACCURACY = float(os.getenv('LOCAL_CLASSIFIER_TARGET_ACCURACY', 0.97))
+
+    # Czas życia (s) cache statusu użytkownika zapisywanego w logach aktywności
+    USER_STATUS_CACHE_TTL = int(os.getenv('USER_STATUS_CACHE_TTL', 60))
+
+    # Logi aktywności zapisywane paczkami w tle: rozmiar bufora, wpisów w INSERT, co ile sekund zapis,
+    # ile sekund czekać na miejsce w pełnym buforze (potem wpis jest odrzucany); false = zapis synchroniczny
+    AUDIT_LOG_ASYNC = os.getenv('AUDIT_LOG_ASYNC', 'true').lower() == 'true'
+    AUDIT_LOG_BUFFER = int(os.getenv('AUDIT_LOG_BUFFER', 10000))
+    AUDIT_LOG_BATCH = int(os.getenv('AUDIT_LOG_BATCH', 200))
+    AUDIT_LOG_FLUSH_INTERVAL = float(os.getenv('AUDIT_LOG_FLUSH_INTERVAL', 1.0))
+    AUDIT_LOG_BLOCK_TIMEOUT = float(os.getenv('AUDIT_LOG_BLOCK_TIMEOUT', 0.05))
+
+    # Archiwizacja logów (flask archive-logs): ile dni zostaje w bazie, katalog plików JSONL (gzip)
+    LOGS_RETENTION_DAYS = int(os.getenv('LOGS_RETENTION_DAYS', 180))
+    LOGS_ARCHIVE_DIR = os.getenv('LOGS_ARCHIVE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'logs_archive'))
+
+    # ID użytkowników z dostępem do /metryki (lista po przecinku)
+    ADMIN_USER_IDS = [int(id_uzytkownika) for id_uzytkownika in os.getenv('ADMIN_USER_IDS', '').split(',') if id_uzytkownika.strip()]
+
+    # Magazyn obrazów paragonów: 'local' (katalog) albo 's3' (S3 / MinIO, wymaga boto3)
+    BLOB_STORE = os.getenv('BLOB_STORE', 'local')
+    BLOB_STORE_DIR = os.getenv('BLOB_STORE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'blobs'))
+    BLOB_S3_BUCKET = os.getenv('BLOB_S3_BUCKET')
+    BLOB_S3_PREFIX = os.getenv('BLOB_S3_PREFIX', 'paragony/')
+    BLOB_S3_ENDPOINT_URL = os.getenv('BLOB_S3_ENDPOINT_URL')
+    BLOB_S3_REGION = os.getenv('BLOB_S3_REGION')
+
+    # Maksymalny rozmiar body żądania (upload zdjęcia paragonu), większe -> 413
+    MAX_CONTENT_LENGTH = int(os.getenv('MAX_CONTENT_LENGTH', 32 * 1024 * 1024))
+
+    # Dłuższy bok (px) obrazu paragonu wysyłanego do OCR w Gemini
+    OCR_IMAGE_MAX_SIDE = int(os.getenv('OCR_IMAGE_MAX_SIDE', 3072))
+
+    # Wątki generujące warianty obrazów (miniatura / podgląd / oryginał)
+    RENDITION_WORKERS = int(os.getenv('RENDITION_WORKERS', 2))
+
 class ProductionConfig(Config):
     """Production configuration"""
     DEBUG = False
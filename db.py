@@ -7,11 +7,155 @@ Obsługuje polskie znaki: ą, ć, ę, ł, ń, ó, ś, ź, ż
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy import text
 from decimal import Decimal
-from datetime import datetime, date
+from datetime import datetime, date, timedelta
+from contextlib import contextmanager
 import json
+import re
 
 db = SQLAlchemy()
 
+# Filtry dat owinięte w funkcję (DATE(kol), MONTH(kol)) wyłączają indeks na kolumnie -
+# sargable_dates przepisuje je na półotwarte zakresy: kol >= początek AND kol < koniec.
+# Granice bieżącego miesiąca liczy baza (CURDATE(), jak w oryginalnym filtrze). Granice dni trafiają
+# do nowych parametrów :p__od/:p__do (datetime sprowadzony do dnia, jak w DATE(kol)) - parametry
+# wywołującego zostają bez zmian, więc :p użyty w zapytaniu poza DATE() znaczy to samo co przedtem
+_KOLUMNA = r"([A-Za-z_][\w.`]*)"
+_DATE_BETWEEN = re.compile(r"\bDATE\(\s*" + _KOLUMNA + r"\s*\)\s+BETWEEN\s+:(\w+)\s+AND\s+:(\w+)", re.IGNORECASE)
+_DATE_OD = re.compile(r"\bDATE\(\s*" + _KOLUMNA + r"\s*\)\s*>=\s*:(\w+)", re.IGNORECASE)
+_DATE_DO = re.compile(r"\bDATE\(\s*" + _KOLUMNA + r"\s*\)\s*<=\s*:(\w+)", re.IGNORECASE)
+_BIEZACY_MIESIAC = re.compile(
+    r"\bMONTH\(\s*" + _KOLUMNA + r"\s*\)\s*=\s*MONTH\(\s*(?:CURDATE\(\)|CURRENT_DATE\(\)|CURRENT_DATE)\s*\)"
+    r"\s+AND\s+YEAR\(\s*\1\s*\)\s*=\s*YEAR\(\s*(?:CURDATE\(\)|CURRENT_DATE\(\)|CURRENT_DATE)\s*\)",
+    re.IGNORECASE,
+)
+_FUNKCJA_DATY = re.compile(r"\b(?:DATE|MONTH)\s*\(", re.IGNORECASE)
+_MAX_PRZEPISANYCH = 512
+# zapytanie -> (zapytanie po przepisaniu lub None bez zmian, [(nowy parametr, parametr źródłowy, przesunięcie w dniach)])
+_przepisane = {}
+
+
+def _jako_date(value):
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return date.fromisoformat(str(value).strip()[:10])
+
+
+def _przepisz_daty(query):
+    parametry = []
+
+    def miedzy(match):
+        kolumna, od, do = match.groups()
+        parametry.append((f"{od}__od", od, 0))
+        parametry.append((f"{do}__do", do, 1))
+        return f"{kolumna} >= :{od}__od AND {kolumna} < :{do}__do"
+
+    def od(match):
+        kolumna, nazwa = match.groups()
+        parametry.append((f"{nazwa}__od", nazwa, 0))
+        return f"{kolumna} >= :{nazwa}__od"
+
+    def do(match):
+        kolumna, nazwa = match.groups()
+        parametry.append((f"{nazwa}__do", nazwa, 1))
+        return f"{kolumna} < :{nazwa}__do"
+
+    def miesiac(match):
+        from services.rollups import KONIEC_MIESIACA_SQL, POCZATEK_MIESIACA_SQL
+        kolumna = match.group(1)
+        return f"{kolumna} >= {POCZATEK_MIESIACA_SQL} AND {kolumna} < {KONIEC_MIESIACA_SQL}"
+
+    nowe = _DATE_BETWEEN.sub(miedzy, query)
+    nowe = _DATE_OD.sub(od, nowe)
+    nowe = _DATE_DO.sub(do, nowe)
+    nowe = _BIEZACY_MIESIAC.sub(miesiac, nowe)
+    return (nowe if nowe != query else None), parametry
+
+# Kolumny binarne zwracane bez dekodowania (bcrypt potrzebuje bytes, obraz - kodowania base64)
+KEEP_BYTES_FIELDS = ('password', 'obraz')
+
+
+def _iso(value):
+    return value.isoformat()
+
+
+def _dekoduj(value):
+    # UTF-8 dla polskich znaków; latin1 dekoduje każdy ciąg bajtów
+    try:
+        return value.decode('utf-8')
+    except UnicodeDecodeError:
+        return value.decode('latin1')
+
+
+def _konwerter(typ, keep_bytes):
+    """Konwersja wartości kolumny danego typu (None = bez zmian), jak w serialize_row"""
+    if issubclass(typ, Decimal):
+        return float
+    if issubclass(typ, date):
+        return _iso
+    if issubclass(typ, bytes) and not keep_bytes:
+        return _dekoduj
+    return None
+
+
+class RowSerializer:
+    """
+    Serializer wierszy jednego wyniku zapytania
+    
+    Typ każdej kolumny jest ustalany raz, z pierwszej wartości różnej od NULL
+    (sterownik zwraca w kolumnie jeden typ), a potem konwertowane są tylko
+    kolumny, które tego wymagają - zamiast sprawdzać typ i nazwę każdej komórki.
+    Wynik jest taki sam jak DatabaseHelper.serialize_row.
+    """
+    
+    def __init__(self, keys, rows, keep_bytes_fields=KEEP_BYTES_FIELDS):
+        self.keys = tuple(keys)
+        konwersje = []
+        nieznane = list(range(len(self.keys)))
+        for row in rows:
+            if not nieznane:
+                break
+            pozostale = []
+            for index in nieznane:
+                value = row[index]
+                if value is None:
+                    pozostale.append(index)
+                    continue
+                konwerter = _konwerter(type(value), self.keys[index] in keep_bytes_fields)
+                if konwerter is not None:
+                    konwersje.append((index, konwerter))
+            nieznane = pozostale
+        self.konwersje = tuple(sorted(konwersje, key=lambda para: para[0]))
+    
+    def tuple(self, row):
+        """Wiersz jako krotka wartości w kolejności self.keys"""
+        if not self.konwersje:
+            return tuple(row)
+        values = list(row)
+        for index, konwerter in self.konwersje:
+            value = values[index]
+            if value is not None:
+                values[index] = konwerter(value)
+        return tuple(values)
+    
+    def dict(self, row):
+        return dict(zip(self.keys, self.tuple(row)))
+    
+    def dicts(self, rows):
+        keys = self.keys
+        if not self.konwersje:
+            return [dict(zip(keys, row)) for row in rows]
+        return [dict(zip(keys, self.tuple(row))) for row in rows]
+    
+    def tuples(self, rows):
+        if not self.konwersje:
+            return [tuple(row) for row in rows]
+        return [self.tuple(row) for row in rows]
+
+
 class DatabaseHelper:
     """Helper class for database operations"""
     
@@ -33,7 +177,7 @@ class DatabaseHelper:
         if row is None:
             return None
         if keep_bytes_fields is None:
-            keep_bytes_fields = ['password', 'obraz']  # Fields that should stay as bytes
+            keep_bytes_fields = KEEP_BYTES_FIELDS  # Fields that should stay as bytes
         
         result = {}
         for key, value in row._mapping.items():
@@ -56,9 +200,50 @@ class DatabaseHelper:
         return result
     
     @staticmethod
-    def serialize_rows(rows):
-        """Convert multiple database rows to JSON-serializable list"""
-        return [DatabaseHelper.serialize_row(row) for row in rows]
+    def serialize_rows(rows, keys=None):
+        """Convert multiple database rows to JSON-serializable list (one RowSerializer per result set)"""
+        if not rows:
+            return []
+        if keys is None:
+            keys = rows[0]._fields
+        return RowSerializer(keys, rows).dicts(rows)
+    
+    @staticmethod
+    def sargable_dates(query, params):
+        """
+        Przepisuje filtry DATE(kol) BETWEEN/>=/<= :p oraz MONTH/YEAR(kol) = bieżący
+        miesiąc na półotwarte zakresy na samej kolumnie, żeby mógł działać indeks
+        (np. paragony (id_uzytkownika, data_dodania))
+        
+        Args:
+            query: Zapytanie SQL z placeholderami :param_name
+            params: Parametry zapytania (dict) - nie jest modyfikowany
+            
+        Returns:
+            (zapytanie, parametry) - bez zmian, gdy zapytanie nie ma takich filtrów
+        """
+        if not _FUNKCJA_DATY.search(query):
+            return query, params
+        przepisane = _przepisane.get(query)
+        if przepisane is None:
+            przepisane = _przepisz_daty(query)
+            if len(_przepisane) >= _MAX_PRZEPISANYCH:
+                _przepisane.clear()
+            _przepisane[query] = przepisane
+        nowe_query, parametry = przepisane
+        if nowe_query is None:
+            return query, params
+        if not parametry:
+            return nowe_query, params
+        wynik = dict(params)
+        for nowy, zrodlo, dni in parametry:
+            try:
+                dzien = _jako_date(params.get(zrodlo))
+            except ValueError:
+                # Nieczytelna data - zostawiamy oryginalne zapytanie (wynik jak dotychczas)
+                return query, params
+            wynik[nowy] = dzien + timedelta(days=dni) if dzien is not None else None
+        return nowe_query, wynik
     
     @staticmethod
     def fetch_all(query, params=None):
@@ -74,10 +259,33 @@ class DatabaseHelper:
         """
         if params is None:
             params = {}
+        query, params = DatabaseHelper.sargable_dates(query, params)
         
         result = db.session.execute(text(query), params)
         rows = result.fetchall()
-        return DatabaseHelper.serialize_rows(rows)
+        return DatabaseHelper.serialize_rows(rows, result.keys())
+    
+    @staticmethod
+    def fetch_tuples(query, params=None):
+        """
+        Jak fetch_all, ale wiersze jako krotki - dla dużych wyników czytanych
+        w kodzie (bez słownika na każdy wiersz)
+        
+        Args:
+            query: Zapytanie SQL z placeholderami :param_name
+            params: Parametry zapytania
+            
+        Returns:
+            (nazwy kolumn, lista krotek)
+        """
+        if params is None:
+            params = {}
+        query, params = DatabaseHelper.sargable_dates(query, params)
+        
+        result = db.session.execute(text(query), params)
+        keys = tuple(result.keys())
+        rows = result.fetchall()
+        return keys, RowSerializer(keys, rows).tuples(rows)
     
     @staticmethod
     def fetch_one(query, params=None):
@@ -93,13 +301,40 @@ class DatabaseHelper:
         """
         if params is None:
             params = {}
+        query, params = DatabaseHelper.sargable_dates(query, params)
         
         result = db.session.execute(text(query), params)
         row = result.fetchone()
         return DatabaseHelper.serialize_row(row)
     
     @staticmethod
-    def execute(query: str, params: dict = None, return_lastrowid: bool = False):
+    @contextmanager
+    def transaction():
+        """
+        Otwiera jedną transakcję dla kilku zapytań zapisu
+        
+        Commit następuje na końcu bloku, rollback przy wyjątku.
+        
+        Użycie:
+            with DatabaseHelper.transaction() as connection:
+                DatabaseHelper.execute(query, params, connection=connection)
+                DatabaseHelper.execute_many(query, params_list, connection=connection)
+        """
+        with db.engine.begin() as connection:
+            yield connection
+    
+    @staticmethod
+    def _execute_on(connection, query, params, return_lastrowid):
+        result = connection.execute(text(query), params)
+        if return_lastrowid:
+            if getattr(result, "lastrowid", None) is not None:
+                return result.lastrowid
+            inserted_pk = result.inserted_primary_key
+            return inserted_pk[0] if inserted_pk else None
+        return result.rowcount
+    
+    @staticmethod
+    def execute(query: str, params: dict = None, return_lastrowid: bool = False, connection=None):
         """
         Wykonuje zapytanie INSERT/UPDATE/DELETE
         
@@ -107,6 +342,8 @@ class DatabaseHelper:
             query: Zapytanie SQL
             params: Parametry zapytania (dict)
             return_lastrowid: Czy zwrócić ID ostatnio wstawionego wiersza
+            connection: Połączenie z DatabaseHelper.transaction() - bez niego
+                        zapytanie wykonywane jest we własnej transakcji
             
         Returns:
             int: Liczba zmodyfikowanych wierszy lub lastrowid jeśli return_lastrowid=True
@@ -115,14 +352,45 @@ class DatabaseHelper:
             Exception: W przypadku błędu SQL
         """
         params = params or {}
-        with db.engine.begin() as connection:
-            result = connection.execute(text(query), params)
-            if return_lastrowid:
-                if getattr(result, "lastrowid", None) is not None:
-                    return result.lastrowid
-                inserted_pk = result.inserted_primary_key
-                return inserted_pk[0] if inserted_pk else None
-            return result.rowcount
+        if connection is not None:
+            value = DatabaseHelper._execute_on(connection, query, params, return_lastrowid)
+        else:
+            with db.engine.begin() as own_connection:
+                value = DatabaseHelper._execute_on(own_connection, query, params, return_lastrowid)
+        # Zapis do firmy/miasta/kategorie unieważnia cache słowników, do uzytkownicy - cache statusu
+        from services import reference_cache, user_status
+        reference_cache.invalidate_for_query(query)
+        user_status.invalidate_for_query(query)
+        return value
+    
+    @staticmethod
+    def execute_many(query: str, params_list, connection=None):
+        """
+        Wykonuje to samo zapytanie INSERT/UPDATE dla wielu zestawów parametrów
+        
+        Sterownik PyMySQL łączy INSERT ... VALUES w jedno wielowierszowe
+        zapytanie, więc N pozycji to jeden round trip zamiast N.
+        
+        Args:
+            query: Zapytanie SQL z placeholderami :param_name
+            params_list: Lista słowników parametrów
+            connection: Połączenie z DatabaseHelper.transaction() (opcjonalnie)
+            
+        Returns:
+            int: Liczba zmodyfikowanych wierszy
+        """
+        params_list = list(params_list)
+        if not params_list:
+            return 0
+        if connection is not None:
+            rowcount = connection.execute(text(query), params_list).rowcount
+        else:
+            with db.engine.begin() as own_connection:
+                rowcount = own_connection.execute(text(query), params_list).rowcount
+        from services import reference_cache, user_status
+        reference_cache.invalidate_for_query(query)
+        user_status.invalidate_for_query(query)
+        return rowcount
     
     @staticmethod
     def get_last_insert_id():
@@ -19,46 +19,33 @@ import google.generativeai as genai
 from google.ai.generativelanguage_v1beta.types import content
 import PIL
 import threading
+import contextvars
 from io import BytesIO
 import requests
+from concurrent.futures import ThreadPoolExecutor
+from services import image_pipeline, llm_client, ocr_cache, receipt_schema
+from services.audit_log import log_user_action
+from services.user_status import get_user_status
 
 
-# genai.configure(api_key="")  # Moved to individual methods - configured dynamically with user's API key
+# genai.configure(api_key="")  # Nie używamy globalnej konfiguracji - klient per klucz API w services.llm_client
 kluczDoGemini=""
 
+# Model odczytujący paragony (część klucza cache OCR)
+MODEL_OCR = "gemini-2.5-flash"
 
-def log_user_action(user_id, action, user_status, details=None):
-    """Store a single audit log entry."""
-    from db import DatabaseHelper
-    try:
-        DatabaseHelper.execute(
-            """
-            INSERT INTO logi (id_uzytkownika, action, user_status_at_log, details)
-            VALUES (:user_id, :action, :status, :details)
-            """,
-            {
-                "user_id": user_id,
-                "action": action,
-                "status": user_status,
-                "details": details,
-            },
-        )
-    except Exception as e:
-        print(f"Error logging user action: {e}")
+# Wspólna (ograniczona) pula wątków dla równoległej klasyfikacji miasta, firmy i kategorii
+_pula_klasyfikacji = None
+_pula_klasyfikacji_lock = threading.Lock()
 
+class DuplikatParagonu(Exception):
+    """Przesłany obraz to (prawie) ten sam paragon, który użytkownik już dodał"""
+
+    def __init__(self, id_paragonu, odleglosc=0):
+        super().__init__(f"Ten paragon został już dodany (ID {id_paragonu})")
+        self.id_paragonu = id_paragonu
+        self.odleglosc = odleglosc
 
-def get_user_status(user_id):
-    """Fetch latest user status for logging."""
-    from db import DatabaseHelper
-    try:
-        record = DatabaseHelper.fetch_one(
-            "SELECT status FROM uzytkownicy WHERE id_uzytkownika = :user_id",
-            {"user_id": user_id},
-        )
-        return record.get("status", "unknown") if record else "unknown"
-    except Exception as e:
-        print(f"Error getting user status: {e}")
-        return "unknown"
 
 class Ekstrakcja:
     app = None  
@@ -67,25 +54,69 @@ class Ekstrakcja:
         Ekstrakcja.app = application
 
     @staticmethod
-    def dodajProduktyDoBazy(data, id_paragonu, kluczDoGemini, id_uzytkownika=None, auto_commit=True):
+    def _pulaKlasyfikacji():
+        """Zwraca wspólną pulę wątków klasyfikacji (rozmiar: CLASSIFICATION_WORKERS)"""
+        global _pula_klasyfikacji
+        with _pula_klasyfikacji_lock:
+            if _pula_klasyfikacji is None:
+                workers = Ekstrakcja.app.config.get('CLASSIFICATION_WORKERS', 6) if Ekstrakcja.app else 6
+                _pula_klasyfikacji = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='klasyfikacja')
+        return _pula_klasyfikacji
+
+    @staticmethod
+    def _wKontekscieAplikacji(funkcja, *args):
+        # Każdy wątek potrzebuje własnego kontekstu aplikacji (i własnej sesji SQLAlchemy)
+        with Ekstrakcja.app.app_context():
+            return funkcja(*args)
+
+    @staticmethod
+    def klasyfikujRownolegle(*zadania):
+        """
+        Uruchamia niezależne klasyfikacje równolegle i zwraca ich wyniki w kolejności zadań
+        
+        Args:
+            zadania: Krotki (funkcja, *argumenty)
+            
+        Returns:
+            Lista wyników; pierwszy napotkany wyjątek jest propagowany
+        """
+        if Ekstrakcja.app is None:
+            return [funkcja(*args) for funkcja, *args in zadania]
+        pula = Ekstrakcja._pulaKlasyfikacji()
+        # Kopia kontekstu przenosi do wątków puli m.in. znacznik pracy w tle (limit zapytań rate_limit)
+        futures = [
+            pula.submit(contextvars.copy_context().run, Ekstrakcja._wKontekscieAplikacji, funkcja, *args)
+            for funkcja, *args in zadania
+        ]
+        return [future.result() for future in futures]
+
+    @staticmethod
+    def przygotujProdukty(produkty):
+        """Uzupełnia brakujące wartości pozycji paragonu przed klasyfikacją i zapisem"""
+        for produkt in produkty:
+            print("*" * 20)
+            print(f"Nazwa produktu: {produkt['nazwa']} - ilosc: {produkt['ilosc']}/{produkt['jednostka']} - Cena: {produkt['cena']} - Podatek: {produkt['podatek']}")
+            # Handle possible None values
+            if produkt['podatek'] is None:
+                produkt['podatek'] = "BRAK"
+            if produkt['ilosc'] is None:
+                produkt['ilosc'] = 0
+            if produkt['jednostka'] is None:
+                produkt['jednostka'] = "Brak"
+            if produkt['cena'] is None:
+                produkt['cena'] = 0
+            if produkt['cenajednostkowa'] is None:
+                produkt['cenajednostkowa'] = 0
+            produkt['id_kategorii'] = None
+            produkt['nazwa_kategorii'] = None
+        return produkty
+
+    @staticmethod
+    def dodajProduktyDoBazy(data, id_paragonu, kluczDoGemini, id_uzytkownika=None, auto_commit=True, sklasyfikowane=None, connection=None):
         from db import DatabaseHelper
         try:
-            for produkt in data['produkty']:
-                print("*" * 20)
-                print(f"Nazwa produktu: {produkt['nazwa']} - ilosc: {produkt['ilosc']}/{produkt['jednostka']} - Cena: {produkt['cena']} - Podatek: {produkt['podatek']}")
-                # Handle possible None values
-                if produkt['podatek'] is None:
-                    produkt['podatek'] = "BRAK"
-                if produkt['ilosc'] is None:
-                    produkt['ilosc'] = 0
-                if produkt['jednostka'] is None:
-                    produkt['jednostka'] = "Brak"
-                if produkt['cena'] is None:
-                    produkt['cena'] = 0
-                if produkt['cenajednostkowa'] is None:
-                    produkt['cenajednostkowa'] = 0
-                produkt['id_kategorii'] = None
-                produkt['nazwa_kategorii'] = None
+            if sklasyfikowane is None:
+                Ekstrakcja.przygotujProdukty(data['produkty'])
             
             # Log rozpoczęcia klasyfikacji
             if id_uzytkownika:
@@ -97,14 +128,16 @@ class Ekstrakcja:
                     json.dumps({"id_paragonu": id_paragonu, "products_count": len(data['produkty'])}, ensure_ascii=False)
                 )
             
-            produkty = Ekstrakcja.klasyfikacjaKategorieJedna(data['produkty'], kluczDoGemini)
+            if sklasyfikowane is None:
+                produkty = Ekstrakcja.klasyfikacjaKategorieJedna(data['produkty'], kluczDoGemini, id_uzytkownika)
+            else:
+                produkty = sklasyfikowane
             print(20*"*")
             print("LAST OPERACJA")
             print(20*"*")
             print(produkty)
-            paragon_id = int(id_paragonu)
-            for produkt in produkty:
-                Ekstrakcja.dodajProdukty(paragon_id, produkt['nazwa'], produkt['cena'], produkt['cenajednostkowa'], produkt['ilosc'], produkt['jednostka'], produkt['podatek'], produkt['id_kategorii'], commit=auto_commit)
+            # Jeden wielowierszowy INSERT (w transakcji paragonu, jeśli przekazano connection)
+            Ekstrakcja.dodajProduktyHurtowo(id_paragonu, produkty, connection=connection)
             
             # Log zakończenia dodawania produktów
             if id_uzytkownika:
@@ -135,250 +168,182 @@ class Ekstrakcja:
             raise e
                 
                 
-    # Funkcja związana z wyswietleniem wszystkich paragonow uzytkownika od id 1 ale tak ze z joinem z tabelą nazwa firmy
     @staticmethod
-    def paragonik(img, id_uzytkownika, kluczDoGemini):
-        from db import DatabaseHelper
-        try:
-            genai.configure(api_key=kluczDoGemini)
-            safety_settings = [
-            {
-                "category": "HARM_CATEGORY_HARASSMENT",
-                "threshold": "BLOCK_NONE",
-            },
-            {
-                "category": "HARM_CATEGORY_HATE_SPEECH",
-                "threshold": "BLOCK_NONE",
-            },
+    def ocrParagonu(obraz, kluczDoGemini):
+        """
+        Zapytanie OCR do Gemini i odczyt JSON-a paragonu z odpowiedzi modelu
+        
+        Returns:
+            Słownik paragonu (adres, produkty, podatki, suma) zgodny z RECEIPT_SCHEMA
+        """
+        # Wymuszony JSON zgodny z RECEIPT_SCHEMA - bez wycinania bloków markdown
+        generation_config = receipt_schema.generation_config(receipt_schema.RECEIPT_SCHEMA, 8192)
+        #"gemini-1.5-pro-002",
+        #"gemini-2.5-flash-lite-latest",
+        response = llm_client.pool.generate(kluczDoGemini, MODEL_OCR, ["""Give me results of the receipt in json format in the syntax, if something is missing, enter null. Be careful some prices of products would be below the name of the product.:
+        nazwafirmy name of the company. String format.
+        ulica street. String format.
+        miasto city. String format.
+        kodpocztowy postal code. String format.
+        nazwa name. String format.
+        ilosc means how many products are there, value mostly occurs alone or in front of x and price, with the unit. If you dont have unit its alone! Example 2x8,69 its 2 products. Float format.
+        jednostka unit locatet next to ilosc. String format.
+        cena price for all products mostly the result of a mathematical operation. Float format.
+        cenajednostkowa: The unit price of a product, for one product or full unit price eg. kg. Presented in a float format.
+        Podatek A and Ptu A its not the same. Podatek its a full sum o the bought products. Ptu its a sum of the tax. A tax often takes on a name like SPRZEDAZ OPODATKOWANA. Float format.
+        Rabat or OPUST its the same as discount. Its not a products, dont add it to a products list!!! If you see prices with the minus its a discount. Float format.
+        Mathematical sum up all Rabat or OPUST (ALL DISCOUNTS) price and add to RABAT in json. Float format.
+        Remember format of the json. If you dont have some data enter null.
+        Read prices very exactly its very important.
+        {
+        "adres": {
+            "nazwafirmy": "Sklep Spożywczy 'Zdrowa Żywność'",
+            "ulica": "ul. Zielona 5",
+            "miasto": "Warszawa",
+            "kodpocztowy": "00-001"
+        },
+        "produkty": [
             {
-                "category": "HARM_CATEGORY_SEXUALLY_EXPLICIT",
-                "threshold": "BLOCK_NONE",
+            "nazwa": "Chleb",
+            "ilosc": 1,
+            "jednostka": "szt",
+            "cena": 3.50,
+            "cenajednostkowa": 3.50,
+            "podatek": "A"
             },
             {
-                "category": "HARM_CATEGORY_DANGEROUS_CONTENT",
-                "threshold": "BLOCK_NONE",
-            },
-            ]
+            "nazwa": "Pomidory",
+            "ilosc": 0.3,
+            "jednostka": "kg",
+            "cena": 2.80,
+            "cenajednostkowa": 9.33,
+            "podatek": "D"
+            }
+        ],
+        "podatki": {
+            "podatekA": 3.32,
+            "podatekB": 9.30,
+            "podatekC": 2.14,
+            "podatekD": 2.14,
+            "PTU A": 2.14,
+            "PTU B": 11.44,
+            "PTU C": 11.44,
+            "PTU D": 11.44,
+            "RABAT": -7.32
+        },
+        "suma": {
+            "TOTAL": 11.44
+        }
+        }""", obraz.ocr_blob()], generation_config)
 
+        print(response.text)
+        
+        # Walidacja i normalizacja liczb w jednym przejściu (błędy liczone w /metryki)
+        return receipt_schema.parse('paragon', response.text, receipt_schema.RECEIPT_SCHEMA)
 
-            generation_config = {
-            "temperature": 1,
-            "top_p": 0.95,
-            "top_k": 40,
-            "max_output_tokens": 8192
-            }
-            base64_img = img
-            # Operacja zwiazana z przetworzeniem obrazu z wykorzystaniem OCR
-            imgB = base64.b64decode(base64_img)
-            img=Image.open(io.BytesIO(imgB))
-            
-            # Konwersja do RGB przed zapisem jako JPEG
-            # RGBA (z przezroczystością) nie jest obsługiwane przez JPEG
-            if img.mode in ('RGBA', 'LA', 'P'):
-                # Tworzymy białe tło dla obrazów z przezroczystością
-                background = Image.new('RGB', img.size, (255, 255, 255))
-                if img.mode == 'P':
-                    img = img.convert('RGBA')
-                background.paste(img, mask=img.split()[-1] if img.mode in ('RGBA', 'LA') else None)
-                img = background
-            elif img.mode != 'RGB':
-                img = img.convert("RGB")
-            
-            buffer = io.BytesIO()
-            img.save(buffer, format="JPEG")  # Użyj właściwego formatu obrazu
-            binary_data = buffer.getvalue()
-
-            model = genai.GenerativeModel(
-            #model_name="gemini-1.5-pro-002",
-            #model_name="gemini-1.5-pro",
-            #model_name="gemini-1.5-pro",
-            model_name="gemini-2.5-flash",
-            #model_name="gemini-1.5-pro-002",
-            #model_name="gemini-2.5-flash-lite-latest",
-            safety_settings=safety_settings,
-            generation_config=generation_config,
-            )
+    @staticmethod
+    def odczytajParagon(img, kluczDoGemini):
+        """
+        Etap OCR potoku paragonu - odczyt treści paragonu przez Gemini (lub z cache OCR)
+        
+        Args:
+            img: Obraz paragonu (bajty, plik, base64 lub PreprocessedImage)
+            kluczDoGemini: Klucz API Gemini
             
-            response = model.generate_content(["""Give me results of the receipt in json format in the syntax, if something is missing, enter null. Be careful some prices of products would be below the name of the product.:
-            nazwafirmy name of the company. String format.
-            ulica street. String format.
-            miasto city. String format.
-            kodpocztowy postal code. String format.
-            nazwa name. String format.
-            ilosc means how many products are there, value mostly occurs alone or in front of x and price, with the unit. If you dont have unit its alone! Example 2x8,69 its 2 products. Float format.
-            jednostka unit locatet next to ilosc. String format.
-            cena price for all products mostly the result of a mathematical operation. Float format.
-            cenajednostkowa: The unit price of a product, for one product or full unit price eg. kg. Presented in a float format.
-            Podatek A and Ptu A its not the same. Podatek its a full sum o the bought products. Ptu its a sum of the tax. A tax often takes on a name like SPRZEDAZ OPODATKOWANA. Float format.
-            Rabat or OPUST its the same as discount. Its not a products, dont add it to a products list!!! If you see prices with the minus its a discount. Float format.
-            Mathematical sum up all Rabat or OPUST (ALL DISCOUNTS) price and add to RABAT in json. Float format.
-            Remember format of the json. If you dont have some data enter null.
-            Read prices very exactly its very important.
-            {
-            "adres": {
-                "nazwafirmy": "Sklep Spożywczy 'Zdrowa Żywność'",
-                "ulica": "ul. Zielona 5",
-                "miasto": "Warszawa",
-                "kodpocztowy": "00-001"
-            },
-            "produkty": [
-                {
-                "nazwa": "Chleb",
-                "ilosc": 1,
-                "jednostka": "szt",
-                "cena": 3.50,
-                "cenajednostkowa": 3.50,
-                "podatek": "A"
-                },
-                {
-                "nazwa": "Pomidory",
-                "ilosc": 0.3,
-                "jednostka": "kg",
-                "cena": 2.80,
-                "cenajednostkowa": 9.33,
-                "podatek": "D"
-                }
-            ],
-            "podatki": {
-                "podatekA": 3.32,
-                "podatekB": 9.30,
-                "podatekC": 2.14,
-                "podatekD": 2.14,
-                "PTU A": 2.14,
-                "PTU B": 11.44,
-                "PTU C": 11.44,
-                "PTU D": 11.44,
-                "RABAT": -7.32
-            },
-            "suma": {
-                "TOTAL": 11.44
-            }
-            }""", img], stream=False)
+        Returns:
+            (obraz, odczyt) - PreprocessedImage oraz słownik z danymi paragonu ('data')
+            i polami nagłówka używanymi przy klasyfikacji i zapisie
+        """
+        # Jedno dekodowanie obrazu: EXIF i RGB raz, z niego wejście OCR i obraz archiwalny
+        obraz = image_pipeline.PreprocessedImage.z_danych(img)
+
+        # Ten sam plik (np. ponowienie po błędzie zapisu) nie wymaga ponownego zapytania do Gemini
+        cache = ocr_cache.get_ocr_cache()
+        klucz = ocr_cache.klucz(obraz.oryginal, f"{MODEL_OCR}/schemat-{receipt_schema.WERSJA}")
+        data = cache.get(klucz)
+        if data is None:
+            data = Ekstrakcja.ocrParagonu(obraz, kluczDoGemini)
+            cache.put(klucz, data)
+        else:
+            print("OCR paragonu z cache (bez zapytania do Gemini)")
+        
+        # Typowany paragon: brakujące kwoty to 0, brakujące pola adresu "TrudnoOkreslic"
+        paragon = receipt_schema.Paragon.z_dict(data)
+        data = paragon.jako_slownik()
+        nazwa_firmy = paragon.adres.nazwafirmy or "brak"
+        ulica_firmy = paragon.adres.ulica or "brak"
+        miasto_firmy = paragon.adres.miasto or "brak"
+        suma_total = paragon.suma
+        rabat = paragon.rabat
+        
+        print(f"Adres firmy: {nazwa_firmy} - {ulica_firmy} - {miasto_firmy} ")
+        print("*"*20)
+        Ekstrakcja.wszystkieProdukty(data)
+        sumaZOperacji = float(Ekstrakcja.suma(rabat, data))
+        print("Suma z operacji matematycznej: ", sumaZOperacji)
+        print("*"*20)
+        for nazwa, kwota in paragon.podatki.items():
+            print(f"{nazwa}: {kwota}")
+        print("*"*20)
+        print(f"Suma total: {suma_total}")
+        
+        Ekstrakcja.przygotujProdukty(data['produkty'])
+        return obraz, {
+            'data': data,
+            'nazwa_firmy': nazwa_firmy,
+            'ulica': ulica_firmy,
+            'miasto': miasto_firmy,
+            'suma': suma_total,
+            'sumaZOperacji': sumaZOperacji,
+            'rabat': rabat,
+        }
 
-            print(response.text)
-            
-            wynik = str(response.text)
-
-            def _extract_first_json_block(raw_text):
-                depth = 0
-                in_string = False
-                escape = False
-                start_index = None
-                for index, char in enumerate(raw_text):
-                    if escape:
-                        escape = False
-                        continue
-                    if char == "\\":
-                        escape = True
-                        continue
-                    if char == '"':
-                        in_string = not in_string
-                        continue
-                    if in_string:
-                        continue
-                    if char == '{' and depth == 0:
-                        start_index = index
-                        depth = 1
-                        continue
-                    if char == '{':
-                        depth += 1
-                        continue
-                    if char == '}':
-                        depth -= 1
-                        if depth == 0 and start_index is not None:
-                            return raw_text[start_index:index + 1]
-                return None
-
-            json_payload = _extract_first_json_block(wynik)
-            if not json_payload:
-                raise ValueError("Nie udało się wydobyć poprawnego JSON-a z odpowiedzi modelu AI")
-
-            data = json.loads(json_payload)
-            
-            nazwa_firmy = data['adres']['nazwafirmy']
-            if nazwa_firmy == None:
-                data['adres']['nazwafirmy'] = "TrudnoOkreslic"
-                nazwa_firmy = "brak"
-            ulica_firmy = data['adres']['ulica']
-            if ulica_firmy == None:
-                data['adres']['ulica'] = "TrudnoOkreslic"
-                ulica_firmy = "brak"
-            miasto_firmy = data['adres']['miasto']
-            if miasto_firmy == None:
-                data['adres']['miasto'] = "TrudnoOkreslic"
-                miasto_firmy = "brak"
-            suma_total = data['suma']['TOTAL']
-            if suma_total == None:
-                data['suma']['TOTAL'] = 0
-                suma_total = 0
-            podatekA = data['podatki']['podatekA']
-            if podatekA == None:
-                data['podatki']['podatekA'] = 0
-                podatekA = 0
-            podatekB = data['podatki']['podatekB']
-            if podatekB == None:
-                data['podatki']['podatekB'] = 0
-                podatekB = 0
-            podatekC = data['podatki']['podatekC']
-            if podatekC == None:
-                data['podatki']['podatekC'] = 0
-                podatekC = 0
-            podatekD = data['podatki']['podatekD']
-            if podatekD == None:
-                podatekD = 0
-            PTU_A = data['podatki']['PTU A']
-            if PTU_A == None:
-                data['podatki']['PTU A'] = 0
-                PTU_A = 0
-            PTU_B = data['podatki']['PTU B']
-            if PTU_B == None:
-                data['podatki']['PTU B'] = 0
-                PTU_B = 0
-            PTU_C = data['podatki']['PTU C']
-            if PTU_C == None:
-                data['podatki']['PTU C'] = 0
-                PTU_C = 0
-            PTU_D = data['podatki']['PTU D']
-            if PTU_D == None:
-                data['podatki']['PTU D'] = 0
-                PTU_D = 0
-            rabat = data['podatki']['RABAT']
-            if rabat == None:
-                data['podatki']['RABAT'] = 0
-                rabat = 0
+    @staticmethod
+    def zapiszParagon(obraz, odczyt, id_uzytkownika, kluczDoGemini, sklasyfikowane=None):
+        """
+        Etap zapisu potoku paragonu - klasyfikacja miasta i firmy (oraz kategorii,
+        jeśli nie przekazano sklasyfikowane) i zapis paragonu z produktami w jednej transakcji
+        
+        Args:
+            obraz, odczyt: Wynik Ekstrakcja.odczytajParagon
+            sklasyfikowane: Produkty z już przypisanymi kategoriami (np. wspólna klasyfikacja importu)
             
-            print(f"Adres firmy: {nazwa_firmy} - {ulica_firmy} - {miasto_firmy} ")
-            print("*"*20)
-            Ekstrakcja.wszystkieProdukty(data)
-            sumaZOperacji = float(Ekstrakcja.suma(rabat, data))
-            print("Suma z operacji matematycznej: ", sumaZOperacji)
-            print("*"*20)
-            print(f"Podatek A: {podatekA}")
-            print(f"Podatek B: {podatekB}")
-            print(f"Podatek C: {podatekC}")
-            print(f"Podatek D: {podatekD}")
-            print(f"PTU A: {PTU_A}")
-            print(f"PTU B: {PTU_B}")
-            print(f"PTU C: {PTU_C}")
-            print(f"PTU D: {PTU_D}")
-            print(f"Rabat: {rabat}")
-            print("*"*20)
-            print(f"Suma z operacji matematycznej: {Ekstrakcja.suma(rabat, data)}")
-            print(f"Suma total: {suma_total}")
+        Returns:
+            ID dodanego paragonu
+        """
+        from db import DatabaseHelper
+        data = odczyt['data']
+        nazwa_firmy = odczyt['nazwa_firmy']
+        ulica_firmy = odczyt['ulica']
+        miasto_firmy = odczyt['miasto']
+        suma_total = odczyt['suma']
+        sumaZOperacji = odczyt['sumaZOperacji']
+        rabat = odczyt['rabat']
+        
+        # Klasyfikacje miasta, firmy i kategorii są niezależne - uruchamiamy je równolegle,
+        # a zapis do bazy zostaje w tym wątku (jedna transakcja)
+        zadania = [
+            (Ekstrakcja.klasyfikacjaMiastaStart, miasto_firmy, ulica_firmy, miasto_firmy, kluczDoGemini),
+            (Ekstrakcja.klasyfikacjaFirmyStart, nazwa_firmy, kluczDoGemini),
+        ]
+        if sklasyfikowane is None:
+            zadania.append((Ekstrakcja.klasyfikacjaKategorieJedna, data['produkty'], kluczDoGemini, id_uzytkownika))
+        wyniki = Ekstrakcja.klasyfikujRownolegle(*zadania)
+        id_miasta, id_firmy = wyniki[0], wyniki[1]
+        produkty_sklasyfikowane = wyniki[2] if sklasyfikowane is None else sklasyfikowane
+        # Ekstrakcja.dodajParagon(id_uzytkownika, id_firmy, id_miasta, ulica, suma, rabat)
+        try:
+            # Log rozpoczęcia dodawania paragonu
+            user_status = get_user_status(id_uzytkownika)
+            log_user_action(
+                id_uzytkownika,
+                "add_receipt_start",
+                user_status,
+                json.dumps({"firma": nazwa_firmy, "miasto": miasto_firmy, "suma": suma_total}, ensure_ascii=False)
+            )
             
-            id_miasta = Ekstrakcja.klasyfikacjaMiastaStart(miasto_firmy, ulica_firmy, miasto_firmy, kluczDoGemini)
-            id_firmy = Ekstrakcja.klasyfikacjaFirmyStart(nazwa_firmy, kluczDoGemini)
-            # Ekstrakcja.dodajParagon(id_uzytkownika, id_firmy, id_miasta, ulica, suma, rabat)
-            try:
-                # Log rozpoczęcia dodawania paragonu
-                user_status = get_user_status(id_uzytkownika)
-                log_user_action(
-                    id_uzytkownika,
-                    "add_receipt_start",
-                    user_status,
-                    json.dumps({"firma": nazwa_firmy, "miasto": miasto_firmy, "suma": suma_total}, ensure_ascii=False)
-                )
-                
+            # Paragon i wszystkie jego produkty zapisujemy w jednej transakcji
+            with DatabaseHelper.transaction() as connection:
                 id_paragonu = Ekstrakcja.dodajParagon(
                     id_uzytkownika,
                     id_firmy,
@@ -387,54 +352,183 @@ class Ekstrakcja:
                     suma_total,
                     sumaZOperacji,
                     rabat,
-                    imgB,
+                    obraz,
                     auto_commit=False,
+                    connection=connection,
                 )
                 
-                # Log zakończenia dodawania paragonu
+                # Dodawanie produktów do bazy danych - jeden wielowierszowy INSERT w tej samej transakcji
+                Ekstrakcja.dodajProduktyDoBazy(data, id_paragonu, kluczDoGemini, id_uzytkownika, auto_commit=False,
+                                               sklasyfikowane=produkty_sklasyfikowane, connection=connection)
+            
+            # Agregaty wydatków dnia i miesiąca paragonu (raporty, limity, trendy)
+            from services import renditions, rollups
+            rollups.odswiez_paragon(id_paragonu)
+            
+            # Miniatura, podgląd i oryginał powstają w tle - nie wydłużają odpowiedzi
+            renditions.zaplanuj(Ekstrakcja.app, id_paragonu, obraz)
+            
+            # Log zakończenia dodawania paragonu (po zatwierdzeniu transakcji)
+            log_user_action(
+                id_uzytkownika,
+                "add_receipt_success",
+                user_status,
+                json.dumps({"id_paragonu": id_paragonu, "firma": nazwa_firmy, "suma": suma_total}, ensure_ascii=False)
+            )
+        except Exception as e:
+            # Log błędu
+            try:
+                user_status = get_user_status(id_uzytkownika)
                 log_user_action(
                     id_uzytkownika,
-                    "add_receipt_success",
+                    "add_receipt_error",
                     user_status,
-                    json.dumps({"id_paragonu": id_paragonu, "firma": nazwa_firmy, "suma": suma_total}, ensure_ascii=False)
+                    json.dumps({"error": str(e)}, ensure_ascii=False)
                 )
-                
-                # Dodawanie produktów do bazy danych - usunięto threading, aby uniknąć problemów z sesją SQLAlchemy
-                Ekstrakcja.dodajProduktyDoBazy(data, id_paragonu, kluczDoGemini, id_uzytkownika, auto_commit=False)
-                DatabaseHelper.commit()
-            except Exception as e:
-                # Log błędu
-                try:
-                    user_status = get_user_status(id_uzytkownika)
-                    log_user_action(
-                        id_uzytkownika,
-                        "add_receipt_error",
-                        user_status,
-                        json.dumps({"error": str(e)}, ensure_ascii=False)
-                    )
-                except:
-                    pass
-                DatabaseHelper.rollback()
-                raise
+            except:
+                pass
+            DatabaseHelper.rollback()
+            raise
+        
+        return id_paragonu
 
-            return str(id_paragonu)
+
+    @staticmethod
+    def sprawdzDuplikat(obraz, id_uzytkownika, odczyt=None):
+        """
+        Szuka paragonu użytkownika, który jest duplikatem przesłanego zdjęcia
+        
+        Bez odczytu (przed OCR) duplikatem jest tylko pewne trafienie: ten sam
+        obraz archiwalny (obraz_hash) albo odległość Hamminga dHash
+        <= PHASH_EXACT_DISTANCE - ponownie sfotografowany paragon nie kosztuje
+        wtedy zapytania do Gemini. 64-bitowy dHash bywa jednak bliski dla
+        różnych paragonów z tego samego sklepu (ten sam nagłówek, podobny
+        układ), więc dalsze trafienia (do PHASH_MAX_DISTANCE) sprawdzane są
+        z odczytem po OCR i blokują zapis tylko przy zgodnej sumie i liczbie pozycji.
+        
+        Raises:
+            DuplikatParagonu: gdy znaleziono duplikat
+        """
+        from db import DatabaseHelper
+        from services.blob_store import content_hash
+        config = Ekstrakcja.app.config if Ekstrakcja.app else {}
+        params = {'id_uzytkownika': id_uzytkownika, 'phash': obraz.dhash}
+        if odczyt is None:
+            warunek = "(p.obraz_hash = :obraz_hash OR BIT_COUNT(p.phash ^ :phash) <= :max_odleglosc)"
+            params['obraz_hash'] = content_hash(obraz.archiwum)
+            params['max_odleglosc'] = config.get('PHASH_EXACT_DISTANCE', 2)
+        else:
+            # Suma odcina większość kandydatów przed liczeniem pozycji
+            warunek = """BIT_COUNT(p.phash ^ :phash) <= :max_odleglosc
+                 AND ABS(p.suma - :suma) < 0.005
+                 AND (SELECT COUNT(*) FROM produkty pr WHERE pr.id_paragonu = p.id_paragonu) = :liczba_pozycji"""
+            params['max_odleglosc'] = config.get('PHASH_MAX_DISTANCE', 6)
+            params['suma'] = odczyt['suma']
+            params['liczba_pozycji'] = len(odczyt['data']['produkty'])
+        # BIT_COUNT nie korzysta z zakresu indeksu - liczony jest dla każdego paragonu użytkownika
+        # (id_uzytkownika zawęża skan)
+        wiersz = DatabaseHelper.fetch_one(
+            f"""SELECT p.id_paragonu, BIT_COUNT(p.phash ^ :phash) AS odleglosc
+               FROM paragony p
+               WHERE p.id_uzytkownika = :id_uzytkownika AND p.phash IS NOT NULL
+                 AND {warunek}
+               ORDER BY odleglosc, p.id_paragonu DESC
+               LIMIT 1""",
+            params
+        )
+        if wiersz:
+            raise DuplikatParagonu(wiersz['id_paragonu'], int(wiersz['odleglosc']))
+
+    # Funkcja związana z wyswietleniem wszystkich paragonow uzytkownika od id 1 ale tak ze z joinem z tabelą nazwa firmy
+    @staticmethod
+    def paragonik(img, id_uzytkownika, kluczDoGemini, wymus=False):
+        try:
+            obraz = image_pipeline.PreprocessedImage.z_danych(img)
+            # Pewny duplikat odrzucamy przed OCR, bliższe dopasowania dopiero przy zgodnej treści
+            # (wymus=True pomija oba sprawdzenia)
+            if not wymus:
+                Ekstrakcja.sprawdzDuplikat(obraz, id_uzytkownika)
+            obraz, odczyt = Ekstrakcja.odczytajParagon(obraz, kluczDoGemini)
+            if not wymus:
+                Ekstrakcja.sprawdzDuplikat(obraz, id_uzytkownika, odczyt)
+            return str(Ekstrakcja.zapiszParagon(obraz, odczyt, id_uzytkownika, kluczDoGemini))
+        except DuplikatParagonu:
+            raise
         except Exception as e:
             print(str(e))
             return str(e)
         
 
     @staticmethod
-    def klasyfikacjaKategorieJedna(data, kluczDoGemini):
-        from db import DatabaseHelper
-        # Zmiana zapytania, aby pobrać ID i nazwę kategorii
-        kategorie = DatabaseHelper.fetch_all("SELECT `id_kategorii`, `nazwa` FROM `kategorie`", {})
+    def klasyfikacjaKategorieJedna(data, kluczDoGemini, id_uzytkownika=None):
+        """
+        Przypisuje kategorie produktom poziomami: pamięć klasyfikacji
+        (ręczne poprawki użytkownika, tabela klasyfikacje_produktow + LRU), lokalny klasyfikator
+        (powyżej progu pewności), a tylko pozostałe nazwy (każda raz) Gemini
+        """
+        from services import reference_cache
+        from services.category_memo import memo, normalize_name
+        from services.local_classifier import tier
+        
+        start = time.perf_counter()
+        znane = memo.lookup_many((produkt['nazwa'] for produkt in data), id_uzytkownika)
+        nieznane = {}
+        for produkt in data:
+            nazwa = normalize_name(produkt['nazwa'])
+            id_kategorii = znane.get(nazwa)
+            nazwa_kategorii = reference_cache.kategorie.name_for(id_kategorii)
+            if nazwa_kategorii is not None:
+                produkt['id_kategorii'] = id_kategorii
+                produkt['nazwa_kategorii'] = nazwa_kategorii
+            else:
+                nieznane.setdefault(nazwa, []).append(produkt)
+        tier.zapisz_etap('memo', len(data), time.perf_counter() - start)
+        
+        print(f"Pamięć klasyfikacji: {len(data) - sum(len(p) for p in nieznane.values())}/{len(data)} produktów bez zapytania AI")
+        if not nieznane:
+            return data
+        
+        # Model lokalny: pewne odpowiedzi przyjmujemy, resztę pytamy Gemini
+        przyjete, odrzucone = tier.klasyfikuj(list(nieznane))
+        for nazwa, (id_kategorii, pewnosc) in przyjete.items():
+            nazwa_kategorii = reference_cache.kategorie.name_for(id_kategorii)
+            if nazwa_kategorii is None:
+                continue
+            for produkt in nieznane.pop(nazwa):
+                produkt['id_kategorii'] = id_kategorii
+                produkt['nazwa_kategorii'] = nazwa_kategorii
+        if przyjete:
+            print(f"Klasyfikator lokalny: {len(przyjete)}/{len(przyjete) + len(odrzucone)} nazw bez zapytania AI")
+        if not nieznane:
+            return data
+        
+        # Do AI trafia jeden reprezentant każdej nieznanej nazwy
+        reprezentanci = [produkty[0] for produkty in nieznane.values()]
+        start = time.perf_counter()
+        Ekstrakcja.klasyfikacjaKategoriiAI(reprezentanci, kluczDoGemini)
+        tier.zapisz_etap('gemini', len(reprezentanci), time.perf_counter() - start)
+        for nazwa, produkty in nieznane.items():
+            tier.zapisz_zgodnosc(odrzucone.get(nazwa, (None, 0.0))[0], produkty[0]['id_kategorii'])
+            for produkt in produkty[1:]:
+                produkt['id_kategorii'] = produkty[0]['id_kategorii']
+                produkt['nazwa_kategorii'] = produkty[0]['nazwa_kategorii']
+        
+        # Niepewnych odpowiedzi (TrudnoOkreslic) nie zapamiętujemy
+        memo.record_ai(
+            (produkt['nazwa'], produkt['id_kategorii'])
+            for produkt in reprezentanci
+            if produkt['nazwa_kategorii'] != "TrudnoOkreslic"
+        )
+        return data
+
+    @staticmethod
+    def klasyfikacjaKategoriiAI(data, kluczDoGemini):
+        from services import fuzzy_matcher, prompt_builder, reference_cache
+        # Słownik kategorii z cache procesu (ID i nazwa)
+        kategorie = reference_cache.kategorie.rows()
         
         # Znajdź domyślną kategorię "TrudnoOkreslic"
-        default_category_id = None
-        for kategoria in kategorie:
-            if kategoria['nazwa'] == "TrudnoOkreslic":
-                default_category_id = kategoria['id_kategorii']
-                break
+        default_category_id = reference_cache.kategorie.id_for("TrudnoOkreslic")
         
         # Jeśli nie ma kategorii "TrudnoOkreslic", użyj pierwszej dostępnej
         if default_category_id is None and len(kategorie) > 0:
@@ -444,112 +538,48 @@ class Ekstrakcja:
         if default_category_id is None:
             raise ValueError("BRAK KATEGORII W BAZIE DANYCH! Dodaj przynajmniej jedną kategorię.")
         
-        # Zrób joina do nazwa_kategorii z przecinkiem
-        nazwa_kategorii = ", ".join(kategoria['nazwa'] for kategoria in kategorie)
-        # Połącz wszystkie nazwy produktów z przecinkiem
-        nazwa_produktu = ", ".join(produkt['nazwa'] for produkt in data)
-        
-        # Ulepszone promptowanie z przykładami
-        system = f"""Skategoryzuj produkty z paragonu do jednej z mojej listy kategorii.
-Dostępne kategorie: {nazwa_kategorii}
-
-WAŻNE ZASADY:
-1. Zwróć TYLKO prawidłowy JSON w formacie: {{"1": "NazwaKategorii", "2": "NazwaKategorii", "3": "NazwaKategorii"}}
-2. Klucze to numery produktów (od 1), wartości to TYLKO nazwy kategorii
-3. NIE dodawaj nazw produktów do JSON
-4. NIE używaj zagnieżdżonych struktur
-5. Jeśli nie możesz określić kategorii, użyj "TrudnoOkreslic"
-
-PRZYKŁAD POPRAWNEGO FORMATU:
-{{"1": "Jedzenie", "2": "Napoje", "3": "TrudnoOkreslic", "4": "Alkohol"}}
-
-PRZYKŁAD BŁĘDNEGO FORMATU (NIE RÓB TAK):
-{{"1": "Produkt X": "Jedzenie"}} ❌
-{{"produkt1": "Jedzenie"}} ❌
-"""
-        prompt1 = f"Nazwy produktów do sklasyfikowania:\n{str(nazwa_produktu)}\n\nZwróć TYLKO JSON:"
-        
         print("=" * 80)
-        print("KLASYFIKACJA KATEGORII - PRÓBA")
+        print("KLASYFIKACJA KATEGORII")
         print("=" * 80)
-        print(f"Produkty: {nazwa_produktu}")
-        print(f"Dostępne kategorie: {nazwa_kategorii}")
+        print(f"Produkty: {', '.join(produkt['nazwa'] for produkt in data)}")
         
-        # Mechanizm ponawiania z maksymalnie 3 próbami
-        max_attempts = 3
-        klasyfikacje = None
+        # Długie paragony idą w paczkach; w każdej tylko kategorie mieszczące się w budżecie tokenów
+        szablon = """Skategoryzuj produkty z paragonu do jednej z mojej listy kategorii.
+Dostępne kategorie: {etykiety}
+Dla każdego produktu zwróć jego numer (nr) i nazwę kategorii. Jeśli nie możesz określić kategorii, użyj "TrudnoOkreslic".
+
+Produkty do sklasyfikowania:
+{produkty}"""
+        numerowane = list(enumerate(data, start=1))
+        klasyfikacje = {}
+        udane_paczki = 0
         
-        for attempt in range(1, max_attempts + 1):
-            print(f"\n--- PRÓBA {attempt}/{max_attempts} ---")
+        for paczka in prompt_builder.paczki(numerowane, lambda pozycja: pozycja[1]['nazwa']):
+            lista_produktow = "\n".join(f"{idx}. {produkt['nazwa']}" for idx, produkt in paczka)
+            prompt, etykiety = prompt_builder.zbuduj(
+                'kategorie', szablon, fuzzy_matcher.kategorie,
+                [produkt['nazwa'] for _, produkt in paczka], produkty=lista_produktow,
+            )
+            # Odpowiedź wymuszona schematem: lista {"nr", "kategoria"}, kategorie tylko z promptu
+            schema = receipt_schema.category_schema(etykiety)
+            print(f"Paczka {paczka[0][0]}-{paczka[-1][0]}: {len(etykiety)}/{len(kategorie)} kategorii, ~{prompt_builder.szacuj_tokeny(prompt)} tokenów")
             
-            try:
-                kategoria_klasyfikacja = str(Ekstrakcja.geminiAsk(prompt1 + system, 4192, kluczDoGemini))
-                print(f"Odpowiedź AI (próba {attempt}):")
-                print(kategoria_klasyfikacja)
-                
-                # Czyszczenie odpowiedzi
-                json_string = kategoria_klasyfikacja.strip()
-                # Usuń markdown code blocks
-                json_string = json_string.replace('```json\n', '').replace('```json', '')
-                json_string = json_string.replace('\n```', '').replace('```', '')
-                json_string = json_string.strip()
-                
-                # Jeśli zaczyna się od tekstu przed JSON, spróbuj znaleźć JSON
-                if not json_string.startswith('{'):
-                    # Szukaj pierwszego { i ostatniego }
-                    start_idx = json_string.find('{')
-                    end_idx = json_string.rfind('}')
-                    if start_idx != -1 and end_idx != -1:
-                        json_string = json_string[start_idx:end_idx+1]
-                
-                print(f"Oczyszczony JSON (próba {attempt}):")
-                print(json_string)
-                
-                # Próba parsowania
-                klasyfikacje = json.loads(json_string)
-                
-                # Walidacja struktury JSON
-                if not isinstance(klasyfikacje, dict):
-                    raise ValueError("Odpowiedź nie jest słownikiem")
-                
-                # Sprawdź czy klucze to liczby jako stringi
-                valid_keys = all(key.isdigit() for key in klasyfikacje.keys())
-                if not valid_keys:
-                    raise ValueError("Klucze nie są liczbami")
-                
-                # Sprawdź czy wartości to stringi (nazwy kategorii)
-                valid_values = all(isinstance(val, str) for val in klasyfikacje.values())
-                if not valid_values:
-                    raise ValueError("Wartości nie są stringami")
-                
-                print(f"✅ SUKCES! JSON poprawnie sparsowany w próbie {attempt}")
-                break  # Sukces - wyjdź z pętli
-                
-            except json.JSONDecodeError as e:
-                print(f"❌ JSON decode error (próba {attempt}): {e}")
-                if attempt < max_attempts:
-                    print(f"🔄 Ponawiam próbę... ({attempt + 1}/{max_attempts})")
-                    prompt1 = f"""POPRZEDNIA ODPOWIEDŹ BYŁA BŁĘDNA!
-
-Nazwy produktów do sklasyfikowania:
-{str(nazwa_produktu)}
-
-ZWRÓĆ TYLKO PROSTY JSON W FORMACIE:
-{{"1": "NazwaKategorii", "2": "NazwaKategorii", "3": "NazwaKategorii"}}
-
-BEZ ŻADNYCH DODATKOWYCH TEKSTÓW, BEZ NAZW PRODUKTÓW W JSONIE!
-"""
-                else:
-                    print(f"❌ Wszystkie {max_attempts} próby nieudane. Używam domyślnej kategorii.")
-                    klasyfikacje = None
-                    
-            except ValueError as e:
-                print(f"❌ Validation error (próba {attempt}): {e}")
-                if attempt < max_attempts:
-                    print(f"🔄 Ponawiam próbę... ({attempt + 1}/{max_attempts})")
-                else:
-                    print(f"❌ Wszystkie {max_attempts} próby nieudane. Używam domyślnej kategorii.")
-                    klasyfikacje = None
+            # Przy structured output błędy formatu są rzadkie - najwyżej jedna ponowna próba
+            max_attempts = 2
+            for attempt in range(1, max_attempts + 1):
+                try:
+                    kategoria_klasyfikacja = str(Ekstrakcja.geminiAsk(prompt, 4192, kluczDoGemini, schema))
+                    print(f"Odpowiedź AI (próba {attempt}):")
+                    print(kategoria_klasyfikacja)
+                    wynik = receipt_schema.parse('kategorie', kategoria_klasyfikacja, schema)
+                    klasyfikacje.update({str(pozycja['nr']): pozycja['kategoria'] for pozycja in wynik})
+                    udane_paczki += 1
+                    break
+                except receipt_schema.SchemaError as e:
+                    print(f"❌ Niepoprawna odpowiedź (próba {attempt}/{max_attempts}): {e}")
+        
+        if not udane_paczki:
+            klasyfikacje = None
         
         # Jeśli wszystkie próby zawiodły
         if klasyfikacje is None:
@@ -570,11 +600,7 @@ BEZ ŻADNYCH DODATKOWYCH TEKSTÓW, BEZ NAZW PRODUKTÓW W JSONIE!
             # Dodajemy kategorię na podstawie id produktu
             produkt['nazwa_kategorii'] = klasyfikacje.get(str(idx), "TrudnoOkreslic")
             # Szukaj ID dla tej kategorii
-            produkt['id_kategorii'] = None  # Resetuj dla każdego produktu
-            for kategoria in kategorie:
-                if produkt['nazwa_kategorii'] == kategoria['nazwa']:
-                    produkt['id_kategorii'] = kategoria['id_kategorii']
-                    break  # Znaleziono kategorię, przerwij pętlę
+            produkt['id_kategorii'] = reference_cache.kategorie.id_for(produkt['nazwa_kategorii'])
             # Jeśli nie znaleziono kategorii, ustaw domyślną
             if produkt['id_kategorii'] is None:
                 print(f"WARNING: Nie znaleziono kategorii '{produkt['nazwa_kategorii']}' dla produktu '{produkt['nazwa']}'. Używam domyślnej.")
@@ -619,41 +645,14 @@ BEZ ŻADNYCH DODATKOWYCH TEKSTÓW, BEZ NAZW PRODUKTÓW W JSONIE!
             return str(e)
         
     @staticmethod
-    def dodajParagon(id_uzytkownika, id_firmy, id_miasta, ulica, suma, sumaZOperacji, rabat, binary_data, auto_commit=True):
+    def dodajParagon(id_uzytkownika, id_firmy, id_miasta, ulica, suma, sumaZOperacji, rabat, binary_data, auto_commit=True, connection=None):
         from db import DatabaseHelper, db
         try:
-            # Maksymalna kompresja obrazu
-            compressed_data = None
-            max_width = 800  # Maksymalna szerokość obrazu (można dostosować)
-            max_height = 800  # Maksymalna wysokość obrazu (można dostosować)
-            quality = 50  # Jakość JPEG (im niższa, tym bardziej skompresowany obraz)
-            
-            with io.BytesIO(binary_data) as input_buffer:
-                with Image.open(input_buffer) as img:
-                    # Użycie EXIF do poprawy orientacji
-                    img = ImageOps.exif_transpose(img)
-                    
-                    # Konwersja do RGB PRZED zmianą rozmiaru i zapisem
-                    # RGBA (z przezroczystością) nie jest obsługiwane przez JPEG
-                    if img.mode in ('RGBA', 'LA', 'P'):
-                        # Tworzymy białe tło dla obrazów z przezroczystością
-                        background = Image.new('RGB', img.size, (255, 255, 255))
-                        if img.mode == 'P':
-                            img = img.convert('RGBA')
-                        background.paste(img, mask=img.split()[-1] if img.mode in ('RGBA', 'LA') else None)
-                        img = background
-                    elif img.mode != 'RGB':
-                        img = img.convert("RGB")
-
-                    # Zmiana rozmiaru (proporcjonalne skalowanie)
-                    img.thumbnail((max_width, max_height))
-
-                    # Kompresja do formatu JPEG z niższą jakością
-                    output_buffer = io.BytesIO()
-                    img.save(output_buffer, format="JPEG", quality=quality)
-                    compressed_data = output_buffer.getvalue()
+            # Maksymalna kompresja obrazu (800px, jakość 50) - z obrazu zdekodowanego w paragonik
+            obraz = image_pipeline.PreprocessedImage.z_danych(binary_data)
+            compressed_data = obraz.archiwum
             # WAGA KOMPRESJI
-            print(f"Rozmiar obrazu przed kompresją: {len(binary_data)} bajtów")
+            print(f"Rozmiar obrazu przed kompresją: {len(obraz.oryginal)} bajtów")
             print(f"Rozmiar obrazu po kompresji: {len(compressed_data)} bajtów")
             
             # Validate foreign keys before inserting
@@ -665,12 +664,16 @@ BEZ ŻADNYCH DODATKOWYCH TEKSTÓW, BEZ NAZW PRODUKTÓW W JSONIE!
             if id_miasta is None:
                 raise ValueError("id_miasta cannot be None. Make sure the city classification returned a valid ID.")
             
+            # Obraz trafia do magazynu plików, w wierszu zostaje tylko jego skrót SHA-256
+            from services.blob_store import get_blob_store
+            obraz_hash = get_blob_store().put(compressed_data, 'image/jpeg')
+            
             # Dodanie do bazy danych
             sql = """
                 INSERT INTO `paragony` (
                     `id_uzytkownika`, `id_firmy`, `id_miasta`, `ulica`, 
-                    `suma`, `sumaZOperacji`, `rabat`, `data_dodania`, `obraz`
-                ) VALUES (:id_uzytkownika, :id_firmy, :id_miasta, :ulica, :suma, :sumaZOperacji, :rabat, current_timestamp(), :obraz)
+                    `suma`, `sumaZOperacji`, `rabat`, `data_dodania`, `obraz_hash`, `phash`
+                ) VALUES (:id_uzytkownika, :id_firmy, :id_miasta, :ulica, :suma, :sumaZOperacji, :rabat, current_timestamp(), :obraz_hash, :phash)
             """
             val = {
                 'id_uzytkownika': id_uzytkownika,
@@ -680,9 +683,10 @@ BEZ ŻADNYCH DODATKOWYCH TEKSTÓW, BEZ NAZW PRODUKTÓW W JSONIE!
                 'suma': suma,
                 'sumaZOperacji': sumaZOperacji,
                 'rabat': rabat,
-                'obraz': compressed_data
+                'obraz_hash': obraz_hash,
+                'phash': obraz.dhash
             }
-            id_paragonu = DatabaseHelper.execute(sql, val, return_lastrowid=True)
+            id_paragonu = DatabaseHelper.execute(sql, val, return_lastrowid=True, connection=connection)
 
             if id_paragonu is None or int(id_paragonu) == 0:
                 raise Exception("Failed to get last insert ID for paragon")
@@ -724,106 +728,88 @@ BEZ ŻADNYCH DODATKOWYCH TEKSTÓW, BEZ NAZW PRODUKTÓW W JSONIE!
         }
         DatabaseHelper.execute(sql, val)
         return f"Produkt dodany o nazwie: {nazwa}"
-  
 
     @staticmethod
-    def geminiAsk(pytanie, max_tokens=100, kluczDoGemini=None):
-        if kluczDoGemini is None:
-            raise ValueError("API key (kluczDoGemini) is required")
-        genai.configure(api_key=kluczDoGemini)
-        safety_settings = [
-            {
-            "category": "HARM_CATEGORY_HARASSMENT",
-            "threshold": "BLOCK_NONE",
-            },
-            {
-            "category": "HARM_CATEGORY_HATE_SPEECH",
-            "threshold": "BLOCK_NONE",
-            },
-            {
-            "category": "HARM_CATEGORY_SEXUALLY_EXPLICIT",
-            "threshold": "BLOCK_NONE",
-            },
+    def dodajProduktyHurtowo(id_paragonu, produkty, connection=None):
+        """
+        Dodaje wszystkie pozycje paragonu jednym zapytaniem (executemany)
+        
+        Args:
+            id_paragonu: ID paragonu
+            produkty: Lista sklasyfikowanych produktów (z id_kategorii)
+            connection: Połączenie z DatabaseHelper.transaction() - zapis w transakcji paragonu
+            
+        Returns:
+            Liczba dodanych produktów
+        """
+        from db import DatabaseHelper
+        paragon_id = int(id_paragonu)
+        sql = "INSERT INTO `produkty` (`id_paragonu`, `nazwa`, `cena`, `cenajednostkowa`, `ilosc`, `jednostka`, `typ_podatku`, `id_kategorii`, `id_kodu`) VALUES (:id_paragonu, :nazwa, :cena, :cenajednostkowa, :ilosc, :jednostka, :podatek, :id_kategorii, :id_kodu)"
+        val = [
             {
-            "category": "HARM_CATEGORY_DANGEROUS_CONTENT",
-            "threshold": "BLOCK_NONE",
-            },
+                'id_paragonu': paragon_id,
+                'nazwa': produkt['nazwa'],
+                'cena': produkt['cena'],
+                'cenajednostkowa': produkt['cenajednostkowa'],
+                'ilosc': produkt['ilosc'],
+                'jednostka': produkt['jednostka'],
+                'podatek': produkt['podatek'],
+                'id_kategorii': produkt['id_kategorii'],
+                'id_kodu': 1  # Wartość domyślna dla nowo dodawanych produktów
+            }
+            for produkt in produkty
         ]
+        DatabaseHelper.execute_many(sql, val, connection=connection)
+        print(f"Dodano {len(val)} produktów do paragonu ID: {paragon_id}")
+        return len(val)
+  
 
-        generation_config = {
-            "temperature": 1,
-            "top_p": 0.95,
-            "top_k": 40,
-            "max_output_tokens": max_tokens
-        }
-
-        model = genai.GenerativeModel(
-            model_name="gemini-2.5-flash-lite",
-            safety_settings=safety_settings,
-            generation_config=generation_config,
-        )
-        response = model.generate_content([pytanie,], stream=False)
+    @staticmethod
+    def geminiAsk(pytanie, max_tokens=100, kluczDoGemini=None, response_schema=None):
+        if kluczDoGemini is None:
+            raise ValueError("API key (kluczDoGemini) is required")
+        # Ze schematem model zwraca wyłącznie JSON o zadanej strukturze
+        if response_schema is not None:
+            generation_config = receipt_schema.generation_config(response_schema, max_tokens)
+        else:
+            generation_config = llm_client.generation_config(max_tokens)
+        response = llm_client.pool.generate(kluczDoGemini, "gemini-2.5-flash-lite", [pytanie,], generation_config)
         return str(response.text)
     
     @staticmethod
     def klasyfikacjaFirmy(nazwa_firmyy, kluczDoGemini):
-        from db import DatabaseHelper
-        # Zmiana zapytania, aby pobrać ID i nazwę miasta
-        firmy = DatabaseHelper.fetch_all("SELECT `id_firmy`, `nazwa` FROM `firmy`", {})
+        from services import fuzzy_matcher, prompt_builder, reference_cache
         
-        # Tworzenie listy z miastami z bazy danych
-        #utworz dwie listy dla id i dla miast i wgraj dane z miasta
-        id_firmy = None
-        nazwa_firm = None
-        for firma in firmy:
-            id_firmy = firma['id_firmy']
-            nazwa_firm = firma['nazwa']
-            #zrob joina do nazwa_firm z przecinkiem
-        #zrob joina do nazwa_firm z przecinkiem
-        nazwa_firm = ", ".join(firma['nazwa'] for firma in firmy)
-        system = f"Skategoryzuj firme z paragonu do jednej z mojej listy [firm: {nazwa_firm}]. Zawsze zwracaj jakiś wynik! Jeżeli firme jest trudno określić to daj nazwe TrudnoOkreslic. Daj tylko nazwe firmy w tym formacie: {{\"nazwa\": \"Netto\"}}"
-        prompt1=f"Nazwa firmy z paragonu to: {str(nazwa_firmyy)}"
-        prompt=f"Skategoryzuj firme z paragonu {str(nazwa_firmyy)} do jednej z mojej listy [firm: {nazwa_firm}]. Zawsze zwracaj jakiś wynik! Jeżeli firme jest trudno określić to daj nazwe TrudnoOkreslic. Daj tylko nazwe firmy w tym formacie: {{\"nazwa\": \"Netto\"}}"
-        firma_klasyfikacja = str(Ekstrakcja.geminiAsk(prompt, 512, kluczDoGemini))
-        # daj mi załadowanie go do jsona ale pamietaj ze ma na poczatku '''json
+        # Lista firm ograniczona do kandydatów z indeksu lokalnego w limicie tokenów
+        szablon = "Skategoryzuj firme z paragonu {wejscie} do jednej z mojej listy [firm: {etykiety}]. Zawsze zwracaj jakiś wynik! Jeżeli firme jest trudno określić to daj nazwe TrudnoOkreslic. Daj tylko nazwe firmy w tym formacie: {{\"nazwa\": \"Netto\"}}"
+        prompt, _ = prompt_builder.zbuduj('firma', szablon, fuzzy_matcher.firmy, [str(nazwa_firmyy)], wejscie=str(nazwa_firmyy))
+        firma_klasyfikacja = str(Ekstrakcja.geminiAsk(prompt, 512, kluczDoGemini, receipt_schema.NAME_SCHEMA))
         print(firma_klasyfikacja)
-        json_string = firma_klasyfikacja.replace('```json\n', '').replace('\n```', '')
-        #nazwa_firmy = json.loads(json_string)['nazwa']
-        
         try:
-            nazwa_firmy = json.loads(json_string).get('nazwa', 'TrudnoOkreslic')
-        except json.JSONDecodeError:
+            nazwa_firmy = receipt_schema.parse('firma', firma_klasyfikacja, receipt_schema.NAME_SCHEMA)['nazwa']
+        except receipt_schema.SchemaError:
             nazwa_firmy = 'TrudnoOkreslic'
         
         #odpytaj dane firmy o id
-        id_firmy = None
-        for firma in firmy:
-            if nazwa_firmy == firma['nazwa']:
-                id_firmy = firma['id_firmy']
-                break
+        id_firmy = reference_cache.firmy.id_for(nazwa_firmy)
         
         if id_firmy is None:
             print(f"Warning: Company '{nazwa_firmy}' not found in database after AI classification")
             # Return ID for "TrudnoOkreslic"
-            for firma in firmy:
-                if firma['nazwa'] == 'TrudnoOkreslic':
-                    id_firmy = firma['id_firmy']
-                    break
+            id_firmy = reference_cache.firmy.id_for('TrudnoOkreslic')
         
         return id_firmy  # Zwracanie listy tupli (id, nazwa)
     
     @staticmethod
     def klasyfikacjaFirmyStart(nazwa_firmyy, kluczDoGemini):
-        from db import DatabaseHelper
-        # Retrieve company ID and name
-        firmy = DatabaseHelper.fetch_all("SELECT `id_firmy`, `nazwa` FROM `firmy`", {})
-        
-        id_firmy = None
-        # Check if the company exists in the database
-        for firma in firmy:
-            if nazwa_firmyy == firma['nazwa']:
-                id_firmy = firma['id_firmy']
-                break
+        from services import reference_cache, fuzzy_matcher
+        # Check if the company exists in the database (cached name -> id map)
+        id_firmy = reference_cache.firmy.id_for(nazwa_firmyy)
+
+        # Local fuzzy match ("LIDL SP. Z O.O. SP. K." -> "Lidl") before asking the AI
+        if id_firmy is None:
+            id_firmy, wynik, nazwa = fuzzy_matcher.firmy.match(nazwa_firmyy)
+            print(f"Dopasowanie lokalne firmy '{nazwa_firmyy}' -> '{nazwa}' (wynik {wynik:.2f}, {'przyjęte' if id_firmy else 'odrzucone'})")
 
         # If company not found, call klasyfikacjaFirmy
         if id_firmy is None:
@@ -837,52 +823,35 @@ BEZ ŻADNYCH DODATKOWYCH TEKSTÓW, BEZ NAZW PRODUKTÓW W JSONIE!
     
     @staticmethod
     def klasyfikacjaMiasta(nazwa_firmy, ulica, miastoo, kluczDoGemini):
-        from db import DatabaseHelper
-        miasta = DatabaseHelper.fetch_all("SELECT `id_miasta`, `nazwa` FROM `miasta` LIMIT 108", {})
+        from services import fuzzy_matcher, prompt_builder, reference_cache
         
-        id_miasta_list = []
-        nazwa_miasta_list = []
-        for miasto in miasta:
-            id_miasta_list.append(miasto['id_miasta'])
-            nazwa_miasta_list.append(miasto['nazwa'])
-
-        nazwa_miasta_str = ', '.join(nazwa_miasta_list)
-        system = f"Skategoryzuj miasto z paragonu do jednej z mojej listy [miast: {nazwa_miasta_str}]. Zawsze zwracaj jakiś wynik! Jeżeli miasto jest trudno określić to daj nazwe TrudnoOkreslic. Daj tylko nazwe w tym formacie: {{\"nazwa\": \"Bydgoszcz\"}}"
-        prompt1 = f"Nazwa miasta z paragonu to: {str(miastoo)}."
-        prompt = f"Skategoryzuj miasto z paragonu {str(miastoo)} do jednej z mojej listy [miast: {nazwa_miasta_str}]. Zawsze zwracaj jakiś wynik! Jeżeli miasto jest trudno określić to daj nazwe TrudnoOkreslic. Daj tylko nazwe w tym formacie: {{\"nazwa\": \"Bydgoszcz\"}}"
-        miasto_klasyfikacja = str(Ekstrakcja.geminiAsk(prompt1+system, 512, kluczDoGemini))
-        json_string = miasto_klasyfikacja.replace('```json\n', '').replace('\n```', '')
+        # Zamiast pierwszych 108 miast - kandydaci z indeksu lokalnego w limicie tokenów
+        szablon = "Nazwa miasta z paragonu to: {wejscie}.Skategoryzuj miasto z paragonu do jednej z mojej listy [miast: {etykiety}]. Zawsze zwracaj jakiś wynik! Jeżeli miasto jest trudno określić to daj nazwe TrudnoOkreslic. Daj tylko nazwe w tym formacie: {{\"nazwa\": \"Bydgoszcz\"}}"
+        prompt, _ = prompt_builder.zbuduj('miasto', szablon, fuzzy_matcher.miasta, [str(miastoo)], wejscie=str(miastoo))
+        miasto_klasyfikacja = str(Ekstrakcja.geminiAsk(prompt, 512, kluczDoGemini, receipt_schema.NAME_SCHEMA))
         try:
-            nazwa_miasta = json.loads(json_string).get('nazwa', 'TrudnoOkreslic')
-        except json.JSONDecodeError:
+            nazwa_miasta = receipt_schema.parse('miasto', miasto_klasyfikacja, receipt_schema.NAME_SCHEMA)['nazwa']
+        except receipt_schema.SchemaError:
             nazwa_miasta = 'TrudnoOkreslic'
         #odpytaj dane miasta o id
-        id_miasta = None
-        for miasto in miasta:
-            if nazwa_miasta == miasto['nazwa']:
-                id_miasta = miasto['id_miasta']
-                break
+        id_miasta = reference_cache.miasta.id_for(nazwa_miasta)
         
         if id_miasta is None:
             print(f"Warning: City '{nazwa_miasta}' not found in database after AI classification")
             # Return ID for "TrudnoOkreslic" or a default city
-            for miasto in miasta:
-                if miasto['nazwa'] == 'TrudnoOkreslic':
-                    id_miasta = miasto['id_miasta']
-                    break
+            id_miasta = reference_cache.miasta.id_for('TrudnoOkreslic')
         
         return id_miasta  # Zwracanie listy tupli (id, nazwa)
     
     @staticmethod
     def klasyfikacjaMiastaStart(nazwa_firmy, ulica, miastoo, kluczDoGemini):
-        from db import DatabaseHelper
-        miasta = DatabaseHelper.fetch_all("SELECT `id_miasta`, `nazwa` FROM `miasta`", {})
-        
-        id_miasta = None
-        for miasto in miasta:
-            if miastoo == miasto['nazwa']:
-                id_miasta = miasto['id_miasta']
-                break
+        from services import reference_cache, fuzzy_matcher
+        id_miasta = reference_cache.miasta.id_for(miastoo)
+
+        # Lokalne dopasowanie (wielkość liter, polskie znaki, dzielnice) przed zapytaniem AI
+        if id_miasta is None:
+            id_miasta, wynik, nazwa = fuzzy_matcher.miasta.match(miastoo)
+            print(f"Dopasowanie lokalne miasta '{miastoo}' -> '{nazwa}' (wynik {wynik:.2f}, {'przyjęte' if id_miasta else 'odrzucone'})")
 
         if id_miasta is None:
             print("Miasto nie jest w bazie danych")
@@ -927,23 +896,7 @@ BEZ ŻADNYCH DODATKOWYCH TEKSTÓW, BEZ NAZW PRODUKTÓW W JSONIE!
             print(f"DEBUG PobierzSugestieDania: START dla paragonu ID: {id_paragonu}")
             print(f"DEBUG: API Key length: {len(kluczDoGemini) if kluczDoGemini else 0}")
             
-            # Configure Gemini API
-            genai.configure(api_key=kluczDoGemini)
-            
-            # Bezpieczne ustawienia modelu
-            safety_settings = [
-                {"category": "HARM_CATEGORY_HARASSMENT", "threshold": "BLOCK_NONE"},
-                {"category": "HARM_CATEGORY_HATE_SPEECH", "threshold": "BLOCK_NONE"},
-                {"category": "HARM_CATEGORY_SEXUALLY_EXPLICIT", "threshold": "BLOCK_NONE"},
-                {"category": "HARM_CATEGORY_DANGEROUS_CONTENT", "threshold": "BLOCK_NONE"},
-            ]
-
-            generation_config = {
-                "temperature": 1,
-                "top_p": 0.95,
-                "top_k": 40,
-                "max_output_tokens": 8192
-            }
+            generation_config = llm_client.generation_config(8192)
 
             # Pobieranie produktów z bazy danych
             print(f"DEBUG: Wykonuję zapytanie SQL dla paragonu {id_paragonu}")
@@ -963,11 +916,6 @@ BEZ ŻADNYCH DODATKOWYCH TEKSTÓW, BEZ NAZW PRODUKTÓW W JSONIE!
             products = [item['nazwa_produktu'] for item in produkty]
             print(f"DEBUG: Lista produktów dla Gemini ({len(products)} items): {products}")
 
-            model = genai.GenerativeModel(
-                model_name="gemini-2.5-flash",
-                safety_settings=safety_settings,
-                generation_config=generation_config,
-            )
             print(f"DEBUG: Wysyłam zapytanie do Gemini: {products}")
             prompt = """
                 Na podstawie dostarczonych produktów z paragonu, zaproponuj 3 unikalne dania, które mogę przygotować z tych składników. (sol i pieprz przewaznie sa w domu)
@@ -990,7 +938,7 @@ BEZ ŻADNYCH DODATKOWYCH TEKSTÓW, BEZ NAZW PRODUKTÓW W JSONIE!
             """
             prompt += ', '.join(products)
             #print(f"DEBUG: Wysłano zapytanie do Gemini: {prompt}")
-            response = model.generate_content(prompt, stream=False)
+            response = llm_client.pool.generate(kluczDoGemini, "gemini-2.5-flash", prompt, generation_config)
             #print(f"DEBUG: Otrzymano odpowiedź od Gemini: {response.text}")
 
             # Parsowanie odpowiedzi JSON
@@ -1023,22 +971,7 @@ BEZ ŻADNYCH DODATKOWYCH TEKSTÓW, BEZ NAZW PRODUKTÓW W JSONIE!
             print(f"DEBUG UtworzPrzepisDania: id_paragonu={id_paragonu}, dish={Dish_name}")
             print(f"DEBUG: API Key length: {len(kluczDoGemini) if kluczDoGemini else 0}")
             
-            # Configure Gemini API
-            genai.configure(api_key=kluczDoGemini)
-            
-            safety_settings = [
-                {"category": "HARM_CATEGORY_HARASSMENT", "threshold": "BLOCK_NONE"},
-                {"category": "HARM_CATEGORY_HATE_SPEECH", "threshold": "BLOCK_NONE"},
-                {"category": "HARM_CATEGORY_SEXUALLY_EXPLICIT", "threshold": "BLOCK_NONE"},
-                {"category": "HARM_CATEGORY_DANGEROUS_CONTENT", "threshold": "BLOCK_NONE"},
-            ]
-
-            generation_config = {
-                "temperature": 1,
-                "top_p": 0.95,
-                "top_k": 40,
-                "max_output_tokens": 8192
-            }
+            generation_config = llm_client.generation_config(8192)
 
             # Pobieranie produktów z bazy danych
             print("DEBUG: Wykonuję zapytanie do bazy danych o produkty")
@@ -1057,11 +990,6 @@ BEZ ŻADNYCH DODATKOWYCH TEKSTÓW, BEZ NAZW PRODUKTÓW W JSONIE!
             print(f"DEBUG: Przygotowane produkty dla Gemini: {products}")
 
             # Generowanie treści za pomocą Gemini
-            model = genai.GenerativeModel(
-                model_name="gemini-2.5-flash",
-                safety_settings=safety_settings,
-                generation_config=generation_config,
-            )
             print(f"DEBUG: Wysyłam zapytanie do Gemini: {products}")
             prompt = f"""
 Jesteś ekspertem kulinarnym. Stwórz szczegółowy przepis na danie w formacie JSON.
@@ -1105,7 +1033,7 @@ WAŻNE:
 - Kroki powinny być jasne i szczegółowe
 - Wskazówki mogą zawierać emotikonę na początku (np. 💡, 🔥, 👨‍🍳)
 """
-            response = model.generate_content(prompt, stream=False)
+            response = llm_client.pool.generate(kluczDoGemini, "gemini-2.5-flash", prompt, generation_config)
             print(f"DEBUG: Otrzymano przepis od Gemini, długość: {len(response.text) if response.text else 0}")
             
             # Parse JSON response
@@ -1157,23 +1085,7 @@ WAŻNE:
             print(f"DEBUG AnalizaZdrowotosciPosilku: START dla paragonu ID: {id_paragonu}")
             print(f"DEBUG: API Key length: {len(kluczDoGemini) if kluczDoGemini else 0}")
             
-            # Configure Gemini API
-            genai.configure(api_key=kluczDoGemini)
-            
-            # Bezpieczne ustawienia modelu
-            safety_settings = [
-                {"category": "HARM_CATEGORY_HARASSMENT", "threshold": "BLOCK_NONE"},
-                {"category": "HARM_CATEGORY_HATE_SPEECH", "threshold": "BLOCK_NONE"},
-                {"category": "HARM_CATEGORY_SEXUALLY_EXPLICIT", "threshold": "BLOCK_NONE"},
-                {"category": "HARM_CATEGORY_DANGEROUS_CONTENT", "threshold": "BLOCK_NONE"},
-            ]
-
-            generation_config = {
-                "temperature": 1,
-                "top_p": 0.95,
-                "top_k": 40,
-                "max_output_tokens": 8192
-            }
+            generation_config = llm_client.generation_config(8192)
 
             # Pobieranie produktów z bazy danych
             print(f"DEBUG: Wykonuję zapytanie SQL dla paragonu {id_paragonu}")
@@ -1194,11 +1106,6 @@ WAŻNE:
             products = [item['nazwa_produktu'] for item in produkty]
             print(f"DEBUG: Lista produktów dla Gemini ({len(products)} items): {products}")
 
-            model = genai.GenerativeModel(
-                model_name="gemini-2.5-flash",
-                safety_settings=safety_settings,
-                generation_config=generation_config,
-            )
             
             prompt = f"""
 Wykonaj szczegółową analizę zdrowotności posiłku na podstawie dostarczonych produktów.
@@ -1249,7 +1156,7 @@ WAŻNE:
 """
             
             print(f"DEBUG: Wysyłam zapytanie do Gemini")
-            response = model.generate_content(prompt, stream=False)
+            response = llm_client.pool.generate(kluczDoGemini, "gemini-2.5-flash", prompt, generation_config)
             print(f"DEBUG: Otrzymano odpowiedź od Gemini, długość: {len(response.text) if response.text else 0}")
 
             # Parsowanie odpowiedzi JSON
@@ -1299,23 +1206,7 @@ WAŻNE:
             print(f"DEBUG RekomendacjeSezonowosci: START dla paragonu ID: {id_paragonu}")
             print(f"DEBUG: API Key length: {len(kluczDoGemini) if kluczDoGemini else 0}")
             
-            # Configure Gemini API
-            genai.configure(api_key=kluczDoGemini)
-            
-            # Bezpieczne ustawienia modelu
-            safety_settings = [
-                {"category": "HARM_CATEGORY_HARASSMENT", "threshold": "BLOCK_NONE"},
-                {"category": "HARM_CATEGORY_HATE_SPEECH", "threshold": "BLOCK_NONE"},
-                {"category": "HARM_CATEGORY_SEXUALLY_EXPLICIT", "threshold": "BLOCK_NONE"},
-                {"category": "HARM_CATEGORY_DANGEROUS_CONTENT", "threshold": "BLOCK_NONE"},
-            ]
-
-            generation_config = {
-                "temperature": 1,
-                "top_p": 0.95,
-                "top_k": 40,
-                "max_output_tokens": 8192
-            }
+            generation_config = llm_client.generation_config(8192)
 
             # Pobieranie produktów z bazy danych
             print(f"DEBUG: Wykonuję zapytanie SQL dla paragonu {id_paragonu}")
@@ -1336,11 +1227,6 @@ WAŻNE:
             products = [item['nazwa_produktu'] for item in produkty]
             print(f"DEBUG: Lista produktów dla Gemini ({len(products)} items): {products}")
 
-            model = genai.GenerativeModel(
-                model_name="gemini-2.5-flash",
-                safety_settings=safety_settings,
-                generation_config=generation_config,
-            )
             
             prompt = f"""
 Wykonaj analizę sezonowości produktów na podstawie dostarczonych danych.
@@ -1406,7 +1292,7 @@ WAŻNE:
 """
             
             print(f"DEBUG: Wysyłam zapytanie do Gemini")
-            response = model.generate_content(prompt, stream=False)
+            response = llm_client.pool.generate(kluczDoGemini, "gemini-2.5-flash", prompt, generation_config)
             print(f"DEBUG: Otrzymano odpowiedź od Gemini, długość: {len(response.text) if response.text else 0}")
 
             # Parsowanie odpowiedzi JSON
@@ -16,6 +16,7 @@ from ekstrakcja import Ekstrakcja
 from flask_cors import CORS
 from config import get_config
 from db import db
+from services.cli import register_commands
 
 # Initialize Flask app with template and static folders
 app = Flask(__name__, 
@@ -32,7 +33,8 @@ app.config['JSON_SORT_KEYS'] = False
 app.config['JSONIFY_MIMETYPE'] = 'application/json; charset=utf-8'
 
 # Enable CORS for all routes - Simple configuration
-CORS(app, origins=app.config['CORS_ORIGINS'], supports_credentials=True, allow_headers=["Content-Type", "Authorization"])
+CORS(app, origins=app.config['CORS_ORIGINS'], supports_credentials=True, allow_headers=["Content-Type", "Authorization"],
+     expose_headers=["X-Next-Cursor"])
 
 # Initialize extensions
 db.init_app(app)
@@ -45,6 +47,7 @@ app.register_blueprint(api_bp, url_prefix='/')
 # Virtual Assistant API
 app.register_blueprint(assistant_bp, url_prefix='/')
 Ekstrakcja.init_app(app)
+register_commands(app)
 
 # ============================================================================
 # Frontend Routes - Hostowanie aplikacji SPA
@@ -90,7 +93,9 @@ def catch_all(path):
         'PobierzSugestieDania', 'UtworzPrzepisDania', 'AnalizaZdrowotosciPosilku',  # AI features
         'RekomendacjeSezonowosci',
         'assistant',  # assistant routes
-        'analyze-receipt'  # receipt analysis
+        'analyze-receipt',  # receipt analysis
+        'import',  # batch receipt import
+        'metryki'  # process metrics
     ]
     
     # Sprawdź, czy ścieżka zaczyna się od znanego endpointu API
@@ -0,0 +1,13 @@
+-- Pamięć klasyfikacji produktów: znormalizowana nazwa -> kategoria
+-- (services/category_memo.py). Dla istniejących baz:
+--   mysql -u root -p paragony < migrations/001_klasyfikacje_produktow.sql
+
+CREATE TABLE IF NOT EXISTS `klasyfikacje_produktow` (
+  `nazwa_znormalizowana` varchar(255) NOT NULL,
+  `id_kategorii` int(11) NOT NULL,
+  `zrodlo` enum('ai','manual') NOT NULL DEFAULT 'ai',
+  `data_aktualizacji` timestamp NOT NULL DEFAULT current_timestamp() ON UPDATE current_timestamp(),
+  PRIMARY KEY (`nazwa_znormalizowana`),
+  KEY `fk_klasyfikacje_kategoria` (`id_kategorii`),
+  CONSTRAINT `klasyfikacje_produktow_ibfk_1` FOREIGN KEY (`id_kategorii`) REFERENCES `kategorie` (`id_kategorii`) ON DELETE CASCADE ON UPDATE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci;
@@ -0,0 +1,6 @@
+-- Obrazy paragonów w magazynie plików (services/blob_store.py): w wierszu
+-- zostaje tylko skrót SHA-256. Po zastosowaniu przenieś istniejące obrazy:
+--   flask --app main migrate-images
+
+ALTER TABLE `paragony`
+  ADD COLUMN `obraz_hash` char(64) DEFAULT NULL AFTER `obraz`;
@@ -0,0 +1,15 @@
+-- Warianty obrazów paragonów (services/renditions.py): miniatura, podgląd
+-- i zarchiwizowany oryginał w kilku formatach (JPEG/WebP/AVIF).
+
+CREATE TABLE IF NOT EXISTS `paragony_obrazy` (
+  `id_paragonu` int(11) NOT NULL,
+  `wariant` enum('thumb','medium','original') NOT NULL,
+  `format` varchar(8) NOT NULL,
+  `obraz_hash` char(64) NOT NULL,
+  `szerokosc` int(11) DEFAULT NULL,
+  `wysokosc` int(11) DEFAULT NULL,
+  `rozmiar` int(11) DEFAULT NULL,
+  `data_utworzenia` timestamp NOT NULL DEFAULT current_timestamp(),
+  PRIMARY KEY (`id_paragonu`, `wariant`, `format`),
+  CONSTRAINT `paragony_obrazy_ibfk_1` FOREIGN KEY (`id_paragonu`) REFERENCES `paragony` (`id_paragonu`) ON DELETE CASCADE ON UPDATE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci;
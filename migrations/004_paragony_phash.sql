@@ -0,0 +1,7 @@
+-- Skrót percepcyjny (dHash, 64 bity) obrazu paragonu do wykrywania ponownie
+-- przesłanych paragonów przed OCR. Po zastosowaniu uzupełnij istniejące wiersze:
+--   flask --app main backfill-phash
+
+ALTER TABLE `paragony`
+  ADD COLUMN `phash` bigint(20) UNSIGNED DEFAULT NULL AFTER `obraz_hash`,
+  ADD KEY `paragony_uzytkownik_phash` (`id_uzytkownika`, `phash`);
@@ -0,0 +1,22 @@
+-- Agregaty wydatków (services/rollups.py): suma produktów per użytkownik/dzień/kategoria
+-- i suma paragonów per użytkownik/miesiąc/sklep. Po zastosowaniu wypełnij je:
+--   flask --app main rebuild-rollups
+
+CREATE TABLE IF NOT EXISTS `wydatki_dzien_kategoria` (
+  `id_uzytkownika` int(11) NOT NULL,
+  `dzien` date NOT NULL,
+  `id_kategorii` int(11) NOT NULL,
+  `suma` decimal(12,2) NOT NULL DEFAULT 0.00,
+  `liczba_produktow` int(11) NOT NULL DEFAULT 0,
+  PRIMARY KEY (`id_uzytkownika`, `dzien`, `id_kategorii`),
+  KEY `wydatki_dzien_kategoria_kategoria` (`id_uzytkownika`, `id_kategorii`, `dzien`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci;
+
+CREATE TABLE IF NOT EXISTS `wydatki_miesiac_sklep` (
+  `id_uzytkownika` int(11) NOT NULL,
+  `miesiac` date NOT NULL,
+  `id_firmy` int(11) NOT NULL,
+  `suma` decimal(12,2) NOT NULL DEFAULT 0.00,
+  `liczba_paragonow` int(11) NOT NULL DEFAULT 0,
+  PRIMARY KEY (`id_uzytkownika`, `miesiac`, `id_firmy`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci;
@@ -0,0 +1,18 @@
+-- Indeksy złożone pod filtry raportów. Zakresy dat są przepisywane na
+-- półotwarte (DatabaseHelper.sargable_dates), więc mogą korzystać z indeksu
+-- (użytkownik, data). (id_paragonu, id_kategorii, cena) pokrywa sumy
+-- produktów per kategoria bez czytania wierszy. Stare indeksy jednokolumnowe
+-- są prefiksami nowych (obsługują też klucze obce), więc je usuwamy.
+-- Sprawdzenie planów zapytań: flask --app main explain-queries
+
+ALTER TABLE `paragony`
+  ADD KEY `paragony_uzytkownik_data` (`id_uzytkownika`, `data_dodania`),
+  DROP KEY `Paragony_fk1`;
+
+ALTER TABLE `produkty`
+  ADD KEY `produkty_paragon_kategoria_cena` (`id_paragonu`, `id_kategorii`, `cena`),
+  DROP KEY `Produkty_fk1`;
+
+ALTER TABLE `logi`
+  ADD KEY `logi_uzytkownik_czas` (`id_uzytkownika`, `timestamp`),
+  DROP KEY `fk_logi_uzytkownik`;
@@ -0,0 +1,11 @@
+-- Filtry listy logów (/logi): indeksy złożone pod akcję i status w obrębie
+-- użytkownika (sortowanie po czasie czytane z indeksu) oraz indeks FULLTEXT
+-- na details zamiast LIKE '%...%', który zawsze skanował wszystkie logi
+-- użytkownika. Partycjonowanie czasowe odpada: partycjonowana tabela InnoDB
+-- nie może mieć klucza obcego (logi_ibfk_1) ani indeksu FULLTEXT - rozmiar
+-- tabeli ogranicza archiwizacja: flask --app main archive-logs
+
+ALTER TABLE `logi`
+  ADD KEY `logi_uzytkownik_akcja_czas` (`id_uzytkownika`, `action`, `timestamp`),
+  ADD KEY `logi_uzytkownik_status_czas` (`id_uzytkownika`, `user_status_at_log`, `timestamp`),
+  ADD FULLTEXT KEY `logi_details_ft` (`details`);
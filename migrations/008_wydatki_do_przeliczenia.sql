@@ -0,0 +1,10 @@
+-- Komórki agregatów wydatków, których przeliczenie po zmianie paragonu się nie
+-- powiodło (np. blokada, deadlock). services/rollups.py przelicza je ponownie
+-- przy następnym odczycie raportów użytkownika albo przy kolejnej zmianie.
+
+CREATE TABLE IF NOT EXISTS `wydatki_do_przeliczenia` (
+  `id_uzytkownika` int(11) NOT NULL,
+  `dzien` date NOT NULL,
+  `oznaczono` timestamp NOT NULL DEFAULT current_timestamp(),
+  PRIMARY KEY (`id_uzytkownika`, `dzien`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci;
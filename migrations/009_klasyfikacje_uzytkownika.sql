@@ -0,0 +1,24 @@
+-- Ręczne poprawki kategorii są zapisywane per użytkownik. Do wspólnej pamięci
+-- (zrodlo='manual') trafiają dopiero, gdy tę samą kategorię dla nazwy wybierze
+-- CATEGORY_MANUAL_AGREEMENT użytkowników (services/category_memo.py).
+-- Dotychczasowe wspólne wpisy 'manual' pochodzą od pojedynczych użytkowników,
+-- więc wracają do 'ai' (mogą je nadpisać kolejne decyzje modelu).
+-- Nazwy są już znormalizowane (casefold), więc porównujemy je binarnie -
+-- utf8mb4_general_ci utożsamiał nazwy różniące się tylko znakami diakrytycznymi.
+
+ALTER TABLE `klasyfikacje_produktow`
+  MODIFY `nazwa_znormalizowana` varchar(255) COLLATE utf8mb4_bin NOT NULL;
+
+UPDATE `klasyfikacje_produktow` SET `zrodlo` = 'ai' WHERE `zrodlo` = 'manual';
+
+CREATE TABLE IF NOT EXISTS `klasyfikacje_uzytkownika` (
+  `id_uzytkownika` int(11) NOT NULL,
+  `nazwa_znormalizowana` varchar(255) COLLATE utf8mb4_bin NOT NULL,
+  `id_kategorii` int(11) NOT NULL,
+  `data_aktualizacji` timestamp NOT NULL DEFAULT current_timestamp() ON UPDATE current_timestamp(),
+  PRIMARY KEY (`id_uzytkownika`, `nazwa_znormalizowana`),
+  KEY `klasyfikacje_uzytkownika_nazwa` (`nazwa_znormalizowana`, `id_kategorii`),
+  KEY `fk_klasyfikacje_uzytkownika_kategoria` (`id_kategorii`),
+  CONSTRAINT `klasyfikacje_uzytkownika_ibfk_1` FOREIGN KEY (`id_uzytkownika`) REFERENCES `uzytkownicy` (`id_uzytkownika`) ON DELETE CASCADE ON UPDATE CASCADE,
+  CONSTRAINT `klasyfikacje_uzytkownika_ibfk_2` FOREIGN KEY (`id_kategorii`) REFERENCES `kategorie` (`id_kategorii`) ON DELETE CASCADE ON UPDATE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci;
@@ -3,28 +3,39 @@
 API routes - obsługuje wszystkie endpointy API
 Obsługuje polskie znaki: ą, ć, ę, ł, ń, ó, ś, ź, ż
 """
-from flask import Blueprint, request, jsonify, current_app
+from flask import Blueprint, request, jsonify, current_app, send_file, after_this_request
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from api import Api, log_user_action, get_user_status
 import ssl
 import base64
+import binascii
 import json
-from ekstrakcja import Ekstrakcja
+import shutil
+import tempfile
+from ekstrakcja import Ekstrakcja, DuplikatParagonu
+from services.job_queue import get_receipt_queue
+from services.batch_import import get_batch_importer
+from services import metrics, pagination
 
 ssl._create_default_https_context = ssl._create_unverified_context
 
 api_bp = Blueprint('api', __name__)
 
 # Operacja związana z przetworzeniem obrazu z wykorzystaniem OCR 
-# /paragony?page={currentPage}&size={PageSize}
+# /paragony?cursor={nextCursor}&size={PageSize} (kursor '' = pierwsza strona)
+# /paragony?page={currentPage}&size={PageSize} - dawne stronicowanie OFFSET
 @api_bp.route('/paragony', methods=['GET', 'POST'])
 @jwt_required()
 def paragony():
     sesja = get_jwt_identity()
     currentPage = request.args.get('page', default=0, type=int)
     pageSize = request.args.get('size', default=7, type=int)
+    cursor = request.args.get('cursor', default=None, type=str)
     id_uzytkownika = sesja['id_uzytkownika']
-    return Api.paragony(id_uzytkownika, currentPage, pageSize)
+    try:
+        return Api.paragony(id_uzytkownika, currentPage, pageSize, cursor)
+    except pagination.NieprawidlowyKursor as e:
+        return jsonify(error=str(e)), 400
 
 @api_bp.route('/paragon/<parametr>', methods=['GET', 'POST'])
 @jwt_required()
@@ -32,7 +43,43 @@ def paragon(parametr):
     id_paragonu = parametr
     sesja = get_jwt_identity()
     id_uzytkownika = sesja['id_uzytkownika']
-    return Api.paragon(id_uzytkownika, id_paragonu)
+    # ?include=image - dołącz obraz jako base64 (domyślnie tylko obraz_url)
+    include = [pole.strip() for pole in request.args.get('include', '').split(',')]
+    return Api.paragon(id_uzytkownika, id_paragonu, include_image='image' in include)
+
+@api_bp.route('/paragon/<parametr>/obraz', methods=['GET'])
+@jwt_required()
+def paragon_obraz(parametr):
+    """
+    Obraz paragonu wysyłany strumieniem - obsługuje ETag / If-None-Match i Range
+    
+    Query:
+        wariant: thumb | medium | original (domyślnie obraz główny 800px)
+    Format (JPEG / WebP / AVIF) wybierany jest na podstawie nagłówka Accept.
+    """
+    try:
+        sesja = get_jwt_identity()
+        wariant = request.args.get('wariant')
+        if wariant not in (None, 'thumb', 'medium', 'original'):
+            return jsonify({'status': 'error', 'message': 'Nieznany wariant obrazu'}), 400
+        obraz = Api.obrazParagonu(sesja['id_uzytkownika'], parametr, wariant, request.headers.get('Accept'))
+        if obraz is None:
+            return jsonify({'status': 'error', 'message': 'Brak obrazu paragonu'}), 404
+        etag, zrodlo, mimetype = obraz
+        response = send_file(
+            zrodlo,
+            mimetype=mimetype,
+            download_name=f"paragon_{parametr}.{mimetype.split('/')[-1]}",
+            conditional=True,
+            etag=etag,
+        )
+        # Obraz jest prywatny (za JWT) - tylko cache przeglądarki, z rewalidacją po ETag
+        response.headers['Cache-Control'] = 'private, max-age=86400'
+        response.vary.add('Accept')
+        return response
+    except Exception as e:
+        print(e)
+        return jsonify(error=str(e)), 500
 
 @api_bp.route('/paragonUpdate/<parametr>', methods=['PUT'])
 @jwt_required()
@@ -52,8 +99,9 @@ def produkty(parametr):
 @api_bp.route('/produktyUpdate/<parametr>', methods=['PUT'])
 @jwt_required()
 def update_produkt(parametr):
+    sesja = get_jwt_identity()
     data = request.get_json()
-    return Api.update_produkt(parametr, data)
+    return Api.update_produkt(parametr, data, sesja['id_uzytkownika'])
 
 @api_bp.route('/paragonDelete/<parametr>', methods=['DELETE'])
 @jwt_required()
@@ -65,14 +113,72 @@ def paragonDelete(parametr):
 def produktDelete(parametr):
     return Api.kasujProdukt(parametr)
 
+# Obrazy do tego rozmiaru zostają w pamięci, większe trafiają do pliku tymczasowego
+UPLOAD_SPOOL_MAX_SIZE = 1024 * 1024
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
+
+def _dekodujBase64(obraz, pole):
+    """Dekoduje obraz base64 z JSON-a; ValueError (-> 400) dla braku, złego typu lub uszkodzonych danych"""
+    if not isinstance(obraz, str) or not obraz:
+        raise ValueError(f"Brak obrazu base64 w polu '{pole}'")
+    try:
+        dane = base64.b64decode(obraz)
+    except binascii.Error as e:
+        raise ValueError(f"Nieprawidłowy base64 w polu '{pole}': {e}")
+    if not dane:
+        raise ValueError(f"Pusty obraz w polu '{pole}'")
+    return dane
+
+
+def _obrazZZadania():
+    """
+    Odczytuje obraz paragonu z żądania w jednym z trzech formatów:
+    - multipart/form-data z plikiem w polu 'image' (Werkzeug zapisuje go strumieniowo)
+    - surowe body (Content-Type: image/* lub application/octet-stream)
+    - JSON {"image": "<base64>"} - dotychczasowy kontrakt
+    
+    Returns:
+        (obraz, rozmiar, parametry) - obraz to plik tymczasowy albo bajty,
+        parametry to słownik z pola formularza / JSON (np. async)
+    
+    Raises:
+        ValueError: brak obrazu albo nieobsługiwany format body (trasa zwraca 400)
+    """
+    if request.mimetype == 'multipart/form-data':
+        plik = request.files.get('image')
+        if plik is None:
+            raise ValueError("Brak pliku w polu 'image'")
+        return plik.stream, request.content_length or 0, request.form
+    if request.mimetype.startswith('image/') or request.mimetype == 'application/octet-stream':
+        # Body kopiowane porcjami - rozmiar ogranicza MAX_CONTENT_LENGTH (413)
+        bufor = tempfile.SpooledTemporaryFile(max_size=UPLOAD_SPOOL_MAX_SIZE)
+        @after_this_request
+        def _zamknijBufor(response):
+            bufor.close()
+            return response
+        shutil.copyfileobj(request.stream, bufor, UPLOAD_CHUNK_SIZE)
+        rozmiar = bufor.tell()
+        if not rozmiar:
+            raise ValueError("Puste body żądania")
+        bufor.seek(0)
+        return bufor, rozmiar, {}
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        raise ValueError("Oczekiwano pliku (multipart 'image'), obrazu w body albo JSON {\"image\": \"<base64>\"}")
+    base64_image = data.get('image')
+    # Dekodujemy base64 raz - dalej przekazywane są surowe bajty pliku
+    return _dekodujBase64(base64_image, 'image'), len(base64_image), data
+
+
 @api_bp.route('/analyze-receipt', methods=['POST','GET'])
 @jwt_required()
 def analyze_receipt():
     try:
-        data = request.json
-        base64_image = data.get('image')
-        image_data = base64.b64decode(base64_image)
-        image_data = base64.b64encode(image_data)
+        image_data, image_size, data = _obrazZZadania()
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    try:
         sesja = get_jwt_identity()
         id_uzytkownika = sesja['id_uzytkownika']
         kluczDoGemini = sesja['apiKlucz']
@@ -84,14 +190,46 @@ def analyze_receipt():
             id_uzytkownika,
             "scan_receipt_start",
             user_status,
-            json.dumps({"image_size": len(base64_image) if base64_image else 0}, ensure_ascii=False)
+            json.dumps({"image_size": image_size}, ensure_ascii=False)
         )
         
         # Use environment variable as fallback when user key is not provided
         if not kluczDoGemini or len(kluczDoGemini) < 10:
             kluczDoGemini = current_app.config.get('GEMINI_API_KEY', '')
         
-        response_text = Ekstrakcja.paragonik(image_data, id_uzytkownika, kluczDoGemini)
+        # Tryb kolejki: zapisz obraz, zwróć ID zadania, OCR wykona wątek roboczy
+        tryb_async = request.args.get('async', default=0, type=int) or str(data.get('async', '')).lower() in ('1', 'true')
+        # ?force=1 - zapisz mimo wykrytego duplikatu
+        wymus = bool(request.args.get('force', default=0, type=int)) or str(data.get('force', '')).lower() in ('1', 'true')
+        if tryb_async:
+            kolejka = get_receipt_queue(current_app._get_current_object())
+            job_id = kolejka.enqueue(id_uzytkownika, image_data, kluczDoGemini, force=wymus)
+            log_user_action(
+                id_uzytkownika,
+                "scan_receipt_queued",
+                user_status,
+                json.dumps({"job_id": job_id}, ensure_ascii=False)
+            )
+            return jsonify({
+                'status': 'queued',
+                'job_id': job_id,
+                'status_url': f'/analyze-receipt/jobs/{job_id}'
+            }), 202
+        
+        try:
+            response_text = Ekstrakcja.paragonik(image_data, id_uzytkownika, kluczDoGemini, wymus=wymus)
+        except DuplikatParagonu as e:
+            log_user_action(
+                id_uzytkownika,
+                "scan_receipt_duplicate",
+                user_status,
+                json.dumps({"id_paragonu": e.id_paragonu, "odleglosc": e.odleglosc}, ensure_ascii=False)
+            )
+            return jsonify({
+                'status': 'duplicate',
+                'message': str(e),
+                'id_paragonu': e.id_paragonu
+            }), 409
         
         # Log zakończenia skanowania
         log_user_action(
@@ -121,6 +259,132 @@ def analyze_receipt():
         except:
             pass
         return jsonify(error=str(e)), 500 
+
+@api_bp.route('/analyze-receipt/jobs/<job_id>', methods=['GET'])
+@jwt_required()
+def analyze_receipt_job(job_id):
+    """
+    Status zadania skanowania z kolejki asynchronicznej
+    
+    Response:
+    {
+        "job_id": "...",
+        "status": "queued" | "running" | "done" | "failed" | "duplicate",
+        "id_paragonu": 123,      # gdy status == "done" (lub istniejący paragon przy "duplicate")
+        "error": null,           # gdy status == "failed"
+        "position": 0            # gdy status == "queued"
+    }
+    """
+    try:
+        sesja = get_jwt_identity()
+        id_uzytkownika = sesja['id_uzytkownika']
+        job = get_receipt_queue(current_app._get_current_object()).get(job_id, id_uzytkownika)
+        if job is None:
+            return jsonify({'status': 'error', 'message': 'Nie znaleziono zadania'}), 404
+        return jsonify(job), 200
+    except Exception as e:
+        print(e)
+        return jsonify(error=str(e)), 500
+    
+@api_bp.route('/import/paragony', methods=['POST'])
+@jwt_required()
+def import_paragonow():
+    """
+    Import wielu zdjęć paragonów naraz (OCR równolegle, wspólna klasyfikacja kategorii)
+    
+    Request:
+        multipart/form-data z plikami w polu 'images' (wiele plików)
+        albo JSON {"images": ["<base64>", ...]}
+    
+    Response 202:
+    {
+        "status": "queued",
+        "batch_id": "...",
+        "total": 12,
+        "status_url": "/import/paragony/<batch_id>"
+    }
+    """
+    try:
+        sesja = get_jwt_identity()
+        id_uzytkownika = sesja['id_uzytkownika']
+        kluczDoGemini = sesja['apiKlucz']
+        if not kluczDoGemini or len(kluczDoGemini) < 10:
+            kluczDoGemini = current_app.config.get('GEMINI_API_KEY', '')
+        
+        if request.mimetype == 'multipart/form-data':
+            obrazy = [(plik.filename, plik.stream) for plik in request.files.getlist('images')]
+        else:
+            data = request.get_json(silent=True)
+            lista = data.get('images', []) if isinstance(data, dict) else []
+            if not isinstance(lista, list):
+                return jsonify({'status': 'error', 'message': "Pole 'images' musi być listą obrazów base64"}), 400
+            try:
+                obrazy = [(None, _dekodujBase64(obraz, f'images[{numer}]')) for numer, obraz in enumerate(lista)]
+            except ValueError as e:
+                return jsonify({'status': 'error', 'message': str(e)}), 400
+        if not obrazy:
+            return jsonify({'status': 'error', 'message': 'Brak zdjęć do importu'}), 400
+        limit = current_app.config.get('BATCH_IMPORT_MAX_ITEMS', 50)
+        if len(obrazy) > limit:
+            return jsonify({'status': 'error', 'message': f'Maksymalnie {limit} zdjęć w jednym imporcie'}), 400
+        
+        importer = get_batch_importer(current_app._get_current_object())
+        batch_id = importer.create(current_app._get_current_object(), id_uzytkownika, obrazy, kluczDoGemini)
+        log_user_action(
+            id_uzytkownika,
+            "import_receipts_start",
+            get_user_status(id_uzytkownika),
+            json.dumps({"batch_id": batch_id, "total": len(obrazy)}, ensure_ascii=False)
+        )
+        return jsonify({
+            'status': 'queued',
+            'batch_id': batch_id,
+            'total': len(obrazy),
+            'status_url': f'/import/paragony/{batch_id}'
+        }), 202
+    except Exception as e:
+        print(e)
+        return jsonify(error=str(e)), 500
+
+@api_bp.route('/import/paragony/<batch_id>', methods=['GET'])
+@jwt_required()
+def import_paragonow_status(batch_id):
+    """
+    Stan importu i wynik każdego zdjęcia
+    
+    Response:
+    {
+        "batch_id": "...",
+        "status": "queued" | "running" | "done" | "failed",
+        "total": 12, "done": 10, "failed": 2,
+        "products": 140, "unique_products": 96,
+        "items": [{"index": 0, "filename": "...", "status": "done" | "failed" | "duplicate", "id_paragonu": 123, "error": null}, ...]
+    }
+    """
+    try:
+        sesja = get_jwt_identity()
+        batch = get_batch_importer(current_app._get_current_object()).get(batch_id, sesja['id_uzytkownika'])
+        if batch is None:
+            return jsonify({'status': 'error', 'message': 'Nie znaleziono importu'}), 404
+        return jsonify(batch), 200
+    except Exception as e:
+        print(e)
+        return jsonify(error=str(e)), 500
+    
+@api_bp.route('/metryki', methods=['GET'])
+@jwt_required()
+def metryki():
+    """
+    Liczniki procesu (cache słowników, kolejki itp.) do diagnostyki wydajności - tylko dla ADMIN_USER_IDS
+    """
+    sesja = get_jwt_identity()
+    if sesja['id_uzytkownika'] not in current_app.config.get('ADMIN_USER_IDS', []):
+        return jsonify({'status': 'error', 'message': 'Brak uprawnień'}), 403
+    try:
+        return jsonify(metrics.snapshot()), 200
+    except Exception as e:
+        print(e)
+        return jsonify(error=str(e)), 500
     
 @api_bp.route('/pobierzKategorie', methods=['GET', 'POST'])
 @jwt_required()
@@ -620,15 +884,17 @@ def pobierz_logi():
     Endpoint do pobierania logów użytkownika z paginacją i filtrowaniem
     
     Query params:
-        - page: numer strony (domyślnie 0)
+        - cursor: kursor następnej strony (pusty = pierwsza strona); odpowiedź {"items", "next_cursor"}
+        - page: numer strony (domyślnie 0) - dawne stronicowanie OFFSET, gdy brak cursor
         - size: liczba wyników na stronę (domyślnie 50, max 200)
-        - details: tekst do wyszukania w kolumnie details (opcjonalny, wyszukiwanie częściowe)
+        - details: tekst do wyszukania w kolumnie details (opcjonalny; słowa od 3 znaków jako prefiksy - indeks FULLTEXT, krótsze frazy - wyszukiwanie częściowe)
         - date_from: data początkowa w formacie YYYY-MM-DD lub YYYY-MM-DD HH:MM:SS (opcjonalny)
         - date_to: data końcowa w formacie YYYY-MM-DD lub YYYY-MM-DD HH:MM:SS (opcjonalny)
         - user_status: status użytkownika (np. 'active', 'premium', opcjonalny)
         - action: akcja do filtrowania (np. 'login', 'logout', 'scan_receipt', opcjonalny)
     
     Przykłady użycia:
+        GET /logi?cursor=&size=50
         GET /logi?page=0&size=50
         GET /logi?details=paragon&page=0
         GET /logi?date_from=2025-01-01&date_to=2025-12-31
@@ -649,6 +915,7 @@ def pobierz_logi():
         date_to = request.args.get('date_to', default=None, type=str)
         user_status = request.args.get('user_status', default=None, type=str)
         action = request.args.get('action', default=None, type=str)
+        cursor = request.args.get('cursor', default=None, type=str)
         
         # Walidacja parametrów paginacji
         if page < 0:
@@ -664,8 +931,11 @@ def pobierz_logi():
             date_from=date_from,
             date_to=date_to,
             user_status=user_status,
-            action=action
+            action=action,
+            cursor=cursor
         )
+    except pagination.NieprawidlowyKursor as e:
+        return jsonify(error=str(e)), 400
     except Exception as e:
         print(f"Error in pobierz_logi: {e}")
         return jsonify(error=str(e)), 500
\ No newline at end of file
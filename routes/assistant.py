@@ -6,7 +6,8 @@ Obsługuje polskie znaki: ą, ć, ę, ł, ń, ó, ś, ź, ż
 from flask import Blueprint, request, jsonify, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from assistant_ai import AssistantManager
-from db import DatabaseHelper
+from services.audit_log import log_user_action
+from services.user_status import get_user_status
 import json
 from typing import Optional
 
@@ -23,22 +24,12 @@ def log_assistant_action(id_uzytkownika: int, action: str, details: Optional[dic
         details: Szczegóły akcji (opcjonalne)
     """
     try:
-        # Pobierz status użytkownika
-        user_query = "SELECT status FROM uzytkownicy WHERE id_uzytkownika = :user_id"
-        user_data = DatabaseHelper.fetch_one(user_query, {'user_id': id_uzytkownika})
-        user_status = user_data['status'] if user_data else 'unknown'
-        
-        # Zapisz log
-        log_query = """
-        INSERT INTO logi (id_uzytkownika, timestamp, action, user_status_at_log, details)
-        VALUES (:user_id, NOW(), :action, :status, :details)
-        """
-        DatabaseHelper.execute(log_query, {
-            'user_id': id_uzytkownika,
-            'action': action,
-            'status': user_status,
-            'details': json.dumps(details, ensure_ascii=False) if details else None
-        })
+        log_user_action(
+            id_uzytkownika,
+            action,
+            get_user_status(id_uzytkownika),
+            json.dumps(details, ensure_ascii=False) if details else None
+        )
     except Exception as e:
         current_app.logger.error(f"Error logging assistant action: {e}")
 
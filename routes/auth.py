@@ -1,6 +1,8 @@
 from flask import Blueprint, render_template, request, redirect, url_for, flash, session, jsonify
 from flask_jwt_extended import JWTManager, create_access_token, jwt_required, get_jwt_identity, get_jwt
 from db import DatabaseHelper
+from services.audit_log import log_user_action
+from services.user_status import get_user_status
 import bcrypt
 import ssl
 import os
@@ -10,31 +12,6 @@ import re
 auth_bp = Blueprint('auth', __name__)
 revoked_tokens = set()
 
-
-def log_user_action(user_id, action, user_status, details=None):
-    """Store a single audit log entry."""
-    DatabaseHelper.execute(
-        """
-        INSERT INTO logi (id_uzytkownika, action, user_status_at_log, details)
-        VALUES (:user_id, :action, :status, :details)
-        """,
-        {
-            "user_id": user_id,
-            "action": action,
-            "status": user_status,
-            "details": details,
-        },
-    )
-
-
-def get_user_status(user_id):
-    """Fetch latest user status for logging."""
-    record = DatabaseHelper.fetch_one(
-        "SELECT status FROM uzytkownicy WHERE id_uzytkownika = :user_id",
-        {"user_id": user_id},
-    )
-    return record.get("status", "unknown") if record else "unknown"
-
 @auth_bp.route('/auth/register', methods=['GET', 'POST'])
 def register():
     if request.method == 'POST':
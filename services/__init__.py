@@ -0,0 +1,8 @@
+# -*- coding: utf-8 -*-
+"""
+Usługi pomocnicze backendu (kolejki, cache, infrastruktura potoku paragonów)
+Obsługuje polskie znaki: ą, ć, ę, ł, ń, ó, ś, ź, ż
+
+Moduły w tym pakiecie nie zależą od warstwy routingu. Importy klas
+Ekstrakcja/Api wykonywane są wewnątrz funkcji, aby uniknąć cykli.
+"""
@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+"""
+Buforowany zapis logów aktywności (tabela logi)
+Obsługuje polskie znaki: ą, ć, ę, ł, ń, ó, ś, ź, ż
+
+Wcześniej log_user_action istniało w trzech kopiach (api.py, ekstrakcja.py,
+routes/auth.py) i każde wywołanie robiło osobny INSERT we własnej
+transakcji - w ścieżce żądania. Teraz wpis trafia do bufora w pamięci
+procesu, a wątek w tle zapisuje go paczkami (jeden wielowierszowy INSERT
+przez DatabaseHelper.execute_many) co AUDIT_LOG_FLUSH_INTERVAL sekund albo
+po zebraniu AUDIT_LOG_BATCH wpisów.
+
+Pełny bufor (AUDIT_LOG_BUFFER) wstrzymuje wywołującego najwyżej
+AUDIT_LOG_BLOCK_TIMEOUT sekund; jeśli miejsce się nie zwolni, wpis jest
+odrzucany i liczony w metrykach - log nie może zatrzymać obsługi żądań.
+Przy zamknięciu procesu bufor jest opróżniany (atexit). Kolumna timestamp
+dostaje czas zapisu paczki, więc wpis może być opóźniony o czas flush.
+AUDIT_LOG_ASYNC=false przywraca zapis synchroniczny.
+"""
+import atexit
+import threading
+import time
+from collections import deque
+from typing import Dict, List, Optional
+
+from services import metrics
+
+INSERT = """
+    INSERT INTO logi (id_uzytkownika, action, user_status_at_log, details)
+    VALUES (:user_id, :action, :status, :details)
+"""
+
+DEFAULT_BUFFER = 10000
+DEFAULT_BATCH = 200
+DEFAULT_FLUSH_INTERVAL = 1.0
+DEFAULT_BLOCK_TIMEOUT = 0.05
+
+
+class AuditLogWriter:
+    """Bufor wpisów logu z wątkiem zapisującym paczki"""
+
+    def __init__(self, buffer_size: int = DEFAULT_BUFFER, batch_size: int = DEFAULT_BATCH,
+                 flush_interval: float = DEFAULT_FLUSH_INTERVAL, block_timeout: float = DEFAULT_BLOCK_TIMEOUT):
+        """
+        Inicjalizacja bufora
+
+        Args:
+            buffer_size: Maksymalna liczba wpisów czekających na zapis
+            batch_size: Maksymalna liczba wpisów w jednym INSERT
+            flush_interval: Co ile sekund zapisujemy niepełną paczkę
+            block_timeout: Ile sekund wywołujący czeka na miejsce w pełnym buforze
+        """
+        self.buffer_size = max(1, int(buffer_size))
+        self.batch_size = max(1, int(batch_size))
+        self.flush_interval = flush_interval
+        self.block_timeout = block_timeout
+
+        self._buffer = deque()
+        self._condition = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._app = None
+        self._stopping = False
+        self._stats = {
+            'queued': 0, 'written': 0, 'batches': 0, 'dropped': 0, 'blocked': 0,
+            'errors': 0, 'block_seconds': 0.0, 'flush_seconds': 0.0, 'max_flush_seconds': 0.0,
+            'max_buffered': 0,
+        }
+
+    # ------------------------------------------------------------------
+    # Wywołujący
+    # ------------------------------------------------------------------
+
+    def zapisz(self, wpis: Dict) -> bool:
+        """
+        Dodaje wpis do bufora
+
+        Returns:
+            False, gdy bufor był pełny dłużej niż block_timeout i wpis odrzucono
+        """
+        with self._condition:
+            if len(self._buffer) >= self.buffer_size:
+                self._stats['blocked'] += 1
+                start = time.perf_counter()
+                self._condition.notify_all()
+                self._condition.wait_for(lambda: len(self._buffer) < self.buffer_size, self.block_timeout)
+                self._stats['block_seconds'] += time.perf_counter() - start
+                if len(self._buffer) >= self.buffer_size:
+                    self._stats['dropped'] += 1
+                    return False
+            self._buffer.append(wpis)
+            self._stats['queued'] += 1
+            self._stats['max_buffered'] = max(self._stats['max_buffered'], len(self._buffer))
+            if len(self._buffer) >= self.batch_size:
+                self._condition.notify_all()
+        return True
+
+    # ------------------------------------------------------------------
+    # Wątek zapisujący
+    # ------------------------------------------------------------------
+
+    def start(self, app):
+        """Uruchamia wątek zapisujący (idempotentnie); app - kontekst dla DatabaseHelper"""
+        with self._condition:
+            if self._thread is not None:
+                return
+            self._app = app
+            self._thread = threading.Thread(target=self._petla, name='audit-log', daemon=True)
+            self._thread.start()
+        atexit.register(self.zamknij)
+
+    def _pobierz_paczke(self) -> List[Dict]:
+        with self._condition:
+            if len(self._buffer) < self.batch_size and not self._stopping:
+                self._condition.wait(self.flush_interval)
+            paczka = [self._buffer.popleft() for _ in range(min(self.batch_size, len(self._buffer)))]
+            # Zwolnione miejsce budzi wywołujących czekających na pełnym buforze
+            self._condition.notify_all()
+            return paczka
+
+    def _petla(self):
+        while True:
+            paczka = self._pobierz_paczke()
+            if paczka:
+                self._zapisz_paczke(paczka)
+            with self._condition:
+                if self._stopping and not self._buffer:
+                    return
+
+    def _zapisz_paczke(self, paczka: List[Dict]):
+        from db import DatabaseHelper
+        start = time.perf_counter()
+        with self._app.app_context():
+            try:
+                DatabaseHelper.execute_many(INSERT, paczka)
+                zapisane = len(paczka)
+            except Exception as e:
+                # Jeden błędny wpis (np. usunięty użytkownik) nie może przepaść z całą paczką
+                print(f"Log aktywności: błąd zapisu paczki ({len(paczka)} wpisów), zapis pojedynczo: {e}")
+                self._stats['errors'] += 1
+                zapisane = 0
+                for wpis in paczka:
+                    try:
+                        DatabaseHelper.execute(INSERT, wpis)
+                        zapisane += 1
+                    except Exception as e:
+                        print(f"Log aktywności: odrzucono wpis {wpis.get('action')}: {e}")
+                        self._stats['dropped'] += 1
+        czas = time.perf_counter() - start
+        with self._condition:
+            self._stats['written'] += zapisane
+            self._stats['batches'] += 1
+            self._stats['flush_seconds'] += czas
+            self._stats['max_flush_seconds'] = max(self._stats['max_flush_seconds'], czas)
+
+    def zamknij(self, timeout: float = 10.0):
+        """Zapisuje wpisy pozostałe w buforze i zatrzymuje wątek (wywoływane przy zamknięciu procesu)"""
+        with self._condition:
+            if self._thread is None:
+                return
+            self._stopping = True
+            self._condition.notify_all()
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            print(f"Log aktywności: nie zapisano {len(self._buffer)} wpisów przed zamknięciem")
+
+    def stats(self) -> Dict:
+        with self._condition:
+            wynik = dict(self._stats, buffered=len(self._buffer), buffer_size=self.buffer_size)
+        wynik['avg_flush_ms'] = round(1000 * wynik['flush_seconds'] / wynik['batches'], 2) if wynik['batches'] else 0
+        wynik['max_flush_ms'] = round(1000 * wynik.pop('max_flush_seconds'), 2)
+        wynik['block_seconds'] = round(wynik['block_seconds'], 3)
+        wynik['flush_seconds'] = round(wynik['flush_seconds'], 3)
+        return wynik
+
+
+_writer: Optional[AuditLogWriter] = None
+_writer_lock = threading.Lock()
+
+
+def get_writer(app) -> AuditLogWriter:
+    """Zwraca bufor procesu, tworząc go i uruchamiając wątek przy pierwszym użyciu"""
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = AuditLogWriter(
+                buffer_size=app.config.get('AUDIT_LOG_BUFFER', DEFAULT_BUFFER),
+                batch_size=app.config.get('AUDIT_LOG_BATCH', DEFAULT_BATCH),
+                flush_interval=app.config.get('AUDIT_LOG_FLUSH_INTERVAL', DEFAULT_FLUSH_INTERVAL),
+                block_timeout=app.config.get('AUDIT_LOG_BLOCK_TIMEOUT', DEFAULT_BLOCK_TIMEOUT),
+            )
+    _writer.start(app)
+    return _writer
+
+
+def log_user_action(user_id, action, user_status, details=None):
+    """Store a single audit log entry (buffered, written in batches in the background)."""
+    from flask import current_app
+    from db import DatabaseHelper
+    wpis = {
+        "user_id": user_id,
+        "action": action,
+        "status": user_status,
+        "details": details,
+    }
+    try:
+        if not current_app.config.get('AUDIT_LOG_ASYNC', True):
+            DatabaseHelper.execute(INSERT, wpis)
+            return
+        get_writer(current_app._get_current_object()).zapisz(wpis)
+    except Exception as e:
+        print(f"Error logging user action: {e}")
+
+
+def stats() -> Dict:
+    if _writer is None:
+        return {'started': False}
+    return _writer.stats()
+
+
+metrics.register('audit_log', stats)
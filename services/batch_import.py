@@ -0,0 +1,436 @@
+# -*- coding: utf-8 -*-
+"""
+Import wielu paragonów naraz (POST /import/paragony)
+Obsługuje polskie znaki: ą, ć, ę, ł, ń, ó, ś, ź, ż
+
+Import przebiega w trzech etapach:
+1. OCR wszystkich zdjęć równolegle na ograniczonej puli wątków
+   (BATCH_IMPORT_WORKERS); każde zapytanie do Gemini w każdym etapie
+   czeka na żeton limitu per klucz API (rate_limit.w_tle, w llm_client)
+2. Jedna wspólna klasyfikacja kategorii dla produktów ze wszystkich
+   paragonów - powtarzające się nazwy trafiają do Gemini tylko raz
+3. Zapis każdego paragonu (klasyfikacja firmy/miasta + transakcja)
+
+Stan importu i wynik każdej pozycji zapisywane są w pliku SQLite kolejki
+skanów (RECEIPT_QUEUE_DIR), więc status jest dostępny z każdego procesu.
+"""
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import BinaryIO, Dict, List, Optional, Tuple, Union
+
+from services import metrics, rate_limit
+
+STATUS_QUEUED = 'queued'
+STATUS_RUNNING = 'running'
+STATUS_DONE = 'done'
+STATUS_FAILED = 'failed'
+
+# Etapy pozycji importu
+ITEM_QUEUED = 'queued'
+ITEM_OCR = 'ocr'
+ITEM_DONE = 'done'
+ITEM_FAILED = 'failed'
+ITEM_DUPLICATE = 'duplicate'
+
+_stats = {
+    'batches': 0,
+    'items_done': 0,
+    'items_failed': 0,
+    'items_duplicate': 0,
+    'products': 0,
+    'unique_products': 0,
+}
+
+
+class BatchImporter:
+    """Import paczek zdjęć paragonów ze stanem w SQLite"""
+
+    def __init__(self, queue_dir: str, workers: int = 4, stale_after: int = 3600, retention_days: int = 7):
+        """
+        Inicjalizacja importera
+
+        Args:
+            queue_dir: Katalog kolejki skanów (plik SQLite i przesłane obrazy)
+            workers: Rozmiar puli wątków OCR i zapisu (wspólnej dla wszystkich importów)
+            stale_after: Po ilu sekundach import 'running' uznajemy za przerwany
+            retention_days: Po ilu dniach usuwamy zakończone importy
+        """
+        self.upload_dir = os.path.join(queue_dir, 'batches')
+        self.db_path = os.path.join(queue_dir, 'jobs.sqlite3')
+        self.workers = max(1, int(workers))
+        self.stale_after = stale_after
+        self.retention_days = retention_days
+        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='import-paragonow')
+
+        os.makedirs(self.upload_dir, exist_ok=True)
+        self._init_schema()
+        self._housekeeping()
+
+    # ------------------------------------------------------------------
+    # SQLite
+    # ------------------------------------------------------------------
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        connection.row_factory = sqlite3.Row
+        return connection
+
+    def _init_schema(self):
+        connection = self._connect()
+        try:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("""
+                CREATE TABLE IF NOT EXISTS batches (
+                    batch_id TEXT PRIMARY KEY,
+                    id_uzytkownika INTEGER NOT NULL,
+                    status TEXT NOT NULL,
+                    total INTEGER NOT NULL,
+                    products INTEGER,
+                    unique_products INTEGER,
+                    created_at TEXT NOT NULL,
+                    started_at TEXT,
+                    finished_at TEXT
+                )
+            """)
+            connection.execute("""
+                CREATE TABLE IF NOT EXISTS batch_items (
+                    batch_id TEXT NOT NULL,
+                    item_index INTEGER NOT NULL,
+                    filename TEXT,
+                    upload_path TEXT,
+                    status TEXT NOT NULL,
+                    id_paragonu INTEGER,
+                    error TEXT,
+                    seconds REAL,
+                    PRIMARY KEY (batch_id, item_index)
+                )
+            """)
+        finally:
+            connection.close()
+
+    @staticmethod
+    def _now() -> str:
+        return datetime.utcnow().isoformat(timespec='seconds')
+
+    def _update_item(self, batch_id: str, item_index: int, **fields):
+        assignments = ', '.join(f"{column} = ?" for column in fields)
+        connection = self._connect()
+        try:
+            connection.execute(
+                f"UPDATE batch_items SET {assignments} WHERE batch_id = ? AND item_index = ?",
+                (*fields.values(), batch_id, item_index),
+            )
+        finally:
+            connection.close()
+
+    def _update_batch(self, batch_id: str, **fields):
+        assignments = ', '.join(f"{column} = ?" for column in fields)
+        connection = self._connect()
+        try:
+            connection.execute(f"UPDATE batches SET {assignments} WHERE batch_id = ?", (*fields.values(), batch_id))
+        finally:
+            connection.close()
+
+    def _housekeeping(self):
+        """Oznacza przerwane importy (np. restart procesu) i usuwa stare wpisy"""
+        stale_before = (datetime.utcnow() - timedelta(seconds=self.stale_after)).isoformat(timespec='seconds')
+        purge_before = (datetime.utcnow() - timedelta(days=self.retention_days)).isoformat(timespec='seconds')
+        connection = self._connect()
+        try:
+            stale = [row['batch_id'] for row in connection.execute(
+                "SELECT batch_id FROM batches WHERE status IN (?, ?) AND created_at < ?",
+                (STATUS_QUEUED, STATUS_RUNNING, stale_before),
+            )]
+            for batch_id in stale:
+                connection.execute(
+                    "UPDATE batch_items SET status = ?, error = ? WHERE batch_id = ? AND status IN (?, ?)",
+                    (ITEM_FAILED, 'Import przerwany', batch_id, ITEM_QUEUED, ITEM_OCR),
+                )
+                connection.execute(
+                    "UPDATE batches SET status = ?, finished_at = ? WHERE batch_id = ?",
+                    (STATUS_FAILED, self._now(), batch_id),
+                )
+                shutil.rmtree(os.path.join(self.upload_dir, batch_id), ignore_errors=True)
+            old = [row['batch_id'] for row in connection.execute(
+                "SELECT batch_id FROM batches WHERE status IN (?, ?) AND finished_at < ?",
+                (STATUS_DONE, STATUS_FAILED, purge_before),
+            )]
+            for batch_id in old:
+                connection.execute("DELETE FROM batch_items WHERE batch_id = ?", (batch_id,))
+                connection.execute("DELETE FROM batches WHERE batch_id = ?", (batch_id,))
+        finally:
+            connection.close()
+
+    # ------------------------------------------------------------------
+    # API importu
+    # ------------------------------------------------------------------
+
+    def create(self, app, id_uzytkownika: int, images: List[Tuple[Optional[str], Union[bytes, BinaryIO]]],
+               api_key: Optional[str]) -> str:
+        """
+        Zapisuje zdjęcia na dysku i uruchamia import w tle
+
+        Args:
+            app: Aplikacja Flask - import działa w jej kontekście
+            id_uzytkownika: ID właściciela paragonów
+            images: Lista (nazwa pliku, bajty lub plik)
+            api_key: Klucz Gemini użytkownika (tylko w pamięci procesu)
+
+        Returns:
+            ID importu
+        """
+        batch_id = uuid.uuid4().hex
+        batch_dir = os.path.join(self.upload_dir, batch_id)
+        os.makedirs(batch_dir, exist_ok=True)
+        items = []
+        for index, (filename, image) in enumerate(images):
+            upload_path = os.path.join(batch_dir, f"{index}.bin")
+            with open(upload_path, 'wb') as handle:
+                if hasattr(image, 'read'):
+                    shutil.copyfileobj(image, handle)
+                else:
+                    handle.write(image)
+            items.append((batch_id, index, filename, upload_path, ITEM_QUEUED))
+
+        connection = self._connect()
+        try:
+            connection.execute("BEGIN")
+            connection.execute(
+                "INSERT INTO batches (batch_id, id_uzytkownika, status, total, created_at) VALUES (?, ?, ?, ?, ?)",
+                (batch_id, id_uzytkownika, STATUS_QUEUED, len(items), self._now()),
+            )
+            connection.executemany(
+                "INSERT INTO batch_items (batch_id, item_index, filename, upload_path, status) VALUES (?, ?, ?, ?, ?)",
+                items,
+            )
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        finally:
+            connection.close()
+
+        _stats['batches'] += 1
+        threading.Thread(
+            target=self._run,
+            args=(app, batch_id, id_uzytkownika, api_key),
+            name=f"import-{batch_id[:8]}",
+            daemon=True,
+        ).start()
+        return batch_id
+
+    def get(self, batch_id: str, id_uzytkownika: Optional[int] = None) -> Optional[Dict]:
+        """
+        Zwraca stan importu z wynikami pozycji (opcjonalnie tylko właściciela)
+
+        Returns:
+            Słownik ze stanem importu lub None
+        """
+        connection = self._connect()
+        try:
+            row = connection.execute("SELECT * FROM batches WHERE batch_id = ?", (batch_id,)).fetchone()
+            if row is None:
+                return None
+            if id_uzytkownika is not None and int(row['id_uzytkownika']) != int(id_uzytkownika):
+                return None
+            items = [
+                {
+                    'index': item['item_index'],
+                    'filename': item['filename'],
+                    'status': item['status'],
+                    'id_paragonu': item['id_paragonu'],
+                    'error': item['error'],
+                    'seconds': item['seconds'],
+                }
+                for item in connection.execute(
+                    "SELECT * FROM batch_items WHERE batch_id = ? ORDER BY item_index", (batch_id,)
+                )
+            ]
+            return {
+                'batch_id': row['batch_id'],
+                'status': row['status'],
+                'total': row['total'],
+                'done': sum(1 for item in items if item['status'] == ITEM_DONE),
+                'failed': sum(1 for item in items if item['status'] == ITEM_FAILED),
+                'duplicate': sum(1 for item in items if item['status'] == ITEM_DUPLICATE),
+                'products': row['products'],
+                'unique_products': row['unique_products'],
+                'created_at': row['created_at'],
+                'started_at': row['started_at'],
+                'finished_at': row['finished_at'],
+                'items': items,
+            }
+        finally:
+            connection.close()
+
+    # ------------------------------------------------------------------
+    # Przetwarzanie
+    # ------------------------------------------------------------------
+
+    def _in_context(self, app, function, *args):
+        # Każdy wątek puli potrzebuje własnego kontekstu aplikacji (i sesji SQLAlchemy)
+        with app.app_context(), rate_limit.w_tle():
+            return function(*args)
+
+    def _ocr(self, batch_id: str, item: sqlite3.Row, id_uzytkownika: int, api_key: str, widziane: Dict):
+        """Etap 1: OCR jednego zdjęcia; zwraca (obraz, odczyt) albo None przy błędzie lub duplikacie"""
+        from ekstrakcja import Ekstrakcja, DuplikatParagonu
+        from services.image_pipeline import PreprocessedImage, hamming
+
+        self._update_item(batch_id, item['item_index'], status=ITEM_OCR)
+        started = time.perf_counter()
+        try:
+            with open(item['upload_path'], 'rb') as handle:
+                obraz = PreprocessedImage(handle.read())
+            # Pewne duplikaty (prawie identyczny skrót) odpadają przed OCR: w bazie i wcześniej w tej paczce
+            Ekstrakcja.sprawdzDuplikat(obraz, id_uzytkownika)
+            with widziane['lock']:
+                for index, phash in widziane['exact']:
+                    if hamming(phash, obraz.dhash) <= widziane['exact_distance']:
+                        return self._duplikat_w_paczce(batch_id, item['item_index'], index)
+                widziane['exact'].append((item['item_index'], obraz.dhash))
+            obraz, odczyt = Ekstrakcja.odczytajParagon(obraz, api_key)
+            # Bliski skrót percepcyjny to duplikat tylko przy tej samej sumie i liczbie pozycji
+            Ekstrakcja.sprawdzDuplikat(obraz, id_uzytkownika, odczyt)
+            tresc = (round(odczyt['suma'], 2), len(odczyt['data']['produkty']))
+            with widziane['lock']:
+                for index, phash, tresc_widziana in widziane['hashes']:
+                    if tresc_widziana == tresc and hamming(phash, obraz.dhash) <= widziane['max_distance']:
+                        return self._duplikat_w_paczce(batch_id, item['item_index'], index)
+                widziane['hashes'].append((item['item_index'], obraz.dhash, tresc))
+            return obraz, odczyt
+        except DuplikatParagonu as e:
+            self._update_item(batch_id, item['item_index'], status=ITEM_DUPLICATE,
+                              id_paragonu=e.id_paragonu, error=str(e))
+            _stats['items_duplicate'] += 1
+            return None
+        except Exception as e:
+            print(f"Import {batch_id}: OCR pozycji {item['item_index']} nieudany: {e}")
+            self._update_item(batch_id, item['item_index'], status=ITEM_FAILED, error=str(e),
+                              seconds=round(time.perf_counter() - started, 2))
+            _stats['items_failed'] += 1
+            return None
+
+    def _duplikat_w_paczce(self, batch_id: str, item_index: int, index: int):
+        self._update_item(batch_id, item_index, status=ITEM_DUPLICATE,
+                          error=f"Duplikat zdjęcia nr {index} w tym imporcie")
+        _stats['items_duplicate'] += 1
+        return None
+
+    def _save(self, batch_id: str, item_index: int, id_uzytkownika: int, api_key: str,
+              obraz, odczyt: Dict, sklasyfikowane: Optional[List[Dict]]):
+        """Etap 3: zapis jednego paragonu (klasyfikacja firmy i miasta + transakcja)"""
+        from ekstrakcja import Ekstrakcja
+
+        started = time.perf_counter()
+        try:
+            id_paragonu = Ekstrakcja.zapiszParagon(obraz, odczyt, id_uzytkownika, api_key, sklasyfikowane=sklasyfikowane)
+            self._update_item(batch_id, item_index, status=ITEM_DONE, id_paragonu=id_paragonu,
+                              seconds=round(time.perf_counter() - started, 2))
+            _stats['items_done'] += 1
+        except Exception as e:
+            print(f"Import {batch_id}: zapis pozycji {item_index} nieudany: {e}")
+            self._update_item(batch_id, item_index, status=ITEM_FAILED, error=str(e),
+                              seconds=round(time.perf_counter() - started, 2))
+            _stats['items_failed'] += 1
+
+    def _classify_shared(self, odczyty: List[Dict], api_key: str, id_uzytkownika: int) -> Optional[Tuple[int, int]]:
+        """
+        Etap 2: wspólna klasyfikacja kategorii produktów wszystkich paragonów
+
+        Returns:
+            (liczba produktów, liczba unikalnych nazw) albo None, gdy klasyfikacja
+            się nie powiodła (każdy paragon sklasyfikuje wtedy swoje produkty)
+        """
+        from ekstrakcja import Ekstrakcja
+        from services.category_memo import normalize_name
+
+        produkty = [produkt for odczyt in odczyty for produkt in odczyt['data']['produkty']]
+        unikalne = len({normalize_name(produkt['nazwa']) for produkt in produkty})
+        if not produkty:
+            return 0, 0
+        try:
+            # klasyfikacjaKategorieJedna wysyła do AI każdą nieznaną nazwę tylko raz
+            Ekstrakcja.klasyfikacjaKategorieJedna(produkty, api_key, id_uzytkownika)
+        except Exception as e:
+            print(f"Import: wspólna klasyfikacja kategorii nieudana, klasyfikacja per paragon: {e}")
+            return None
+        _stats['products'] += len(produkty)
+        _stats['unique_products'] += unikalne
+        return len(produkty), unikalne
+
+    def _run(self, app, batch_id: str, id_uzytkownika: int, api_key: Optional[str]):
+        with app.app_context(), rate_limit.w_tle():
+            try:
+                self._update_batch(batch_id, status=STATUS_RUNNING, started_at=self._now())
+                connection = self._connect()
+                try:
+                    items = connection.execute(
+                        "SELECT * FROM batch_items WHERE batch_id = ? ORDER BY item_index", (batch_id,)
+                    ).fetchall()
+                finally:
+                    connection.close()
+
+                # Etap 1: OCR równolegle (pewne duplikaty odrzucone przed OCR, bliskie - po zgodnej treści)
+                widziane = {
+                    'lock': threading.Lock(),
+                    'exact': [],
+                    'exact_distance': app.config.get('PHASH_EXACT_DISTANCE', 2),
+                    'hashes': [],
+                    'max_distance': app.config.get('PHASH_MAX_DISTANCE', 6),
+                }
+                futures = [
+                    (item['item_index'], self._pool.submit(self._in_context, app, self._ocr, batch_id, item,
+                                                           id_uzytkownika, api_key, widziane))
+                    for item in items
+                ]
+                odczytane = [(index, future.result()) for index, future in futures]
+                odczytane = [(index, wynik[0], wynik[1]) for index, wynik in odczytane if wynik is not None]
+
+                # Etap 2: jedna klasyfikacja kategorii dla całej paczki
+                wspolna = self._classify_shared([odczyt for _, _, odczyt in odczytane], api_key, id_uzytkownika)
+                if wspolna is not None:
+                    self._update_batch(batch_id, products=wspolna[0], unique_products=wspolna[1])
+
+                # Etap 3: zapis paragonów
+                futures = [
+                    self._pool.submit(
+                        self._in_context, app, self._save, batch_id, index, id_uzytkownika, api_key,
+                        obraz, odczyt, odczyt['data']['produkty'] if wspolna is not None else None,
+                    )
+                    for index, obraz, odczyt in odczytane
+                ]
+                for future in futures:
+                    future.result()
+                self._update_batch(batch_id, status=STATUS_DONE, finished_at=self._now())
+                print(f"Import {batch_id}: zakończony ({len(odczytane)}/{len(items)} po OCR)")
+            except Exception as e:
+                print(f"Import {batch_id}: błąd: {e}")
+                self._update_batch(batch_id, status=STATUS_FAILED, finished_at=self._now())
+            finally:
+                shutil.rmtree(os.path.join(self.upload_dir, batch_id), ignore_errors=True)
+
+
+_importer: Optional[BatchImporter] = None
+_importer_lock = threading.Lock()
+
+
+def get_batch_importer(app) -> BatchImporter:
+    """Zwraca importer procesu, tworząc go przy pierwszym użyciu"""
+    global _importer
+    with _importer_lock:
+        if _importer is None:
+            _importer = BatchImporter(
+                app.config['RECEIPT_QUEUE_DIR'],
+                workers=app.config.get('BATCH_IMPORT_WORKERS', 4),
+            )
+    return _importer
+
+
+metrics.register('batch_import', lambda: dict(_stats))
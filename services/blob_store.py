@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+"""
+Magazyn obrazów paragonów adresowany treścią (SHA-256)
+Obsługuje polskie znaki: ą, ć, ę, ł, ń, ó, ś, ź, ż
+
+Zamiast trzymać JPEG w kolumnie paragony.obraz (LONGBLOB) zapisujemy go
+w magazynie, a w wierszu tylko skrót SHA-256 (paragony.obraz_hash).
+
+- LocalBlobStore: katalog na dysku, pliki dzielone na podkatalogi ab/cd/<hash>
+- S3BlobStore: dowolny klient zgodny z boto3 (AWS S3, MinIO, Ceph...)
+
+Wybór magazynu: BLOB_STORE=local|s3 (patrz config.py).
+"""
+import hashlib
+import io
+import os
+import re
+import threading
+from typing import BinaryIO, Optional
+
+_HASH = re.compile(r"^[0-9a-f]{64}$")
+
+
+def content_hash(data: bytes) -> str:
+    """Zwraca skrót SHA-256 (hex) treści"""
+    return hashlib.sha256(data).hexdigest()
+
+
+def _check_hash(digest: str) -> str:
+    if not digest or not _HASH.match(digest):
+        raise ValueError(f"Nieprawidłowy skrót obrazu: {digest!r}")
+    return digest
+
+
+class LocalBlobStore:
+    """Magazyn w lokalnym systemie plików"""
+
+    def __init__(self, root: str):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def path(self, digest: str) -> str:
+        """Ścieżka pliku dla skrótu (root/ab/cd/abcd...)"""
+        digest = _check_hash(digest)
+        return os.path.join(self.root, digest[:2], digest[2:4], digest)
+
+    def put(self, data: bytes, content_type: str = 'image/jpeg') -> str:
+        """Zapisuje treść (idempotentnie) i zwraca jej skrót"""
+        digest = content_hash(data)
+        target = self.path(digest)
+        if os.path.exists(target):
+            return digest
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        tmp_path = f"{target}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as handle:
+            handle.write(data)
+        os.replace(tmp_path, target)
+        return digest
+
+    def exists(self, digest: str) -> bool:
+        return os.path.exists(self.path(digest))
+
+    def open(self, digest: str) -> BinaryIO:
+        """Otwiera treść do strumieniowego odczytu"""
+        return open(self.path(digest), 'rb')
+
+    def get(self, digest: str) -> bytes:
+        with self.open(digest) as handle:
+            return handle.read()
+
+    def size(self, digest: str) -> int:
+        return os.path.getsize(self.path(digest))
+
+    def delete(self, digest: str):
+        try:
+            os.remove(self.path(digest))
+        except FileNotFoundError:
+            pass
+
+
+class S3BlobStore:
+    """Magazyn S3 - klient musi udostępniać put_object/get_object/head_object/delete_object"""
+
+    def __init__(self, client, bucket: str, prefix: str = 'paragony/'):
+        self.client = client
+        self.bucket = bucket
+        self.prefix = prefix
+
+    def _key(self, digest: str) -> str:
+        digest = _check_hash(digest)
+        return f"{self.prefix}{digest[:2]}/{digest[2:4]}/{digest}"
+
+    def path(self, digest: str) -> Optional[str]:
+        """Magazyn zdalny nie ma lokalnej ścieżki"""
+        return None
+
+    def put(self, data: bytes, content_type: str = 'image/jpeg') -> str:
+        digest = content_hash(data)
+        if not self.exists(digest):
+            self.client.put_object(Bucket=self.bucket, Key=self._key(digest), Body=data, ContentType=content_type)
+        return digest
+
+    def exists(self, digest: str) -> bool:
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self._key(digest))
+            return True
+        except Exception:
+            return False
+
+    def open(self, digest: str) -> BinaryIO:
+        return io.BytesIO(self.get(digest))
+
+    def get(self, digest: str) -> bytes:
+        response = self.client.get_object(Bucket=self.bucket, Key=self._key(digest))
+        return response['Body'].read()
+
+    def size(self, digest: str) -> int:
+        response = self.client.head_object(Bucket=self.bucket, Key=self._key(digest))
+        return int(response['ContentLength'])
+
+    def delete(self, digest: str):
+        self.client.delete_object(Bucket=self.bucket, Key=self._key(digest))
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def create_blob_store(config):
+    """Tworzy magazyn na podstawie konfiguracji aplikacji"""
+    kind = (config.get('BLOB_STORE') or 'local').lower()
+    if kind == 's3':
+        # boto3 jest potrzebne tylko przy magazynie S3
+        import boto3
+        client = boto3.client(
+            's3',
+            endpoint_url=config.get('BLOB_S3_ENDPOINT_URL') or None,
+            region_name=config.get('BLOB_S3_REGION') or None,
+        )
+        return S3BlobStore(client, config['BLOB_S3_BUCKET'], config.get('BLOB_S3_PREFIX', 'paragony/'))
+    return LocalBlobStore(config['BLOB_STORE_DIR'])
+
+
+def get_blob_store():
+    """Zwraca magazyn procesu (tworzony przy pierwszym użyciu z current_app.config)"""
+    global _store
+    if _store is None:
+        from flask import current_app
+        with _store_lock:
+            if _store is None:
+                _store = create_blob_store(current_app.config)
+    return _store
@@ -0,0 +1,246 @@
+# -*- coding: utf-8 -*-
+"""
+Pamięć decyzji klasyfikacji produktów: znormalizowana nazwa -> id_kategorii
+Obsługuje polskie znaki: ą, ć, ę, ł, ń, ó, ś, ź, ż
+
+Trwała kopia w tabeli `klasyfikacje_produktow`, przed nią gorący cache LRU
+w pamięci procesu. Do Gemini trafiają tylko nazwy, których nie ma w pamięci.
+Ręczna poprawka kategorii trafia do `klasyfikacje_uzytkownika` i ma
+pierwszeństwo tylko dla jej autora. Wspólny wpis (zrodlo='manual', którego
+decyzje AI nie nadpisują) powstaje dopiero, gdy tę samą kategorię wybierze
+CATEGORY_MANUAL_AGREEMENT różnych użytkowników - jedna osoba nie zmienia
+klasyfikacji wszystkim. Nazwy są znormalizowane (casefold), a kolumny mają
+kolację utf8mb4_bin, więc baza porównuje je tak samo jak ten moduł.
+"""
+import re
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional, Tuple
+
+from services import metrics
+
+DEFAULT_LRU_SIZE = 20000
+DEFAULT_MANUAL_AGREEMENT = 3
+ZRODLO_AI = 'ai'
+ZRODLO_MANUAL = 'manual'
+
+# Zapytania IN / wielowierszowe INSERT dzielimy na paczki
+_CHUNK = 500
+_MAX_NAME_LENGTH = 255
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def _manual_agreement() -> int:
+    try:
+        from flask import current_app
+        return int(current_app.config.get('CATEGORY_MANUAL_AGREEMENT', DEFAULT_MANUAL_AGREEMENT))
+    except RuntimeError:
+        return DEFAULT_MANUAL_AGREEMENT
+
+
+def normalize_name(name: Optional[str]) -> str:
+    """Normalizuje nazwę produktu z paragonu (wielkość liter, białe znaki, śmieci z OCR)"""
+    if not name:
+        return ''
+    normalized = _WHITESPACE.sub(' ', str(name).casefold()).strip(" \t.,;:*-_'\"")
+    return normalized[:_MAX_NAME_LENGTH]
+
+
+class CategoryMemo:
+    """LRU w pamięci + tabela klasyfikacje_produktow"""
+
+    def __init__(self, max_size: int = DEFAULT_LRU_SIZE):
+        self.max_size = max_size
+        self._lru: "OrderedDict[str, int]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.lru_hits = 0
+        self.db_hits = 0
+        self.misses = 0
+        self.ai_writes = 0
+        self.user_hits = 0
+        self.manual_writes = 0
+        self.manual_promotions = 0
+        self.errors = 0
+
+    def _remember(self, name: str, id_kategorii: int):
+        with self._lock:
+            self._lru[name] = id_kategorii
+            self._lru.move_to_end(name)
+            while len(self._lru) > self.max_size:
+                self._lru.popitem(last=False)
+
+    def lookup_many(self, names: Iterable[str], id_uzytkownika: Optional[int] = None) -> Dict[str, int]:
+        """
+        Zwraca znane kategorie dla nazw produktów
+
+        Args:
+            names: Nazwy produktów (dowolna postać - normalizowane wewnątrz)
+            id_uzytkownika: Właściciel paragonu - jego ręczne poprawki mają pierwszeństwo
+
+        Returns:
+            Słownik znormalizowana_nazwa -> id_kategorii (tylko trafienia)
+        """
+        requested = {normalize_name(n) for n in names}
+        requested.discard('')
+        found: Dict[str, int] = {}
+        if id_uzytkownika is not None and requested:
+            found.update(self._lookup_user(requested, id_uzytkownika))
+
+        missing = []
+        with self._lock:
+            for name in requested:
+                if name in found:
+                    continue
+                if name in self._lru:
+                    self._lru.move_to_end(name)
+                    found[name] = self._lru[name]
+                    self.lru_hits += 1
+                else:
+                    missing.append(name)
+
+        if missing:
+            from db import DatabaseHelper
+            try:
+                for start in range(0, len(missing), _CHUNK):
+                    chunk = missing[start:start + _CHUNK]
+                    params = {f"n{i}": name for i, name in enumerate(chunk)}
+                    placeholders = ", ".join(f":{key}" for key in params)
+                    rows = DatabaseHelper.fetch_all(
+                        f"SELECT nazwa_znormalizowana, id_kategorii FROM klasyfikacje_produktow "
+                        f"WHERE nazwa_znormalizowana IN ({placeholders})",
+                        params,
+                    )
+                    for row in rows:
+                        if row['nazwa_znormalizowana'] not in requested:
+                            continue
+                        found[row['nazwa_znormalizowana']] = row['id_kategorii']
+                        self._remember(row['nazwa_znormalizowana'], row['id_kategorii'])
+            except Exception as e:
+                # Brak tabeli (niezastosowana migracja) nie może blokować skanowania
+                self.errors += 1
+                print(f"Pamięć klasyfikacji: błąd odczytu: {e}")
+            db_hits = sum(1 for name in missing if name in found)
+            self.db_hits += db_hits
+            self.misses += len(missing) - db_hits
+        return found
+
+    def _lookup_user(self, names, id_uzytkownika: int) -> Dict[str, int]:
+        """Ręczne poprawki jednego użytkownika (bez LRU - obowiązują tylko jego)"""
+        from db import DatabaseHelper
+        found = {}
+        names = list(names)
+        try:
+            for start in range(0, len(names), _CHUNK):
+                chunk = names[start:start + _CHUNK]
+                params = {f"n{i}": name for i, name in enumerate(chunk)}
+                placeholders = ", ".join(f":{key}" for key in params)
+                params['id_uzytkownika'] = id_uzytkownika
+                rows = DatabaseHelper.fetch_all(
+                    f"SELECT nazwa_znormalizowana, id_kategorii FROM klasyfikacje_uzytkownika "
+                    f"WHERE id_uzytkownika = :id_uzytkownika AND nazwa_znormalizowana IN ({placeholders})",
+                    params,
+                )
+                for row in rows:
+                    found[row['nazwa_znormalizowana']] = row['id_kategorii']
+        except Exception as e:
+            self.errors += 1
+            print(f"Pamięć klasyfikacji: błąd odczytu poprawek użytkownika: {e}")
+        self.user_hits += len(found)
+        return found
+
+    def record_ai(self, decisions: Iterable[Tuple[str, int]]):
+        """
+        Zapisuje decyzje modelu AI (bez nadpisywania ręcznych poprawek)
+
+        Args:
+            decisions: Pary (nazwa produktu, id_kategorii)
+        """
+        unique = {}
+        for name, id_kategorii in decisions:
+            normalized = normalize_name(name)
+            if normalized and id_kategorii is not None:
+                unique[normalized] = id_kategorii
+        if not unique:
+            return
+
+        from db import DatabaseHelper
+        items = list(unique.items())
+        try:
+            for start in range(0, len(items), _CHUNK):
+                chunk = items[start:start + _CHUNK]
+                params = {}
+                values = []
+                for i, (name, id_kategorii) in enumerate(chunk):
+                    params[f"n{i}"] = name
+                    params[f"k{i}"] = id_kategorii
+                    values.append(f"(:n{i}, :k{i}, '{ZRODLO_AI}')")
+                DatabaseHelper.execute(
+                    "INSERT INTO klasyfikacje_produktow (nazwa_znormalizowana, id_kategorii, zrodlo) VALUES "
+                    + ", ".join(values)
+                    + " ON DUPLICATE KEY UPDATE id_kategorii = IF(zrodlo = 'manual', id_kategorii, VALUES(id_kategorii))",
+                    params,
+                )
+            self.ai_writes += len(items)
+            for name, id_kategorii in items:
+                self._remember(name, id_kategorii)
+        except Exception as e:
+            self.errors += 1
+            print(f"Pamięć klasyfikacji: błąd zapisu: {e}")
+
+    def record_manual(self, name: str, id_kategorii: int, id_uzytkownika: int):
+        """
+        Zapisuje ręczną poprawkę kategorii użytkownika
+
+        Poprawka obowiązuje od razu u jej autora; wspólny wpis 'manual' powstaje,
+        gdy tę samą kategorię dla nazwy wybierze CATEGORY_MANUAL_AGREEMENT użytkowników.
+        """
+        normalized = normalize_name(name)
+        if not normalized or id_kategorii is None or id_uzytkownika is None:
+            return
+        from db import DatabaseHelper
+        try:
+            params = {'nazwa': normalized, 'id_kategorii': id_kategorii, 'id_uzytkownika': id_uzytkownika}
+            DatabaseHelper.execute(
+                "INSERT INTO klasyfikacje_uzytkownika (id_uzytkownika, nazwa_znormalizowana, id_kategorii) "
+                "VALUES (:id_uzytkownika, :nazwa, :id_kategorii) "
+                "ON DUPLICATE KEY UPDATE id_kategorii = VALUES(id_kategorii)",
+                params,
+            )
+            self.manual_writes += 1
+            zgodni = DatabaseHelper.fetch_one(
+                "SELECT COUNT(*) AS liczba FROM klasyfikacje_uzytkownika "
+                "WHERE nazwa_znormalizowana = :nazwa AND id_kategorii = :id_kategorii",
+                params,
+            )
+            if zgodni and int(zgodni['liczba']) >= _manual_agreement():
+                DatabaseHelper.execute(
+                    "INSERT INTO klasyfikacje_produktow (nazwa_znormalizowana, id_kategorii, zrodlo) "
+                    "VALUES (:nazwa, :id_kategorii, 'manual') "
+                    "ON DUPLICATE KEY UPDATE id_kategorii = VALUES(id_kategorii), zrodlo = 'manual'",
+                    params,
+                )
+                self.manual_promotions += 1
+                self._remember(normalized, id_kategorii)
+        except Exception as e:
+            self.errors += 1
+            print(f"Pamięć klasyfikacji: błąd zapisu poprawki: {e}")
+
+    def stats(self) -> Dict:
+        return {
+            'lru_size': len(self._lru),
+            'lru_hits': self.lru_hits,
+            'db_hits': self.db_hits,
+            'misses': self.misses,
+            'user_hits': self.user_hits,
+            'ai_writes': self.ai_writes,
+            'manual_writes': self.manual_writes,
+            'manual_promotions': self.manual_promotions,
+            'errors': self.errors,
+        }
+
+
+memo = CategoryMemo()
+
+metrics.register('category_memo', memo.stats)
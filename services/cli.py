@@ -0,0 +1,238 @@
+# -*- coding: utf-8 -*-
+"""
+Polecenia administracyjne Flask CLI (flask --app main <polecenie>)
+Obsługuje polskie znaki: ą, ć, ę, ł, ń, ó, ś, ź, ż
+"""
+import time
+
+import click
+
+
+def register_commands(app):
+    """Rejestruje polecenia CLI aplikacji"""
+
+    @app.cli.command('migrate-images')
+    @click.option('--batch', default=100, show_default=True, help='Liczba paragonów w jednej paczce')
+    @click.option('--keep-blob', is_flag=True, help='Nie czyść kolumny paragony.obraz po przeniesieniu')
+    def migrate_images(batch, keep_blob):
+        """Przenosi obrazy z kolumny paragony.obraz do magazynu plików"""
+        from db import DatabaseHelper
+        from services.blob_store import get_blob_store
+
+        store = get_blob_store()
+        ostatni = 0
+        przeniesione = 0
+        bajty = 0
+        while True:
+            wiersze = DatabaseHelper.fetch_all(
+                """SELECT id_paragonu, obraz FROM paragony
+                   WHERE id_paragonu > :ostatni AND obraz IS NOT NULL AND obraz_hash IS NULL
+                   ORDER BY id_paragonu
+                   LIMIT :limit""",
+                {'ostatni': ostatni, 'limit': batch},
+            )
+            # Kończymy transakcję odczytu, żeby nie trzymać paczki BLOB-ów w sesji
+            DatabaseHelper.rollback()
+            if not wiersze:
+                break
+            for wiersz in wiersze:
+                digest = store.put(wiersz['obraz'], 'image/jpeg')
+                # data_dodania ma ON UPDATE current_timestamp() - zachowujemy datę paragonu
+                DatabaseHelper.execute(
+                    "UPDATE paragony SET obraz_hash = :obraz_hash, data_dodania = data_dodania"
+                    + ("" if keep_blob else ", obraz = NULL")
+                    + " WHERE id_paragonu = :id_paragonu",
+                    {'obraz_hash': digest, 'id_paragonu': wiersz['id_paragonu']},
+                )
+                przeniesione += 1
+                bajty += len(wiersz['obraz'])
+            ostatni = wiersze[-1]['id_paragonu']
+            click.echo(f"Przeniesiono {przeniesione} obrazów (ostatni paragon: {ostatni})")
+        click.echo(f"Gotowe: {przeniesione} obrazów, {bajty / 1024 / 1024:.1f} MB przeniesione z bazy danych")
+
+    @app.cli.command('backfill-phash')
+    @click.option('--batch', default=100, show_default=True, help='Liczba paragonów w jednej paczce')
+    def backfill_phash(batch):
+        """Uzupełnia skrót percepcyjny (paragony.phash) dla istniejących paragonów"""
+        from db import DatabaseHelper
+        from services.blob_store import get_blob_store
+        from services.image_pipeline import PreprocessedImage
+
+        store = get_blob_store()
+        ostatni = 0
+        uzupelnione = 0
+        bledy = 0
+        while True:
+            wiersze = DatabaseHelper.fetch_all(
+                """SELECT id_paragonu, obraz_hash FROM paragony
+                   WHERE id_paragonu > :ostatni AND phash IS NULL AND obraz_hash IS NOT NULL
+                   ORDER BY id_paragonu
+                   LIMIT :limit""",
+                {'ostatni': ostatni, 'limit': batch},
+            )
+            DatabaseHelper.rollback()
+            if not wiersze:
+                break
+            for wiersz in wiersze:
+                try:
+                    obraz = PreprocessedImage(store.get(wiersz['obraz_hash']))
+                except Exception as e:
+                    click.echo(f"Paragon {wiersz['id_paragonu']}: nie można odczytać obrazu ({e})")
+                    bledy += 1
+                    continue
+                # data_dodania ma ON UPDATE current_timestamp() - zachowujemy datę paragonu
+                DatabaseHelper.execute(
+                    "UPDATE paragony SET phash = :phash, data_dodania = data_dodania WHERE id_paragonu = :id_paragonu",
+                    {'phash': obraz.dhash, 'id_paragonu': wiersz['id_paragonu']},
+                )
+                uzupelnione += 1
+            ostatni = wiersze[-1]['id_paragonu']
+            click.echo(f"Uzupełniono {uzupelnione} skrótów (ostatni paragon: {ostatni})")
+        click.echo(f"Gotowe: {uzupelnione} skrótów, {bledy} obrazów pominiętych")
+
+    @app.cli.command('train-classifier')
+    @click.option('--holdout', default=0.1, show_default=True, help='Część nazw odłożona do oceny (0-1)')
+    @click.option('--alpha', default=0.1, show_default=True, help='Wygładzanie Laplace\'a')
+    @click.option('--output', default=None, help='Plik modelu (domyślnie LOCAL_CLASSIFIER_PATH)')
+    def train_classifier(holdout, alpha, output):
+        """Trenuje lokalny klasyfikator kategorii na produktach z bazy"""
+        from datetime import datetime
+        from services import local_classifier, reference_cache
+
+        path = output or app.config['LOCAL_CLASSIFIER_PATH']
+        trudne = reference_cache.kategorie.id_for('TrudnoOkreslic')
+        przyklady = local_classifier.dane_treningowe([trudne] if trudne is not None else [])
+        treningowe = [p for p in przyklady if not local_classifier.w_holdout(p[0], holdout)]
+        testowe = [p for p in przyklady if local_classifier.w_holdout(p[0], holdout)]
+        if not treningowe:
+            click.echo("Brak danych treningowych (produkty z kategorią inną niż TrudnoOkreslic)")
+            return
+
+        start = time.perf_counter()
+        model = local_classifier.NaiveBayesClassifier(alpha).fit(treningowe)
+        czas = time.perf_counter() - start
+        # Temperatura i próg z odłożonych nazw - bez nich model nie klasyfikuje w aplikacji
+        model.calibrate(testowe)
+        trafnosc = app.config.get('LOCAL_CLASSIFIER_TARGET_ACCURACY', local_classifier.DEFAULT_TARGET_ACCURACY)
+        prog = local_classifier.wybierz_prog(model, testowe, trafnosc)
+        raport = local_classifier.ocen(model, testowe)
+        model.meta = {
+            'trained_at': datetime.now().isoformat(timespec='seconds'),
+            'train_examples': len(treningowe),
+            'holdout': holdout,
+            'holdout_report': raport,
+            'target_accuracy': trafnosc,
+            'threshold': prog,
+        }
+        local_classifier.zapisz_model(model, path)
+        click.echo(f"Model: {len(model.classes)} kategorii, {len(model.feature_counts)} cech, "
+                   f"{len(treningowe)} nazw treningowych, trening {czas:.1f} s -> {path}")
+        _wypisz_raport(raport)
+        click.echo(f"Temperatura: {model.temperature}")
+        if prog is None:
+            click.echo(f"Żaden próg nie daje trafności {trafnosc} na odłożonych nazwach - "
+                       f"poziom lokalny pozostaje wyłączony (chyba że ustawiono LOCAL_CLASSIFIER_THRESHOLD)")
+        else:
+            click.echo(f"Próg zapisany w modelu: {prog} (trafność >= {trafnosc} na odłożonych nazwach)")
+
+    @app.cli.command('evaluate-classifier')
+    @click.option('--holdout', default=0.1, show_default=True, help='Część nazw użyta do oceny (jak przy treningu)')
+    @click.option('--model', 'model_path', default=None, help='Plik modelu (domyślnie LOCAL_CLASSIFIER_PATH)')
+    def evaluate_classifier(holdout, model_path):
+        """Ocenia zapisany klasyfikator na odłożonych nazwach z bieżącej bazy"""
+        import json
+        from services import local_classifier, reference_cache
+
+        path = model_path or app.config['LOCAL_CLASSIFIER_PATH']
+        try:
+            with open(path, 'r', encoding='utf-8') as handle:
+                model = local_classifier.NaiveBayesClassifier.from_dict(json.load(handle))
+        except (OSError, ValueError, KeyError) as e:
+            click.echo(f"Nie można wczytać modelu {path}: {e}")
+            return
+        trudne = reference_cache.kategorie.id_for('TrudnoOkreslic')
+        testowe = [
+            p for p in local_classifier.dane_treningowe([trudne] if trudne is not None else [])
+            if local_classifier.w_holdout(p[0], holdout)
+        ]
+        start = time.perf_counter()
+        raport = local_classifier.ocen(model, testowe)
+        czas = time.perf_counter() - start
+        click.echo(f"Model z {model.meta.get('trained_at', '?')}, {len(testowe)} nazw testowych, "
+                   f"{czas * 1e6 / max(1, len(testowe)):.0f} µs na nazwę")
+        _wypisz_raport(raport)
+        click.echo(f"Próg w modelu: {model.meta.get('threshold')}, "
+                   f"LOCAL_CLASSIFIER_THRESHOLD={app.config.get('LOCAL_CLASSIFIER_THRESHOLD')}")
+
+    @app.cli.command('rebuild-rollups')
+    @click.option('--user', 'id_uzytkownika', type=int, default=None, help='Tylko jeden użytkownik')
+    def rebuild_rollups(id_uzytkownika):
+        """Przebudowuje agregaty wydatków (dzień x kategoria, miesiąc x sklep) z paragonów"""
+        from db import DatabaseHelper
+        from services import rollups
+
+        if id_uzytkownika is not None:
+            uzytkownicy = [id_uzytkownika]
+        else:
+            uzytkownicy = [w['id_uzytkownika'] for w in DatabaseHelper.fetch_all(
+                "SELECT DISTINCT id_uzytkownika FROM paragony ORDER BY id_uzytkownika")]
+            DatabaseHelper.rollback()
+        start = time.perf_counter()
+        for numer, uzytkownik in enumerate(uzytkownicy, start=1):
+            rollups.przebuduj(uzytkownik)
+            if numer % 100 == 0:
+                click.echo(f"Przebudowano {numer}/{len(uzytkownicy)} użytkowników")
+        click.echo(f"Gotowe: agregaty {len(uzytkownicy)} użytkowników w {time.perf_counter() - start:.1f} s")
+
+    @app.cli.command('explain-queries')
+    @click.option('--user', 'id_uzytkownika', type=int, default=1, show_default=True, help='Użytkownik w parametrach zapytań')
+    @click.option('--min-rows', default=1000, show_default=True, help='Pełny skan od tylu wierszy jest błędem')
+    @click.option('--verbose', is_flag=True, help='Wypisz pełne plany EXPLAIN')
+    def explain_queries(id_uzytkownika, min_rows, verbose):
+        """Sprawdza plany zapytań raportowych (indeksy, pełne skany); kod wyjścia 1 przy regresji"""
+        from services import explain_check
+
+        wyniki = explain_check.sprawdz(id_uzytkownika, min_rows)
+        bledy = 0
+        for wynik in wyniki:
+            click.echo(f"{'BŁĄD' if wynik['bledy'] else 'OK  '} {wynik['nazwa']}")
+            for komunikat in wynik['bledy']:
+                click.echo(f"       ✗ {komunikat}")
+            for komunikat in wynik['ostrzezenia']:
+                click.echo(f"       ! {komunikat}")
+            if verbose:
+                for wiersz in wynik['plan']:
+                    click.echo(f"       {wiersz.get('table')}: type={wiersz.get('type')} key={wiersz.get('key')} "
+                               f"rows={wiersz.get('rows')} {wiersz.get('Extra') or ''}")
+            bledy += bool(wynik['bledy'])
+        click.echo(f"Zapytania z regresją: {bledy}/{len(wyniki)}")
+        if bledy:
+            raise SystemExit(1)
+
+    @app.cli.command('archive-logs')
+    @click.option('--days', type=int, default=None, help='Ile dni logów zostaje w bazie (domyślnie LOGS_RETENTION_DAYS)')
+    @click.option('--output-dir', default=None, help='Katalog archiwum (domyślnie LOGS_ARCHIVE_DIR)')
+    @click.option('--batch', default=5000, show_default=True, help='Liczba wpisów w jednej paczce')
+    @click.option('--dry-run', is_flag=True, help='Tylko policz wpisy do archiwizacji')
+    @click.option('--optimize', is_flag=True, help='Po usunięciu odbuduj tabelę logi (OPTIMIZE TABLE)')
+    def archive_logs(days, output_dir, batch, dry_run, optimize):
+        """Przenosi stare logi aktywności do plików logi-RRRR-MM.jsonl.gz i usuwa je z bazy"""
+        from services import log_retention
+
+        if days is None:
+            days = app.config.get('LOGS_RETENTION_DAYS', log_retention.DEFAULT_RETENTION_DAYS)
+        katalog = output_dir or app.config['LOGS_ARCHIVE_DIR']
+        start = time.perf_counter()
+        raport = log_retention.archiwizuj(katalog, days, batch, proba=dry_run, optymalizuj=optimize)
+        for miesiac, wpisy in sorted(raport['miesiace'].items()):
+            click.echo(f"  {miesiac}: {wpisy} wpisów")
+        if dry_run:
+            click.echo(f"Do archiwizacji: {raport['wpisy']} wpisów starszych niż {raport['granica']}")
+        else:
+            click.echo(f"Gotowe: {raport['wpisy']} wpisów starszych niż {raport['granica']} przeniesiono do {katalog} "
+                       f"w {time.perf_counter() - start:.1f} s")
+
+    def _wypisz_raport(raport):
+        click.echo(f"Trafność: {raport['accuracy']} ({raport['examples']} produktów)")
+        for prog, wynik in raport['thresholds'].items():
+            click.echo(f"  pewność >= {prog}: pokrycie {wynik['coverage']}, trafność {wynik['accuracy']}")
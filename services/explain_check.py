@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+"""
+Kontrola planów zapytań raportowych (EXPLAIN) - ochrona przed regresją indeksów
+Obsługuje polskie znaki: ą, ć, ę, ł, ń, ó, ś, ź, ż
+
+Zapytania nie są tu kopiowane - ZAPYTANIA importuje teksty SQL i buildery
+z api.py oraz narzędzi asystenta (wydatki, limity, powiadomienia), więc
+sprawdzany jest dokładnie ten SQL, który wykonuje aplikacja.
+Każde zapytanie z listy ZAPYTANIA ma wskazane tabele (aliasy) i indeks,
+który musi znaleźć się w possible_keys planu - to potwierdza, że filtr jest
+sargable i że indeks z migracji istnieje. Pełny skan (type=ALL) tabeli
+z co najmniej `min_rows` szacowanymi wierszami też jest błędem; na małej
+bazie deweloperskiej optymalizator może skanować mimo indeksu, więc
+mniejsze skany są tylko raportowane. Uruchamiane przez flask explain-queries.
+"""
+from datetime import date, timedelta
+from typing import Dict, List
+
+
+def _paragony_okres(id_uzytkownika, start, koniec):
+    from assistant_ai.tools.expense_tools import ZAPYTANIE_WYDATKI_OKRES
+    return ZAPYTANIE_WYDATKI_OKRES, {'user_id': id_uzytkownika, 'start_date': start, 'end_date': koniec}
+
+
+def _produkty_kategorie_okres(id_uzytkownika, start, koniec):
+    from assistant_ai.tools.expense_tools import ZAPYTANIE_WYDATKI_KATEGORII
+    return ZAPYTANIE_WYDATKI_KATEGORII, {
+        'user_id': id_uzytkownika, 'category': '%', 'start_date': start, 'end_date': koniec,
+    }
+
+
+def _alerty_limitow(id_uzytkownika, start, koniec):
+    from assistant_ai.tools.notification_tools import ZAPYTANIE_ALERTY_LIMITOW
+    return ZAPYTANIE_ALERTY_LIMITOW, {'user_id': id_uzytkownika}
+
+
+def _status_limitow(id_uzytkownika, start, koniec):
+    from assistant_ai.tools.budget_tools import ZAPYTANIE_STATUS_LIMITOW
+    return ZAPYTANIE_STATUS_LIMITOW, {'user_id': id_uzytkownika}
+
+
+def _raport_dzien_kategoria(id_uzytkownika, start, koniec):
+    from api import RAPORT_Z_FILTREM_GRUPOWANIE, RAPORT_Z_FILTREM_SQL
+    return RAPORT_Z_FILTREM_SQL + RAPORT_Z_FILTREM_GRUPOWANIE, {
+        'id_uzytkownika': id_uzytkownika, 'start_date': start, 'end_date': koniec,
+    }
+
+
+def _trendy_miesiac_sklep(id_uzytkownika, start, koniec):
+    from assistant_ai.tools.expense_tools import ZAPYTANIE_TRENDY_MIESIECZNE
+    return ZAPYTANIE_TRENDY_MIESIECZNE, {'user_id': id_uzytkownika, 'months': 6}
+
+
+def _logi_okres(id_uzytkownika, start, koniec):
+    from api import zapytanie_logow
+    return zapytanie_logow(id_uzytkownika, date_from=start, date_to=koniec, cursor='')
+
+
+def _logi(**filtry):
+    """Lista /logi z jednym filtrem, pierwsza strona stronicowania kursorem"""
+    def zapytanie(id_uzytkownika, start, koniec):
+        from api import zapytanie_logow
+        return zapytanie_logow(id_uzytkownika, cursor='', **filtry)
+    return zapytanie
+
+
+# Zapytania budowane przez kod aplikacji (te same teksty SQL i buildery co w widokach i narzędziach
+# asystenta) - zmiana zapytania w aplikacji od razu zmienia sprawdzany plan
+ZAPYTANIA = [
+    {'nazwa': 'paragony_okres', 'zapytanie': _paragony_okres,
+     'indeksy': {'p': 'paragony_uzytkownik_data'}},
+    {'nazwa': 'produkty_kategorie_okres', 'zapytanie': _produkty_kategorie_okres,
+     'indeksy': {'p': 'paragony_uzytkownik_data', 'pr': 'produkty_paragon_kategoria_cena'}},
+    {'nazwa': 'limity_biezacy_miesiac', 'zapytanie': _alerty_limitow,
+     'indeksy': {'p': 'paragony_uzytkownik_data'}},
+    {'nazwa': 'limity_status_miesiac', 'zapytanie': _status_limitow,
+     'indeksy': {'wydatki_dzien_kategoria': 'PRIMARY'}},
+    {'nazwa': 'raport_dzien_kategoria', 'zapytanie': _raport_dzien_kategoria,
+     'indeksy': {'w': 'PRIMARY'}},
+    {'nazwa': 'trendy_miesiac_sklep', 'zapytanie': _trendy_miesiac_sklep,
+     'indeksy': {'w': 'PRIMARY'}},
+    {'nazwa': 'logi_okres', 'zapytanie': _logi_okres,
+     'indeksy': {'l': 'logi_uzytkownik_czas'}},
+    {'nazwa': 'logi_akcja', 'zapytanie': _logi(action='login'),
+     'indeksy': {'l': 'logi_uzytkownik_akcja_czas'}},
+    {'nazwa': 'logi_details', 'zapytanie': _logi(details_search='paragon'),
+     'indeksy': {'l': 'logi_details_ft'}},
+]
+
+
+def sprawdz(id_uzytkownika: int, min_rows: int = 1000) -> List[Dict]:
+    """
+    Wykonuje EXPLAIN dla zapytań z ZAPYTANIA (po przepisaniu filtrów dat, jak w DatabaseHelper)
+
+    Returns:
+        Lista wyników: nazwa, plan (wiersze EXPLAIN), bledy, ostrzezenia
+    """
+    from db import DatabaseHelper
+    dzis = date.today()
+    start = dzis - timedelta(days=90)
+    wyniki = []
+    for zapytanie in ZAPYTANIA:
+        sql, parametry = DatabaseHelper.sargable_dates(*zapytanie['zapytanie'](id_uzytkownika, start, dzis))
+        bledy = []
+        ostrzezenia = []
+        try:
+            plan = DatabaseHelper.fetch_all("EXPLAIN " + sql, parametry)
+        except Exception as e:
+            DatabaseHelper.rollback()
+            wyniki.append({'nazwa': zapytanie['nazwa'], 'plan': [], 'bledy': [f"EXPLAIN nie powiódł się: {e}"], 'ostrzezenia': []})
+            continue
+        for alias, indeks in zapytanie['indeksy'].items():
+            wiersze = [wiersz for wiersz in plan if wiersz.get('table') == alias]
+            if not wiersze:
+                ostrzezenia.append(f"{alias}: brak tabeli w planie (optymalizator ją pominął)")
+                continue
+            for wiersz in wiersze:
+                mozliwe = (wiersz.get('possible_keys') or '').split(',')
+                if indeks not in mozliwe and wiersz.get('key') != indeks:
+                    bledy.append(f"{alias}: indeks {indeks} niedostępny (possible_keys={wiersz.get('possible_keys')})")
+                if wiersz.get('type') == 'ALL':
+                    komunikat = f"{alias}: pełny skan, ~{wiersz.get('rows')} wierszy"
+                    if (wiersz.get('rows') or 0) >= min_rows:
+                        bledy.append(komunikat)
+                    else:
+                        ostrzezenia.append(komunikat)
+        wyniki.append({'nazwa': zapytanie['nazwa'], 'plan': plan, 'bledy': bledy, 'ostrzezenia': ostrzezenia})
+    DatabaseHelper.rollback()
+    return wyniki
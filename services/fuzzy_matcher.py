@@ -0,0 +1,213 @@
+# -*- coding: utf-8 -*-
+"""
+Lokalne dopasowanie nazw firm i miast z paragonu do słowników
+Obsługuje polskie znaki: ą, ć, ę, ł, ń, ó, ś, ź, ż
+
+Nazwa z OCR jest normalizowana (wielkość liter, polskie znaki, formy prawne
+typu "SP. Z O.O.", numery sklepów, interpunkcja), a następnie porównywana
+z indeksem trigramów i tokenów zbudowanym z tabeli firmy/miasta. Wynik
+powyżej progu FUZZY_MATCH_THRESHOLD jest przyjmowany bez pytania Gemini.
+"""
+import re
+import threading
+import unicodedata
+from collections import defaultdict
+from typing import Dict, List, Optional, Set, Tuple
+
+from services import metrics, reference_cache
+
+DEFAULT_THRESHOLD = 0.85
+# Dwa różne wyniki bliżej siebie niż ta wartość uznajemy za niejednoznaczne
+AMBIGUITY_MARGIN = 0.02
+# Wynik przy pełnym zawarciu tokenów kandydata w nazwie z paragonu
+CONTAINMENT_SCORE = 0.9
+
+_POLISH = str.maketrans({'ł': 'l', 'Ł': 'l'})
+_NON_WORD = re.compile(r"[^a-z ]+")
+_LEGAL_FORMS = re.compile(
+    r"\b(?:sp\s*z\s*o\s*o|sp\s*k|sp\s*j|sp\s*p|s\s*a|s\s*c|"
+    r"spolka(?:\s+z\s+ograniczona\s+odpowiedzialnoscia|\s+komandytowa|\s+jawna|\s+akcyjna|\s+cywilna)?|"
+    r"sp|oddzial|sklep|market)\b"
+)
+_WHITESPACE = re.compile(r"\s+")
+
+_SCORE_BUCKETS = ((0.5, 'lt_0_5'), (0.7, '0_5_0_7'), (0.85, '0_7_0_85'), (1.01, 'ge_0_85'))
+
+
+def normalize(name: Optional[str]) -> str:
+    """Sprowadza nazwę do postaci porównywalnej: 'LIDL SP. Z O.O. SP. K.' -> 'lidl'"""
+    if not name:
+        return ''
+    text = str(name).translate(_POLISH).casefold()
+    text = unicodedata.normalize('NFKD', text)
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch))
+    text = _NON_WORD.sub(' ', text)
+    text = _LEGAL_FORMS.sub(' ', text)
+    return _WHITESPACE.sub(' ', text).strip()
+
+
+def _tokens(normalized: str) -> Set[str]:
+    return {token for token in normalized.split(' ') if len(token) > 1}
+
+
+def _trigrams(normalized: str) -> Set[str]:
+    padded = f"  {normalized} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class FuzzyIndex:
+    """Indeks trigramów/tokenów nad jedną tabelą z reference_cache"""
+
+    def __init__(self, reference: 'reference_cache.ReferenceTable', skip_names=('TrudnoOkreslic',)):
+        self.reference = reference
+        self.skip_names = set(skip_names)
+
+        self._lock = threading.Lock()
+        self._version = None
+        self._exact: Dict[str, int] = {}
+        self._entries: Dict[int, Tuple[str, str, Set[str], Set[str]]] = {}
+        self._by_trigram: Dict[str, Set[int]] = {}
+
+        self.exact = 0
+        self.accepted = 0
+        self.rejected = 0
+        self.ambiguous = 0
+        self.score_buckets = {label: 0 for _, label in _SCORE_BUCKETS}
+
+    @staticmethod
+    def _threshold() -> float:
+        try:
+            from flask import current_app
+            return float(current_app.config.get('FUZZY_MATCH_THRESHOLD', DEFAULT_THRESHOLD))
+        except RuntimeError:
+            return DEFAULT_THRESHOLD
+
+    def _ensure_index(self):
+        rows = self.reference.rows()
+        with self._lock:
+            if self._version == self.reference.version:
+                return
+            exact = {}
+            entries = {}
+            by_trigram = defaultdict(set)
+            for row in rows:
+                name = row.get(self.reference.name_column)
+                if not name or name in self.skip_names:
+                    continue
+                normalized = normalize(name)
+                if not normalized:
+                    continue
+                id_value = row[self.reference.id_column]
+                exact.setdefault(normalized, id_value)
+                trigrams = _trigrams(normalized)
+                entries[id_value] = (name, normalized, _tokens(normalized), trigrams)
+                for trigram in trigrams:
+                    by_trigram[trigram].add(id_value)
+            self._exact = exact
+            self._entries = entries
+            self._by_trigram = dict(by_trigram)
+            self._version = self.reference.version
+
+    def _record_score(self, score: float):
+        for limit, label in _SCORE_BUCKETS:
+            if score < limit:
+                self.score_buckets[label] += 1
+                return
+
+    def match(self, name: Optional[str]) -> Tuple[Optional[int], float, Optional[str]]:
+        """
+        Szuka najlepszego dopasowania nazwy w słowniku
+
+        Returns:
+            (id, wynik 0-1, nazwa ze słownika); id=None gdy pewność poniżej progu
+        """
+        normalized = normalize(name)
+        if not normalized:
+            return None, 0.0, None
+        self._ensure_index()
+
+        if normalized in self._exact:
+            id_value = self._exact[normalized]
+            self.exact += 1
+            self._record_score(1.0)
+            return id_value, 1.0, self._entries[id_value][0]
+
+        query_tokens = _tokens(normalized)
+        query_trigrams = _trigrams(normalized)
+        candidates = set()
+        for trigram in query_trigrams:
+            candidates.update(self._by_trigram.get(trigram, ()))
+
+        scored = []
+        for id_value in candidates:
+            label, _, tokens, trigrams = self._entries[id_value]
+            dice = 2.0 * len(query_trigrams & trigrams) / (len(query_trigrams) + len(trigrams))
+            score = dice
+            if tokens and tokens <= query_tokens:
+                score = max(score, CONTAINMENT_SCORE)
+            scored.append((score, dice, id_value, label))
+
+        if not scored:
+            self.rejected += 1
+            self._record_score(0.0)
+            return None, 0.0, None
+
+        scored.sort(reverse=True)
+        best_score, best_dice, best_id, best_label = scored[0]
+        self._record_score(best_score)
+
+        if best_score < self._threshold():
+            self.rejected += 1
+            return None, best_score, best_label
+        if len(scored) > 1:
+            second_score, second_dice = scored[1][0], scored[1][1]
+            if best_score - second_score < AMBIGUITY_MARGIN and best_dice - second_dice < AMBIGUITY_MARGIN:
+                self.ambiguous += 1
+                return None, best_score, best_label
+        self.accepted += 1
+        return best_id, best_score, best_label
+
+    def candidates(self, name: Optional[str], limit: int) -> List[str]:
+        """
+        Najbardziej podobne nazwy ze słownika (bez progu) - lista kandydatów do promptu
+
+        Returns:
+            Do `limit` nazw ze słownika, od najlepiej pasującej
+        """
+        normalized = normalize(name)
+        if not normalized or limit <= 0:
+            return []
+        self._ensure_index()
+        query_tokens = _tokens(normalized)
+        query_trigrams = _trigrams(normalized)
+        candidates = set()
+        for trigram in query_trigrams:
+            candidates.update(self._by_trigram.get(trigram, ()))
+
+        scored = []
+        for id_value in candidates:
+            label, _, tokens, trigrams = self._entries[id_value]
+            score = 2.0 * len(query_trigrams & trigrams) / (len(query_trigrams) + len(trigrams))
+            if tokens and query_tokens and (tokens <= query_tokens or query_tokens <= tokens):
+                score = max(score, CONTAINMENT_SCORE)
+            scored.append((score, label))
+        scored.sort(key=lambda item: item[0], reverse=True)
+        return [label for _, label in scored[:limit]]
+
+    def stats(self) -> Dict:
+        return {
+            'entries': len(self._entries),
+            'exact': self.exact,
+            'accepted': self.accepted,
+            'rejected': self.rejected,
+            'ambiguous': self.ambiguous,
+            'score_buckets': dict(self.score_buckets),
+        }
+
+
+firmy = FuzzyIndex(reference_cache.firmy)
+miasta = FuzzyIndex(reference_cache.miasta)
+# Tylko do wyboru kandydatów w promptach klasyfikacji (prompt_builder), nie do match()
+kategorie = FuzzyIndex(reference_cache.kategorie)
+
+metrics.register('fuzzy_matcher', lambda: {'firmy': firmy.stats(), 'miasta': miasta.stats()})
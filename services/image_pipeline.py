@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+"""
+Jednorazowe przetwarzanie wstępne obrazu paragonu
+Obsługuje polskie znaki: ą, ć, ę, ł, ń, ó, ś, ź, ż
+
+Wcześniej ten sam plik był dekodowany kilka razy: w /analyze-receipt
+(base64 -> bajty -> base64), w paragonik (Image.open, konwersja, zbędny
+zapis JPEG), w bibliotece Gemini (ponowne kodowanie obrazu PIL), w
+dodajParagon (Image.open, EXIF, konwersja, miniatura) i w generatorze
+wariantów. PreprocessedImage dekoduje plik raz, raz poprawia orientację
+z EXIF i konwertuje do RGB, a następnie z tego samego obrazu w pamięci
+tworzy wejście OCR oraz obraz archiwalny zapisywany w magazynie.
+"""
+import base64
+import io
+import threading
+from typing import BinaryIO, Dict, Optional, Union
+
+from PIL import Image, ImageOps
+
+# Dłuższy bok obrazu wysyłanego do Gemini - większe obrazy model i tak skaluje w dół
+DEFAULT_OCR_MAX_SIDE = 3072
+OCR_QUALITY = 90
+
+# Obraz archiwalny w paragony.obraz_hash (jak dotychczas w dodajParagon)
+ARCHIVE_MAX_SIDE = 800
+ARCHIVE_QUALITY = 50
+
+# dHash: 8x8 = 64 bity (kolumna paragony.phash)
+DHASH_SIZE = 8
+
+
+def _ocr_max_side() -> int:
+    try:
+        from flask import current_app
+        return int(current_app.config.get('OCR_IMAGE_MAX_SIDE', DEFAULT_OCR_MAX_SIDE))
+    except RuntimeError:
+        return DEFAULT_OCR_MAX_SIDE
+
+
+def do_rgb(img: Image.Image) -> Image.Image:
+    """Konwersja do RGB - przezroczystość zamieniana na białe tło (JPEG jej nie obsługuje)"""
+    if img.mode in ('RGBA', 'LA', 'P'):
+        if img.mode == 'P':
+            img = img.convert('RGBA')
+        background = Image.new('RGB', img.size, (255, 255, 255))
+        background.paste(img, mask=img.split()[-1])
+        return background
+    if img.mode != 'RGB':
+        return img.convert('RGB')
+    return img
+
+
+def zakoduj_jpeg(img: Image.Image, max_side: Optional[int], quality: int) -> bytes:
+    """Skaluje kopię obrazu (gdy przekracza max_side) i koduje ją jako JPEG"""
+    if max_side and max(img.size) > max_side:
+        img = img.copy()
+        img.thumbnail((max_side, max_side))
+    buffer = io.BytesIO()
+    img.save(buffer, format='JPEG', quality=quality)
+    return buffer.getvalue()
+
+
+def dhash(img: Image.Image, size: int = DHASH_SIZE) -> int:
+    """
+    Skrót percepcyjny (difference hash) - 64 bity dla size=8
+
+    Obraz w skali szarości zmniejszony do (size+1) x size; każdy bit mówi,
+    czy piksel jest jaśniejszy od sąsiada po prawej. Ponowne zdjęcie lub
+    ponowna kompresja tego samego paragonu zmienia tylko kilka bitów.
+    """
+    maly = img.convert('L').resize((size + 1, size), Image.LANCZOS)
+    piksele = list(maly.getdata())
+    wynik = 0
+    for wiersz in range(size):
+        for kolumna in range(size):
+            lewy = piksele[wiersz * (size + 1) + kolumna]
+            prawy = piksele[wiersz * (size + 1) + kolumna + 1]
+            wynik = (wynik << 1) | (1 if lewy > prawy else 0)
+    return wynik
+
+
+def hamming(a: int, b: int) -> int:
+    """Liczba różnych bitów dwóch skrótów"""
+    return bin(a ^ b).count('1')
+
+
+class PreprocessedImage:
+    """Obraz paragonu zdekodowany raz, z poprawioną orientacją i w RGB"""
+
+    def __init__(self, oryginal: bytes):
+        self.oryginal = oryginal
+        with Image.open(io.BytesIO(oryginal)) as zrodlo:
+            self.format = zrodlo.format
+            img = ImageOps.exif_transpose(zrodlo)
+            img = do_rgb(img)
+            # exif_transpose/do_rgb mogą zwrócić leniwy obraz powiązany z plikiem
+            img.load()
+        self.image = img
+        self._lock = threading.Lock()
+        self._ocr_jpeg: Optional[bytes] = None
+        self._archiwum: Optional[bytes] = None
+        self._dhash: Optional[int] = None
+
+    @classmethod
+    def z_danych(cls, dane: Union['PreprocessedImage', bytes, str, BinaryIO]) -> 'PreprocessedImage':
+        """Tworzy obraz z bajtów, pliku (np. uploadu) lub tekstu base64 (gotowy obraz zwraca bez zmian)"""
+        if isinstance(dane, PreprocessedImage):
+            return dane
+        if hasattr(dane, 'read'):
+            dane = dane.read()
+        elif isinstance(dane, str):
+            dane = base64.b64decode(dane)
+        return cls(dane)
+
+    @property
+    def ocr_jpeg(self) -> bytes:
+        """JPEG wysyłany do OCR, przeskalowany do OCR_IMAGE_MAX_SIDE"""
+        with self._lock:
+            if self._ocr_jpeg is None:
+                self._ocr_jpeg = zakoduj_jpeg(self.image, _ocr_max_side(), OCR_QUALITY)
+            return self._ocr_jpeg
+
+    def ocr_blob(self) -> Dict:
+        """Wejście obrazu dla generate_content (bez ponownego kodowania w bibliotece)"""
+        return {'mime_type': 'image/jpeg', 'data': self.ocr_jpeg}
+
+    @property
+    def archiwum(self) -> bytes:
+        """JPEG 800px / jakość 50 zapisywany w magazynie jako obraz paragonu"""
+        with self._lock:
+            if self._archiwum is None:
+                self._archiwum = zakoduj_jpeg(self.image, ARCHIVE_MAX_SIDE, ARCHIVE_QUALITY)
+            return self._archiwum
+
+    @property
+    def dhash(self) -> int:
+        """Skrót percepcyjny obrazu (do wykrywania ponownie przesłanych paragonów)"""
+        with self._lock:
+            if self._dhash is None:
+                self._dhash = dhash(self.image)
+            return self._dhash
@@ -0,0 +1,335 @@
+# -*- coding: utf-8 -*-
+"""
+Kolejka zadań skanowania paragonów (tryb asynchroniczny /analyze-receipt)
+Obsługuje polskie znaki: ą, ć, ę, ł, ń, ó, ś, ź, ż
+
+Zadania zapisywane są w lokalnym pliku SQLite, a przesłane obrazy w katalogu
+obok niego - kolejka działa bez zewnętrznego brokera i przeżywa restart
+procesu. Pula wątków roboczych pobiera zadania (atomowo, także między
+procesami gunicorna) i uruchamia na nich Ekstrakcja.paragonik.
+"""
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import BinaryIO, Callable, Dict, Optional, Union
+
+from services import rate_limit
+
+STATUS_QUEUED = 'queued'
+STATUS_RUNNING = 'running'
+STATUS_DONE = 'done'
+STATUS_FAILED = 'failed'
+STATUS_DUPLICATE = 'duplicate'
+
+
+class ReceiptJobQueue:
+    """Kolejka zadań oparta o SQLite z pulą wątków roboczych"""
+
+    def __init__(self, queue_dir: str, workers: int = 2, poll_interval: float = 1.0,
+                 stale_after: int = 900, retention_days: int = 7):
+        """
+        Inicjalizacja kolejki
+
+        Args:
+            queue_dir: Katalog na plik SQLite i przesłane obrazy
+            workers: Liczba wątków roboczych w tym procesie
+            poll_interval: Co ile sekund bezczynny wątek sprawdza kolejkę
+            stale_after: Po ilu sekundach zadanie 'running' uznajemy za porzucone
+            retention_days: Po ilu dniach usuwamy zakończone zadania
+        """
+        self.queue_dir = queue_dir
+        self.upload_dir = os.path.join(queue_dir, 'uploads')
+        self.db_path = os.path.join(queue_dir, 'jobs.sqlite3')
+        self.workers = max(1, int(workers))
+        self.poll_interval = poll_interval
+        self.stale_after = stale_after
+        self.retention_days = retention_days
+
+        self._api_keys: Dict[str, str] = {}
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._threads = []
+
+        os.makedirs(self.upload_dir, exist_ok=True)
+        self._init_schema()
+
+    # ------------------------------------------------------------------
+    # SQLite
+    # ------------------------------------------------------------------
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        connection.row_factory = sqlite3.Row
+        return connection
+
+    def _init_schema(self):
+        connection = self._connect()
+        try:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    job_id TEXT PRIMARY KEY,
+                    id_uzytkownika INTEGER NOT NULL,
+                    status TEXT NOT NULL,
+                    upload_path TEXT,
+                    id_paragonu INTEGER,
+                    error TEXT,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    created_at TEXT NOT NULL,
+                    started_at TEXT,
+                    finished_at TEXT
+                )
+            """)
+            connection.execute("CREATE INDEX IF NOT EXISTS jobs_status_created ON jobs (status, created_at)")
+            try:
+                # Kolumna dodana później - kolejki utworzone wcześniej dostają ją przy starcie
+                connection.execute("ALTER TABLE jobs ADD COLUMN force INTEGER NOT NULL DEFAULT 0")
+            except sqlite3.OperationalError:
+                pass
+        finally:
+            connection.close()
+
+    @staticmethod
+    def _now() -> str:
+        return datetime.utcnow().isoformat(timespec='seconds')
+
+    # ------------------------------------------------------------------
+    # API kolejki
+    # ------------------------------------------------------------------
+
+    def enqueue(self, id_uzytkownika: int, image_bytes: Union[bytes, BinaryIO], api_key: Optional[str] = None,
+                force: bool = False) -> str:
+        """
+        Zapisuje przesłany obraz na dysku i dodaje zadanie do kolejki
+
+        Args:
+            id_uzytkownika: ID właściciela paragonu
+            image_bytes: Zdekodowane bajty obrazu albo plik (kopiowany strumieniowo)
+            api_key: Klucz Gemini użytkownika (trzymany tylko w pamięci procesu)
+            force: Zapisz paragon nawet jeśli wygląda na duplikat
+
+        Returns:
+            ID zadania
+        """
+        job_id = uuid.uuid4().hex
+        upload_path = os.path.join(self.upload_dir, f"{job_id}.bin")
+        tmp_path = upload_path + '.tmp'
+        with open(tmp_path, 'wb') as handle:
+            if hasattr(image_bytes, 'read'):
+                shutil.copyfileobj(image_bytes, handle)
+            else:
+                handle.write(image_bytes)
+        os.replace(tmp_path, upload_path)
+
+        if api_key:
+            self._api_keys[job_id] = api_key
+
+        connection = self._connect()
+        try:
+            connection.execute(
+                "INSERT INTO jobs (job_id, id_uzytkownika, status, upload_path, created_at, force) VALUES (?, ?, ?, ?, ?, ?)",
+                (job_id, id_uzytkownika, STATUS_QUEUED, upload_path, self._now(), 1 if force else 0),
+            )
+        finally:
+            connection.close()
+
+        self._wake.set()
+        return job_id
+
+    def get(self, job_id: str, id_uzytkownika: Optional[int] = None) -> Optional[Dict]:
+        """
+        Zwraca stan zadania (opcjonalnie tylko jeśli należy do użytkownika)
+
+        Returns:
+            Słownik ze stanem zadania lub None
+        """
+        connection = self._connect()
+        try:
+            row = connection.execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+            if row is None:
+                return None
+            if id_uzytkownika is not None and int(row['id_uzytkownika']) != int(id_uzytkownika):
+                return None
+            job = {
+                'job_id': row['job_id'],
+                'status': row['status'],
+                'id_paragonu': row['id_paragonu'],
+                'error': row['error'],
+                'attempts': row['attempts'],
+                'created_at': row['created_at'],
+                'started_at': row['started_at'],
+                'finished_at': row['finished_at'],
+            }
+            if row['status'] == STATUS_QUEUED:
+                ahead = connection.execute(
+                    "SELECT COUNT(*) FROM jobs WHERE status = ? AND created_at < ?",
+                    (STATUS_QUEUED, row['created_at']),
+                ).fetchone()[0]
+                job['position'] = int(ahead)
+            return job
+        finally:
+            connection.close()
+
+    def _claim(self) -> Optional[sqlite3.Row]:
+        """Atomowo przejmuje najstarsze oczekujące zadanie"""
+        connection = self._connect()
+        try:
+            connection.execute("BEGIN IMMEDIATE")
+            row = connection.execute(
+                "SELECT * FROM jobs WHERE status = ? ORDER BY created_at LIMIT 1",
+                (STATUS_QUEUED,),
+            ).fetchone()
+            if row is None:
+                connection.execute("COMMIT")
+                return None
+            connection.execute(
+                "UPDATE jobs SET status = ?, started_at = ?, attempts = attempts + 1 WHERE job_id = ?",
+                (STATUS_RUNNING, self._now(), row['job_id']),
+            )
+            connection.execute("COMMIT")
+            return row
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        finally:
+            connection.close()
+
+    def _finish(self, job_id: str, status: str, id_paragonu: Optional[int] = None, error: Optional[str] = None):
+        connection = self._connect()
+        try:
+            connection.execute(
+                "UPDATE jobs SET status = ?, id_paragonu = ?, error = ?, finished_at = ? WHERE job_id = ?",
+                (status, id_paragonu, error, self._now(), job_id),
+            )
+        finally:
+            connection.close()
+
+    def _housekeeping(self):
+        """Przywraca porzucone zadania i usuwa stare zakończone wpisy"""
+        stale_before = (datetime.utcnow() - timedelta(seconds=self.stale_after)).isoformat(timespec='seconds')
+        purge_before = (datetime.utcnow() - timedelta(days=self.retention_days)).isoformat(timespec='seconds')
+        connection = self._connect()
+        try:
+            connection.execute(
+                "UPDATE jobs SET status = ? WHERE status = ? AND started_at < ?",
+                (STATUS_QUEUED, STATUS_RUNNING, stale_before),
+            )
+            connection.execute(
+                "DELETE FROM jobs WHERE status IN (?, ?, ?) AND finished_at < ?",
+                (STATUS_DONE, STATUS_FAILED, STATUS_DUPLICATE, purge_before),
+            )
+        finally:
+            connection.close()
+
+    # ------------------------------------------------------------------
+    # Wątki robocze
+    # ------------------------------------------------------------------
+
+    def start(self, app, handler: Callable):
+        """
+        Uruchamia wątki robocze (idempotentnie)
+
+        Args:
+            app: Aplikacja Flask - wątki działają w jej kontekście
+            handler: Funkcja (app, id_uzytkownika, image_bytes, api_key, force) -> id_paragonu
+        """
+        with self._lock:
+            if self._threads:
+                return
+            self._housekeeping()
+            for index in range(self.workers):
+                thread = threading.Thread(
+                    target=self._worker_loop,
+                    args=(app, handler),
+                    name=f"receipt-queue-{index}",
+                    daemon=True,
+                )
+                thread.start()
+                self._threads.append(thread)
+            print(f"Kolejka paragonów: uruchomiono {self.workers} wątków roboczych ({self.db_path})")
+
+    def _worker_loop(self, app, handler: Callable):
+        while True:
+            try:
+                row = self._claim()
+            except Exception as e:
+                print(f"Kolejka paragonów: błąd pobierania zadania: {e}")
+                row = None
+            if row is None:
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+                continue
+            self._run_job(app, handler, row)
+
+    def _run_job(self, app, handler: Callable, row: sqlite3.Row):
+        job_id = row['job_id']
+        upload_path = row['upload_path']
+        api_key = self._api_keys.pop(job_id, None)
+        started = time.perf_counter()
+        try:
+            with open(upload_path, 'rb') as handle:
+                image_bytes = handle.read()
+            with app.app_context(), rate_limit.w_tle():
+                id_paragonu = handler(app, row['id_uzytkownika'], image_bytes, api_key, bool(row['force']))
+            self._finish(job_id, STATUS_DONE, id_paragonu=id_paragonu)
+            print(f"Kolejka paragonów: zadanie {job_id} zakończone w {time.perf_counter() - started:.1f}s (paragon {id_paragonu})")
+        except Exception as e:
+            if getattr(e, 'id_paragonu', None) is not None:
+                # Duplikat - zadanie wskazuje istniejący paragon, nowy nie został zapisany
+                print(f"Kolejka paragonów: zadanie {job_id} to duplikat paragonu {e.id_paragonu}")
+                self._finish(job_id, STATUS_DUPLICATE, id_paragonu=e.id_paragonu, error=str(e))
+                return
+            print(f"Kolejka paragonów: zadanie {job_id} nieudane: {e}")
+            self._finish(job_id, STATUS_FAILED, error=str(e))
+        finally:
+            try:
+                os.remove(upload_path)
+            except OSError:
+                pass
+
+
+def process_receipt_job(app, id_uzytkownika: int, image_bytes: bytes, api_key: Optional[str], force: bool = False) -> int:
+    """
+    Uruchamia potok Ekstrakcja.paragonik dla zadania z kolejki
+
+    Klucz Gemini pochodzi z pamięci procesu (przekazany przy enqueue);
+    po restarcie procesu pobieramy go z profilu użytkownika lub konfiguracji.
+    """
+    from ekstrakcja import Ekstrakcja
+    from db import DatabaseHelper
+
+    if not api_key or len(api_key) < 10:
+        record = DatabaseHelper.fetch_one(
+            "SELECT apiKlucz FROM uzytkownicy WHERE id_uzytkownika = :id_uzytkownika",
+            {'id_uzytkownika': id_uzytkownika},
+        )
+        api_key = record.get('apiKlucz') if record else None
+    if not api_key or len(api_key) < 10:
+        api_key = app.config.get('GEMINI_API_KEY', '')
+
+    wynik = Ekstrakcja.paragonik(image_bytes, id_uzytkownika, api_key, wymus=force)
+    # paragonik zwraca ID paragonu albo treść błędu jako tekst
+    if not str(wynik).isdigit():
+        raise RuntimeError(str(wynik))
+    return int(wynik)
+
+
+_queue: Optional[ReceiptJobQueue] = None
+_queue_lock = threading.Lock()
+
+
+def get_receipt_queue(app) -> ReceiptJobQueue:
+    """Zwraca kolejkę procesu, tworząc ją i uruchamiając wątki przy pierwszym użyciu"""
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            _queue = ReceiptJobQueue(
+                app.config['RECEIPT_QUEUE_DIR'],
+                workers=app.config.get('RECEIPT_QUEUE_WORKERS', 2),
+            )
+    _queue.start(app, process_receipt_job)
+    return _queue
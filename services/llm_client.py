@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+"""
+Współdzielona warstwa klienta Gemini
+Obsługuje polskie znaki: ą, ć, ę, ł, ń, ó, ś, ź, ż
+
+genai.configure() zmienia globalny stan biblioteki - przy kluczach per
+użytkownik i wielu wątkach jedno żądanie mogło wysłać zapytanie kluczem
+innego użytkownika, a każde wywołanie budowało nowy transport. Tutaj każdy
+klucz API ma własnego (wątkowo bezpiecznego) klienta gRPC, a modele są
+trzymane w cache według (klucz, model, konfiguracja).
+
+Klient per klucz to publiczny GenerativeServiceClient z
+google.ai.generativelanguage. google.generativeai nie ma publicznego
+sposobu, by podać modelowi własnego klienta - przypisujemy go do
+GenerativeModel._client (atrybut prywatny; wersja biblioteki jest
+przypięta w requriements.txt, google-generativeai==0.8.3, a get_model
+sprawdza, że atrybut nadal istnieje). Wywołania Gemini przechodzą przez
+generate() albo są mierzone przez timed() (np. ChatSession.send_message),
+więc liczniki w /metryki obejmują cały ruch, a limit zapytań per klucz
+(services.rate_limit) obejmuje każde faktyczne zapytanie do Gemini wysłane
+w pracy w tle (import wielu paragonów, kolejka skanów).
+"""
+import json
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+import google.ai.generativelanguage as glm
+import google.generativeai as genai
+from google.api_core import client_options as client_options_lib
+
+from services import metrics, rate_limit
+
+# Wspólne ustawienia bezpieczeństwa (wcześniej kopiowane w każdej metodzie)
+SAFETY_SETTINGS_BLOCK_NONE = [
+    {"category": "HARM_CATEGORY_HARASSMENT", "threshold": "BLOCK_NONE"},
+    {"category": "HARM_CATEGORY_HATE_SPEECH", "threshold": "BLOCK_NONE"},
+    {"category": "HARM_CATEGORY_SEXUALLY_EXPLICIT", "threshold": "BLOCK_NONE"},
+    {"category": "HARM_CATEGORY_DANGEROUS_CONTENT", "threshold": "BLOCK_NONE"},
+]
+
+MAX_CLIENTS = 64
+MAX_MODELS = 256
+
+
+def generation_config(max_output_tokens: int = 8192, **overrides) -> Dict:
+    """Domyślna konfiguracja generowania używana w projekcie"""
+    config = {
+        "temperature": 1,
+        "top_p": 0.95,
+        "top_k": 40,
+        "max_output_tokens": max_output_tokens,
+    }
+    config.update(overrides)
+    return config
+
+
+def _freeze(value) -> str:
+    return json.dumps(value, sort_keys=True, default=str)
+
+
+class GeminiClientPool:
+    """Klienci Gemini per klucz API i cache modeli (bezpieczne dla wątków)"""
+
+    def __init__(self, max_clients: int = MAX_CLIENTS, max_models: int = MAX_MODELS):
+        self.max_clients = max_clients
+        self.max_models = max_models
+        self._lock = threading.Lock()
+        self._clients: "OrderedDict[str, object]" = OrderedDict()
+        self._models: "OrderedDict[tuple, genai.GenerativeModel]" = OrderedDict()
+
+        self.clients_created = 0
+        self.models_created = 0
+        self.model_hits = 0
+        self.calls = 0
+        self.errors = 0
+        self.total_seconds = 0.0
+
+    def _client_for(self, api_key: str):
+        client = self._clients.get(api_key)
+        if client is None:
+            client = glm.GenerativeServiceClient(client_options=client_options_lib.ClientOptions(api_key=api_key))
+            self._clients[api_key] = client
+            self.clients_created += 1
+            while len(self._clients) > self.max_clients:
+                self._clients.popitem(last=False)
+        else:
+            self._clients.move_to_end(api_key)
+        return client
+
+    def get_model(self, api_key: str, model_name: str, generation_config: Optional[Dict] = None,
+                  safety_settings=SAFETY_SETTINGS_BLOCK_NONE, **model_kwargs) -> genai.GenerativeModel:
+        """
+        Zwraca model powiązany z klientem danego klucza API
+
+        Args:
+            api_key: Klucz Gemini (użytkownika lub z konfiguracji)
+            model_name: Np. "gemini-2.5-flash"
+            generation_config: Konfiguracja generowania (słownik)
+            safety_settings: Ustawienia bezpieczeństwa (domyślnie BLOCK_NONE)
+            model_kwargs: Pozostałe argumenty GenerativeModel (np. system_instruction)
+        """
+        if not api_key:
+            raise ValueError("API key (kluczDoGemini) is required")
+        key = (api_key, model_name, _freeze(generation_config), _freeze(safety_settings), _freeze(model_kwargs))
+        with self._lock:
+            model = self._models.get(key)
+            if model is not None:
+                self._models.move_to_end(key)
+                self.model_hits += 1
+                return model
+            model = genai.GenerativeModel(
+                model_name=model_name,
+                safety_settings=safety_settings,
+                generation_config=generation_config,
+                **model_kwargs,
+            )
+            # Model nie sięga po globalnego klienta z genai.configure() (atrybut prywatny - patrz opis modułu)
+            if not hasattr(model, '_client'):
+                raise RuntimeError("google-generativeai: GenerativeModel nie ma atrybutu _client - "
+                                   "sprawdź wersję przypiętą w requriements.txt")
+            model._client = self._client_for(api_key)
+            self._models[key] = model
+            self.models_created += 1
+            while len(self._models) > self.max_models:
+                self._models.popitem(last=False)
+            return model
+
+    @contextmanager
+    def timed(self, api_key: Optional[str] = None):
+        """
+        Zlicza wywołanie Gemini wykonane poza generate() (np. ChatSession.send_message)
+
+        Args:
+            api_key: Klucz użyty w zapytaniu - w pracy w tle przed wywołaniem czekamy na żeton limitu
+        """
+        if api_key and rate_limit.aktywny():
+            rate_limit.gemini.acquire(api_key)
+        started = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            with self._lock:
+                self.errors += 1
+            raise
+        finally:
+            with self._lock:
+                self.calls += 1
+                self.total_seconds += time.perf_counter() - started
+
+    def generate(self, api_key: str, model_name: str, contents, generation_config: Optional[Dict] = None,
+                 safety_settings=SAFETY_SETTINGS_BLOCK_NONE, **model_kwargs):
+        """Wywołuje generate_content na modelu z cache (w tle - w limicie zapytań klucza) i zlicza czas wywołań"""
+        model = self.get_model(api_key, model_name, generation_config, safety_settings, **model_kwargs)
+        with self.timed(api_key):
+            return model.generate_content(contents, stream=False)
+
+    def stats(self) -> Dict:
+        return {
+            'clients': len(self._clients),
+            'models': len(self._models),
+            'clients_created': self.clients_created,
+            'models_created': self.models_created,
+            'model_hits': self.model_hits,
+            'calls': self.calls,
+            'errors': self.errors,
+            'avg_seconds': round(self.total_seconds / self.calls, 3) if self.calls else 0.0,
+        }
+
+
+pool = GeminiClientPool()
+
+metrics.register('gemini', pool.stats)
@@ -0,0 +1,437 @@
+# -*- coding: utf-8 -*-
+"""
+Lokalny klasyfikator kategorii produktów (n-gramy znaków + naiwny Bayes)
+Obsługuje polskie znaki: ą, ć, ę, ł, ń, ó, ś, ź, ż
+
+Drugi poziom klasyfikacji: pamięć klasyfikacji -> model lokalny -> Gemini.
+Model jest trenowany offline (flask train-classifier) na parach
+produkty.nazwa -> id_kategorii zapisanych w bazie i ręcznych poprawkach
+z klasyfikacje_produktow, a zapisywany jako JSON. Cechami są n-gramy znaków
+(2-4) i słowa znormalizowanej nazwy; model liniowy w przestrzeni
+logarytmów działa na CPU w mikrosekundach. Do Gemini trafiają tylko nazwy,
+dla których pewność modelu jest poniżej progu.
+
+Suma logarytmów po kilkudziesięciu zależnych od siebie n-gramach daje
+w naiwnym Bayesie prawdopodobieństwa bliskie 1.0 także dla błędnych
+odpowiedzi, więc pewność liczymy ze średniej wiarygodności na cechę,
+skalowanej temperaturą dopasowaną na odłożonych nazwach. Próg zapisuje
+train-classifier w modelu (najniższy, przy którym trafność na odłożonych
+nazwach osiąga LOCAL_CLASSIFIER_TARGET_ACCURACY); LOCAL_CLASSIFIER_THRESHOLD
+go nadpisuje. Bez progu poziom lokalny jest wyłączony.
+"""
+import json
+import math
+import os
+import threading
+import time
+import unicodedata
+import zlib
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from services import metrics
+from services.category_memo import normalize_name
+
+DEFAULT_TARGET_ACCURACY = 0.97
+DEFAULT_ALPHA = 0.1
+NGRAM_MIN = 2
+NGRAM_MAX = 4
+# Waga ręcznej poprawki względem pojedynczego produktu z paragonu
+MANUAL_WEIGHT = 5
+PROGI_RAPORTU = (0.5, 0.7, 0.8, 0.9, 0.95, 0.99)
+# Siatka temperatur (kalibracja) i minimalna waga odłożonych nazw powyżej wybranego progu
+TEMPERATURY = tuple(round(0.05 * 1.25 ** krok, 4) for krok in range(30))
+MIN_WSPARCIE_PROGU = 50
+
+_POLISH = str.maketrans({'ł': 'l'})
+
+
+def cechy(nazwa: Optional[str]) -> List[str]:
+    """Cechy nazwy produktu: słowa i n-gramy znaków bez polskich znaków"""
+    tekst = normalize_name(nazwa).translate(_POLISH)
+    tekst = unicodedata.normalize('NFKD', tekst)
+    tekst = ''.join(ch for ch in tekst if not unicodedata.combining(ch))
+    if not tekst:
+        return []
+    wynik = [f"w:{slowo}" for slowo in tekst.split(' ') if len(slowo) > 1]
+    ramka = f" {tekst} "
+    for n in range(NGRAM_MIN, NGRAM_MAX + 1):
+        wynik.extend(ramka[i:i + n] for i in range(len(ramka) - n + 1))
+    return wynik
+
+
+def w_holdout(nazwa: str, holdout: float) -> bool:
+    """Deterministyczny podział po nazwie - ta sama nazwa zawsze w tym samym zbiorze"""
+    return zlib.crc32(normalize_name(nazwa).encode('utf-8')) % 1000 < holdout * 1000
+
+
+class NaiveBayesClassifier:
+    """Wielomianowy naiwny Bayes z wygładzaniem Laplace'a (alpha)"""
+
+    def __init__(self, alpha: float = DEFAULT_ALPHA):
+        self.alpha = alpha
+        self.classes: List[int] = []
+        self.class_counts: List[float] = []
+        self.feature_counts: Dict[str, Dict[int, float]] = {}
+        self.temperature = 1.0
+        self.meta: Dict = {}
+        self._log_prior: List[float] = []
+        self._log_unseen: List[float] = []
+        self._log_prob: Dict[str, List[float]] = {}
+
+    def fit(self, przyklady: Iterable[Tuple[str, int, float]]) -> 'NaiveBayesClassifier':
+        """
+        Trenuje model
+
+        Args:
+            przyklady: Trójki (nazwa produktu, id_kategorii, waga)
+        """
+        indeksy: Dict[int, int] = {}
+        class_counts: List[float] = []
+        feature_counts: Dict[str, Dict[int, float]] = defaultdict(lambda: defaultdict(float))
+        for nazwa, id_kategorii, waga in przyklady:
+            lista = cechy(nazwa)
+            if not lista:
+                continue
+            if id_kategorii not in indeksy:
+                indeksy[id_kategorii] = len(class_counts)
+                class_counts.append(0.0)
+            indeks = indeksy[id_kategorii]
+            class_counts[indeks] += waga
+            for cecha in lista:
+                feature_counts[cecha][indeks] += waga
+        self.classes = list(indeksy)
+        self.class_counts = class_counts
+        self.feature_counts = {cecha: dict(liczniki) for cecha, liczniki in feature_counts.items()}
+        self._przelicz()
+        return self
+
+    def _przelicz(self):
+        liczba_klas = len(self.classes)
+        suma_klas = sum(self.class_counts) or 1.0
+        self._log_prior = [math.log(liczba / suma_klas) for liczba in self.class_counts]
+        sumy_cech = [0.0] * liczba_klas
+        for liczniki in self.feature_counts.values():
+            for indeks, liczba in liczniki.items():
+                sumy_cech[indeks] += liczba
+        slownik = len(self.feature_counts)
+        mianowniki = [math.log(suma + self.alpha * slownik) for suma in sumy_cech]
+        self._log_unseen = [math.log(self.alpha) - mianownik for mianownik in mianowniki]
+        log_prob = {}
+        for cecha, liczniki in self.feature_counts.items():
+            wiersz = list(self._log_unseen)
+            for indeks, liczba in liczniki.items():
+                wiersz[indeks] = math.log(liczba + self.alpha) - mianowniki[indeks]
+            log_prob[cecha] = wiersz
+        self._log_prob = log_prob
+
+    def _wyniki(self, nazwa: str) -> Optional[List[float]]:
+        """Logarytm priora plus średnia wiarygodność na znaną cechę dla każdej klasy (przed temperaturą)"""
+        if not self.classes:
+            return None
+        znane = [self._log_prob[cecha] for cecha in cechy(nazwa) if cecha in self._log_prob]
+        if not znane:
+            return None
+        sumy = [0.0] * len(self.classes)
+        for wiersz in znane:
+            for indeks, wartosc in enumerate(wiersz):
+                sumy[indeks] += wartosc
+        return [prior + suma / len(znane) for prior, suma in zip(self._log_prior, sumy)]
+
+    @staticmethod
+    def _softmax(wyniki: List[float], temperatura: float) -> List[float]:
+        maksimum = max(wyniki)
+        wykladniki = [math.exp((wynik - maksimum) / temperatura) for wynik in wyniki]
+        suma = sum(wykladniki)
+        return [wartosc / suma for wartosc in wykladniki]
+
+    def predict(self, nazwa: str) -> Tuple[Optional[int], float]:
+        """
+        Najbardziej prawdopodobna kategoria
+
+        Returns:
+            (id_kategorii, skalibrowana pewność 0-1); (None, 0.0) bez znanych cech
+        """
+        wyniki = self._wyniki(nazwa)
+        if wyniki is None:
+            return None, 0.0
+        rozklad = self._softmax(wyniki, self.temperature)
+        najlepszy = max(range(len(rozklad)), key=rozklad.__getitem__)
+        return self.classes[najlepszy], rozklad[najlepszy]
+
+    def calibrate(self, przyklady: Iterable[Tuple[str, int, float]]) -> float:
+        """
+        Dobiera temperaturę minimalizującą ważony błąd logarytmiczny na odłożonych nazwach
+
+        Returns:
+            Wybrana temperatura (1.0, gdy brak przykładów ze znaną kategorią i cechami)
+        """
+        indeksy = {id_kategorii: indeks for indeks, id_kategorii in enumerate(self.classes)}
+        dane = []
+        for nazwa, id_kategorii, waga in przyklady:
+            wyniki = self._wyniki(nazwa)
+            if wyniki is not None and id_kategorii in indeksy:
+                dane.append((wyniki, indeksy[id_kategorii], waga))
+        if not dane:
+            self.temperature = 1.0
+            return self.temperature
+
+        def strata(temperatura: float) -> float:
+            suma = 0.0
+            for wyniki, indeks, waga in dane:
+                maksimum = max(wyniki)
+                log_suma = maksimum / temperatura + math.log(
+                    sum(math.exp((wynik - maksimum) / temperatura) for wynik in wyniki))
+                suma += waga * (log_suma - wyniki[indeks] / temperatura)
+            return suma
+
+        self.temperature = min(TEMPERATURY, key=strata)
+        return self.temperature
+
+    def to_dict(self) -> Dict:
+        return {
+            'alpha': self.alpha,
+            'temperature': self.temperature,
+            'classes': self.classes,
+            'class_counts': self.class_counts,
+            'feature_counts': self.feature_counts,
+            'meta': self.meta,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'NaiveBayesClassifier':
+        model = cls(data.get('alpha', DEFAULT_ALPHA))
+        model.classes = list(data['classes'])
+        model.class_counts = list(data['class_counts'])
+        # Klucze JSON są tekstem - indeksy klas z powrotem na liczby
+        model.feature_counts = {
+            cecha: {int(indeks): liczba for indeks, liczba in liczniki.items()}
+            for cecha, liczniki in data['feature_counts'].items()
+        }
+        model.temperature = float(data.get('temperature', 1.0))
+        model.meta = data.get('meta', {})
+        model._przelicz()
+        return model
+
+
+# ----------------------------------------------------------------------
+# Trening i ocena offline
+# ----------------------------------------------------------------------
+
+def dane_treningowe(pomin_kategorie: Sequence[int] = ()) -> List[Tuple[str, int, float]]:
+    """Pary nazwa -> kategoria z produktów w bazie i ręcznych poprawek (wymaga kontekstu aplikacji)"""
+    from db import DatabaseHelper
+    _, wiersze = DatabaseHelper.fetch_tuples(
+        "SELECT nazwa, id_kategorii, COUNT(*) AS liczba FROM produkty GROUP BY nazwa, id_kategorii"
+    )
+    przyklady = [(nazwa, id_kategorii, float(liczba)) for nazwa, id_kategorii, liczba in wiersze]
+    try:
+        przyklady.extend(
+            (wiersz['nazwa_znormalizowana'], wiersz['id_kategorii'], float(MANUAL_WEIGHT))
+            for wiersz in DatabaseHelper.fetch_all(
+                "SELECT nazwa_znormalizowana, id_kategorii FROM klasyfikacje_produktow WHERE zrodlo = 'manual'"
+            )
+        )
+    except Exception as e:
+        print(f"Klasyfikator lokalny: pominięto ręczne poprawki ({e})")
+    DatabaseHelper.rollback()
+    pomin = set(pomin_kategorie)
+    return [przyklad for przyklad in przyklady if przyklad[1] not in pomin]
+
+
+def ocen(model: NaiveBayesClassifier, przyklady: Iterable[Tuple[str, int, float]],
+         progi: Sequence[float] = PROGI_RAPORTU) -> Dict:
+    """
+    Trafność modelu na przykładach (ważonych liczbą wystąpień)
+
+    Returns:
+        Słownik z trafnością ogólną oraz pokryciem i trafnością powyżej każdego progu
+    """
+    wszystkie = 0.0
+    trafione = 0.0
+    powyzej = {prog: [0.0, 0.0] for prog in progi}
+    for nazwa, id_kategorii, waga in przyklady:
+        przewidziana, pewnosc = model.predict(nazwa)
+        poprawna = przewidziana == id_kategorii
+        wszystkie += waga
+        if poprawna:
+            trafione += waga
+        for prog in progi:
+            if pewnosc >= prog:
+                powyzej[prog][0] += waga
+                if poprawna:
+                    powyzej[prog][1] += waga
+    return {
+        'examples': int(wszystkie),
+        'accuracy': round(trafione / wszystkie, 4) if wszystkie else None,
+        'thresholds': {
+            str(prog): {
+                'coverage': round(liczba / wszystkie, 4) if wszystkie else None,
+                'accuracy': round(dobre / liczba, 4) if liczba else None,
+            }
+            for prog, (liczba, dobre) in powyzej.items()
+        },
+    }
+
+
+def wybierz_prog(model: NaiveBayesClassifier, przyklady: Iterable[Tuple[str, int, float]],
+                 trafnosc: float = DEFAULT_TARGET_ACCURACY,
+                 min_wsparcie: float = MIN_WSPARCIE_PROGU) -> Optional[float]:
+    """
+    Najniższy próg pewności, powyżej którego trafność na odłożonych nazwach wynosi co najmniej trafnosc
+
+    Returns:
+        Próg albo None, gdy żaden próg z co najmniej min_wsparcie (ważonych) nazw nie osiąga trafności
+    """
+    wyniki = []
+    for nazwa, id_kategorii, waga in przyklady:
+        przewidziana, pewnosc = model.predict(nazwa)
+        if przewidziana is not None:
+            wyniki.append((pewnosc, waga, przewidziana == id_kategorii))
+    wyniki.sort(key=lambda wynik: wynik[0], reverse=True)
+    prog = None
+    liczba = 0.0
+    dobre = 0.0
+    for numer, (pewnosc, waga, poprawna) in enumerate(wyniki):
+        liczba += waga
+        if poprawna:
+            dobre += waga
+        # Próg tylko między różnymi wartościami pewności - remisy wchodzą razem
+        if numer + 1 < len(wyniki) and wyniki[numer + 1][0] == pewnosc:
+            continue
+        if liczba >= min_wsparcie and dobre / liczba >= trafnosc:
+            prog = pewnosc
+    return round(prog, 6) if prog is not None else None
+
+
+def zapisz_model(model: NaiveBayesClassifier, path: str):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as handle:
+        json.dump(model.to_dict(), handle, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+# ----------------------------------------------------------------------
+# Klasyfikacja w aplikacji
+# ----------------------------------------------------------------------
+
+def _config(name: str, default):
+    try:
+        from flask import current_app
+        return current_app.config.get(name, default)
+    except RuntimeError:
+        return default
+
+
+class LocalTier:
+    """Model wczytywany leniwie z LOCAL_CLASSIFIER_PATH (ponownie po zmianie pliku) i liczniki poziomów"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._model: Optional[NaiveBayesClassifier] = None
+        self._mtime: Optional[float] = None
+
+        self.tiers = {etap: {'items': 0, 'calls': 0, 'seconds': 0.0} for etap in ('memo', 'local', 'gemini')}
+        self.accepted = 0
+        self.rejected = 0
+        self.compared = 0
+        self.agreed = 0
+        self.load_errors = 0
+
+    def model(self) -> Optional[NaiveBayesClassifier]:
+        path = _config('LOCAL_CLASSIFIER_PATH', None)
+        if not path:
+            return None
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            return None
+        if mtime != self._mtime:
+            with self._lock:
+                if mtime != self._mtime:
+                    try:
+                        with open(path, 'r', encoding='utf-8') as handle:
+                            self._model = NaiveBayesClassifier.from_dict(json.load(handle))
+                    except (OSError, ValueError, KeyError) as e:
+                        self.load_errors += 1
+                        print(f"Klasyfikator lokalny: nie można wczytać modelu {path}: {e}")
+                        self._model = None
+                    self._mtime = mtime
+        return self._model
+
+    def prog(self, model: Optional[NaiveBayesClassifier]) -> Optional[float]:
+        """LOCAL_CLASSIFIER_THRESHOLD, a bez niego próg wybrany przy treningu; None wyłącza poziom lokalny"""
+        if model is None:
+            return None
+        prog = _config('LOCAL_CLASSIFIER_THRESHOLD', None)
+        if prog is None:
+            prog = model.meta.get('threshold')
+        return float(prog) if prog is not None else None
+
+    def klasyfikuj(self, nazwy: Iterable[str]) -> Tuple[Dict[str, Tuple[int, float]], Dict[str, Tuple[int, float]]]:
+        """
+        Klasyfikuje nazwy modelem lokalnym
+
+        Returns:
+            (przyjęte, odrzucone) - słowniki nazwa -> (id_kategorii, pewność);
+            odrzucone mają pewność poniżej progu i trafiają do Gemini; bez modelu
+            lub progu oba słowniki są puste
+        """
+        model = self.model()
+        prog = self.prog(model)
+        if prog is None:
+            return {}, {}
+        start = time.perf_counter()
+        przyjete = {}
+        odrzucone = {}
+        for nazwa in nazwy:
+            id_kategorii, pewnosc = model.predict(nazwa)
+            if id_kategorii is not None and pewnosc >= prog:
+                przyjete[nazwa] = (id_kategorii, pewnosc)
+            else:
+                odrzucone[nazwa] = (id_kategorii, pewnosc)
+        self.zapisz_etap('local', len(przyjete) + len(odrzucone), time.perf_counter() - start)
+        self.accepted += len(przyjete)
+        self.rejected += len(odrzucone)
+        return przyjete, odrzucone
+
+    def zapisz_etap(self, etap: str, liczba: int, sekundy: float):
+        """Liczba nazw i czas obsługi na poziomie memo/local/gemini"""
+        licznik = self.tiers[etap]
+        licznik['items'] += liczba
+        licznik['calls'] += 1
+        licznik['seconds'] += sekundy
+
+    def zapisz_zgodnosc(self, propozycja: Optional[int], id_gemini: Optional[int]):
+        """Porównanie odrzuconej propozycji modelu z odpowiedzią Gemini (szacunek trafności online)"""
+        if propozycja is None or id_gemini is None:
+            return
+        self.compared += 1
+        if propozycja == id_gemini:
+            self.agreed += 1
+
+    def stats(self) -> Dict:
+        model = self._model
+        return {
+            'model': dict(model.meta, classes=len(model.classes), features=len(model.feature_counts),
+                          temperature=model.temperature) if model else None,
+            'threshold': self.prog(model),
+            'tiers': {
+                etap: dict(
+                    licznik,
+                    seconds=round(licznik['seconds'], 3),
+                    avg_ms=round(licznik['seconds'] * 1000 / licznik['calls'], 2) if licznik['calls'] else 0,
+                )
+                for etap, licznik in self.tiers.items()
+            },
+            'accepted': self.accepted,
+            'rejected': self.rejected,
+            'rejected_agreement_with_gemini': round(self.agreed / self.compared, 4) if self.compared else None,
+            'load_errors': self.load_errors,
+        }
+
+
+tier = LocalTier()
+
+metrics.register('local_classifier', tier.stats)
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+"""
+Archiwizacja starych logów aktywności do plików JSONL (gzip)
+Obsługuje polskie znaki: ą, ć, ę, ł, ń, ó, ś, ź, ż
+
+Tabela logi rośnie bez końca, a lista /logi i jej filtry potrzebują tylko
+ostatnich miesięcy. Wpisy starsze niż LOGS_RETENTION_DAYS (zaokrąglone do
+pełnych miesięcy) są dopisywane do plików logi-RRRR-MM.jsonl.gz w katalogu
+LOGS_ARCHIVE_DIR i usuwane z bazy paczkami. Każda paczka jest najpierw
+zapisana na dysk (fsync), potem usunięta - przerwanie w połowie zostawia
+najwyżej jedną paczkę w obu miejscach i żadnej nie gubi. Pliki gzip
+dopisywane kolejnymi uruchomieniami mają wiele członów; gzip.open czyta je
+jako jeden strumień. Uruchamiane przez flask archive-logs (np. z crona).
+"""
+import gzip
+import json
+import os
+from datetime import date, timedelta
+from typing import Dict, Optional
+
+from services.rollups import poczatek_miesiaca
+
+DEFAULT_RETENTION_DAYS = 180
+DEFAULT_BATCH = 5000
+
+
+def granica(dni: int, dzis: Optional[date] = None) -> date:
+    """Pierwszy dzień miesiąca, w którym wypada dzis - dni; starsze wpisy idą do archiwum"""
+    return poczatek_miesiaca((dzis or date.today()) - timedelta(days=max(0, dni)))
+
+
+def plik_miesiaca(katalog: str, miesiac: str) -> str:
+    return os.path.join(katalog, f"logi-{miesiac}.jsonl.gz")
+
+
+def _dopisz(katalog: str, wiersze) -> Dict[str, int]:
+    """Dopisuje paczkę do plików miesięcznych i wymusza zapis na dysk"""
+    miesiace: Dict[str, list] = {}
+    for wiersz in wiersze:
+        # DatabaseHelper zwraca timestamp jako tekst ISO - RRRR-MM to pierwsze 7 znaków
+        miesiac = wiersz['timestamp'][:7]
+        miesiace.setdefault(miesiac, []).append(json.dumps(wiersz, ensure_ascii=False) + "\n")
+    for miesiac, linie in miesiace.items():
+        with open(plik_miesiaca(katalog, miesiac), 'ab') as plik:
+            with gzip.GzipFile(fileobj=plik, mode='ab') as archiwum:
+                archiwum.write("".join(linie).encode('utf-8'))
+            plik.flush()
+            os.fsync(plik.fileno())
+    return {miesiac: len(linie) for miesiac, linie in miesiace.items()}
+
+
+def archiwizuj(katalog: str, dni: int = DEFAULT_RETENTION_DAYS, paczka: int = DEFAULT_BATCH,
+               proba: bool = False, optymalizuj: bool = False) -> Dict:
+    """
+    Przenosi wpisy logi starsze niż granica(dni) do archiwum JSONL
+
+    Args:
+        katalog: Katalog plików logi-RRRR-MM.jsonl.gz
+        dni: Ile dni logów zostaje w bazie (zaokrąglone w dół do początku miesiąca)
+        paczka: Liczba wpisów czytanych i usuwanych naraz
+        proba: Tylko policz wpisy do archiwizacji, bez zapisu i usuwania
+        optymalizuj: Po usunięciu odbuduj tabelę (OPTIMIZE TABLE) i zwolnij miejsce
+
+    Returns:
+        Raport: granica, wpisy (łącznie), miesiace (wpisy na miesiąc)
+    """
+    from db import DatabaseHelper
+    koniec = granica(dni)
+    raport = {'granica': koniec.isoformat(), 'wpisy': 0, 'miesiace': {}}
+
+    if proba:
+        wiersze = DatabaseHelper.fetch_all(
+            """SELECT DATE_FORMAT(timestamp, '%Y-%m') AS miesiac, COUNT(*) AS wpisy
+               FROM logi WHERE timestamp < :koniec
+               GROUP BY DATE_FORMAT(timestamp, '%Y-%m') ORDER BY miesiac""",
+            {'koniec': koniec},
+        )
+        DatabaseHelper.rollback()
+        raport['miesiace'] = {wiersz['miesiac']: int(wiersz['wpisy']) for wiersz in wiersze}
+        raport['wpisy'] = sum(raport['miesiace'].values())
+        return raport
+
+    os.makedirs(katalog, exist_ok=True)
+    ostatni = 0
+    while True:
+        # Po kluczu głównym: stare wpisy mają najniższe id, a kursor nie wraca do usuniętych wierszy
+        wiersze = DatabaseHelper.fetch_all(
+            """SELECT id, id_uzytkownika, timestamp, action, user_status_at_log, details
+               FROM logi
+               WHERE id > :ostatni AND timestamp < :koniec
+               ORDER BY id
+               LIMIT :paczka""",
+            {'ostatni': ostatni, 'koniec': koniec, 'paczka': paczka},
+        )
+        DatabaseHelper.rollback()
+        if not wiersze:
+            break
+        for miesiac, liczba in _dopisz(katalog, wiersze).items():
+            raport['miesiace'][miesiac] = raport['miesiace'].get(miesiac, 0) + liczba
+        DatabaseHelper.execute(
+            "DELETE FROM logi WHERE id BETWEEN :od AND :do AND timestamp < :koniec",
+            {'od': wiersze[0]['id'], 'do': wiersze[-1]['id'], 'koniec': koniec},
+        )
+        raport['wpisy'] += len(wiersze)
+        ostatni = wiersze[-1]['id']
+
+    if optymalizuj and raport['wpisy']:
+        DatabaseHelper.execute("OPTIMIZE TABLE logi")
+    return raport
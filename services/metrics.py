@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+"""
+Rejestr metryk procesu (liczniki cache, kolejek, klasyfikacji)
+Obsługuje polskie znaki: ą, ć, ę, ł, ń, ó, ś, ź, ż
+
+Moduły rejestrują funkcję zwracającą słownik z aktualnymi licznikami,
+a endpoint /metryki zbiera je w jedną odpowiedź JSON.
+"""
+from typing import Callable, Dict
+
+_providers: Dict[str, Callable[[], Dict]] = {}
+
+
+def register(name: str, provider: Callable[[], Dict]):
+    """
+    Rejestruje dostawcę metryk
+
+    Args:
+        name: Nazwa sekcji w odpowiedzi /metryki
+        provider: Funkcja bez argumentów zwracająca słownik liczników
+    """
+    _providers[name] = provider
+
+
+def snapshot() -> Dict[str, Dict]:
+    """Zwraca bieżące metryki wszystkich zarejestrowanych modułów"""
+    result = {}
+    for name, provider in list(_providers.items()):
+        try:
+            result[name] = provider()
+        except Exception as e:
+            result[name] = {'error': str(e)}
+    return result
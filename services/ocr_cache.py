@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+"""
+Cache wyników OCR paragonów na dysku, adresowany treścią obrazu
+Obsługuje polskie znaki: ą, ć, ę, ł, ń, ó, ś, ź, ż
+
+Gdy ten sam plik trafia ponownie do potoku (ponowienie po błędzie zapisu
+w bazie, zadanie z kolejki po restarcie, ponowny import), odczytany przez
+Gemini JSON paragonu jest brany z cache zamiast z kolejnego zapytania.
+Kluczem jest SHA-256 bajtów obrazu i nazwa modelu; rozmiar katalogu
+ogranicza OCR_CACHE_MAX_BYTES - usuwane są najdawniej używane wpisy (mtime).
+"""
+import hashlib
+import json
+import os
+import threading
+from typing import Dict, Optional
+
+from services import metrics
+
+
+def klucz(dane: bytes, model: str) -> str:
+    """Klucz wpisu: SHA-256 obrazu powiązany z modelem, który go odczytał"""
+    digest = hashlib.sha256(dane).hexdigest()
+    return hashlib.sha256(f"{model}:{digest}".encode('utf-8')).hexdigest()
+
+
+class OcrCache:
+    """Katalog plików JSON ograniczony rozmiarem (usuwanie wg czasu ostatniego użycia)"""
+
+    def __init__(self, root: str, max_bytes: int):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+        self._size = sum(os.path.getsize(os.path.join(root, name)) for name in os.listdir(root)
+                         if name.endswith('.json'))
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, f"{key}.json")
+
+    def get(self, key: str) -> Optional[Dict]:
+        """Zwraca zapisany JSON paragonu albo None"""
+        path = self._path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as handle:
+                data = json.load(handle)
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+        try:
+            # mtime = czas ostatniego użycia (podstawa usuwania)
+            os.utime(path)
+        except OSError:
+            pass
+        self.hits += 1
+        return data
+
+    def put(self, key: str, data: Dict):
+        """Zapisuje JSON paragonu i w razie potrzeby usuwa najdawniej używane wpisy"""
+        payload = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as handle:
+            handle.write(payload)
+        with self._lock:
+            previous = os.path.getsize(path) if os.path.exists(path) else 0
+            os.replace(tmp_path, path)
+            self._size += len(payload) - previous
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        # Rozmiar liczony od nowa - katalog może współdzielić kilka procesów
+        entries = []
+        for name in os.listdir(self.root):
+            if not name.endswith('.json'):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.root, name))
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, name))
+        self._size = sum(size for _, size, _ in entries)
+        # Usuwamy do 90% limitu, żeby nie sprzątać przy każdym zapisie
+        target = int(self.max_bytes * 0.9)
+        for _, size, name in sorted(entries):
+            if self._size <= target:
+                break
+            try:
+                os.remove(os.path.join(self.root, name))
+            except OSError:
+                continue
+            self._size -= size
+            self.evictions += 1
+
+    def stats(self) -> Dict:
+        return {
+            'bytes': self._size,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
+
+
+_cache: Optional[OcrCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_ocr_cache() -> OcrCache:
+    """Zwraca cache procesu (tworzony przy pierwszym użyciu z current_app.config)"""
+    global _cache
+    if _cache is None:
+        from flask import current_app
+        with _cache_lock:
+            if _cache is None:
+                _cache = OcrCache(current_app.config['OCR_CACHE_DIR'], current_app.config.get('OCR_CACHE_MAX_BYTES', 50 * 1024 * 1024))
+    return _cache
+
+
+metrics.register('ocr_cache', lambda: _cache.stats() if _cache is not None else {})
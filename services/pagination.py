@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+"""
+Stronicowanie kursorem (keyset) dla długich list: paragony, logi
+Obsługuje polskie znaki: ą, ć, ę, ł, ń, ó, ś, ź, ż
+
+LIMIT/OFFSET czyta i odrzuca wszystkie wiersze poprzednich stron, więc
+kolejne strony są coraz wolniejsze. Kursor zapamiętuje klucz sortowania
+ostatniego wiersza strony, a następna strona zaczyna się warunkiem
+"klucz < kursor" odczytywanym wprost z indeksu. Dla klienta kursor jest
+nieprzezroczystym tekstem (base64 z JSON-a z rodzajem listy).
+"""
+import base64
+import json
+from typing import Callable, Dict, List, Optional, Tuple
+
+NAGLOWEK = 'X-Next-Cursor'
+
+
+class NieprawidlowyKursor(ValueError):
+    """Kursor uszkodzony albo wydany dla innej listy"""
+
+
+def zakoduj(rodzaj: str, klucz: List) -> str:
+    dane = json.dumps([rodzaj] + list(klucz), separators=(',', ':'), ensure_ascii=False)
+    return base64.urlsafe_b64encode(dane.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def odkoduj(kursor: str, rodzaj: str, *typy: Callable) -> List:
+    """
+    Klucz ostatniego wiersza poprzedniej strony
+
+    Args:
+        typy: Konwersje kolejnych pól klucza (np. int, datetime.fromisoformat)
+
+    Raises:
+        NieprawidlowyKursor: gdy kursor jest uszkodzony albo nie pochodzi z tej listy
+    """
+    try:
+        dane = base64.urlsafe_b64decode(kursor + '=' * (-len(kursor) % 4))
+        wartosci = json.loads(dane.decode('utf-8'))
+        if not isinstance(wartosci, list) or wartosci[:1] != [rodzaj] or len(wartosci) != len(typy) + 1:
+            raise ValueError(rodzaj)
+        return [typ(wartosc) for typ, wartosc in zip(typy, wartosci[1:])]
+    except (ValueError, TypeError, UnicodeDecodeError):
+        raise NieprawidlowyKursor("Nieprawidłowy kursor stronicowania")
+
+
+def nastepny(wiersze: List[Dict], size: int, rodzaj: str, klucz: Callable[[Dict], List]) -> Optional[str]:
+    """Kursor następnej strony albo None, gdy strona nie jest pełna (koniec listy)"""
+    if not wiersze or len(wiersze) < size:
+        return None
+    return zakoduj(rodzaj, klucz(wiersze[-1]))
+
+
+def odpowiedz(wiersze: List[Dict], kursor_nastepny: Optional[str], koperta: bool) -> Tuple[str, Dict]:
+    """
+    Treść i nagłówki odpowiedzi listy
+
+    Args:
+        koperta: True dla klientów stronicujących kursorem - {"items", "next_cursor"};
+                 False - dotychczasowa tablica (zgodność ze stronicowaniem page/size)
+    """
+    naglowki = {NAGLOWEK: kursor_nastepny} if kursor_nastepny else {}
+    if koperta:
+        tresc = {'items': wiersze, 'next_cursor': kursor_nastepny}
+    else:
+        tresc = wiersze
+    return json.dumps(tresc, ensure_ascii=False), naglowki
@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+"""
+Budowanie promptów klasyfikacji w limicie tokenów
+Obsługuje polskie znaki: ą, ć, ę, ł, ń, ó, ś, ź, ż
+
+Prompty klasyfikacji kategorii, firm i miast zawierały cały słownik, więc
+rosły liniowo razem z tabelami kategorie/firmy/miasta. Tutaj lista etykiet
+jest układana od najbardziej prawdopodobnych - najpierw etykiety stałe
+(TrudnoOkreslic), potem kandydaci z lokalnego indeksu trigramów
+(fuzzy_matcher) dla każdej klasyfikowanej nazwy, na końcu reszta słownika -
+i ucinana, gdy prompt przekroczyłby PROMPT_TOKEN_BUDGET. Długie paragony są
+dzielone na paczki po PROMPT_CHUNK_ITEMS produktów. Tokeny szacujemy jako
+liczbę znaków / 4; statystyki promptów trafiają do /metryki.
+"""
+import threading
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from services import metrics
+
+DEFAULT_TOKEN_BUDGET = 2000
+DEFAULT_CHUNK_ITEMS = 40
+DEFAULT_CANDIDATES_PER_ITEM = 5
+ZNAKI_NA_TOKEN = 4
+# Etykiety zawsze obecne w prompcie (jeśli są w słowniku)
+ZAWSZE = ('TrudnoOkreslic',)
+_SEPARATOR = ", "
+
+
+def _config_int(name: str, default: int) -> int:
+    try:
+        from flask import current_app
+        return int(current_app.config.get(name, default))
+    except RuntimeError:
+        return default
+
+
+def szacuj_tokeny(tekst: str) -> int:
+    """Przybliżona liczba tokenów tekstu (znaki / 4, w górę)"""
+    return (len(tekst or '') + ZNAKI_NA_TOKEN - 1) // ZNAKI_NA_TOKEN
+
+
+def budzet_tokenow() -> int:
+    return _config_int('PROMPT_TOKEN_BUDGET', DEFAULT_TOKEN_BUDGET)
+
+
+def wybierz_etykiety(indeks, zapytania: Iterable[str], budzet: int) -> List[str]:
+    """
+    Wybiera etykiety słownika do promptu, mieszcząc się w budżecie tokenów
+
+    Args:
+        indeks: fuzzy_matcher.FuzzyIndex nad tabelą słownika
+        zapytania: Klasyfikowane nazwy (produkty, firma, miasto)
+        budzet: Liczba tokenów dostępna na listę etykiet
+
+    Returns:
+        Etykiety w kolejności: stałe, kandydaci z indeksu, reszta słownika
+    """
+    reference = indeks.reference
+    wszystkie = [row[reference.name_column] for row in reference.rows() if row.get(reference.name_column)]
+    na_zapytanie = _config_int('PROMPT_CANDIDATES_PER_ITEM', DEFAULT_CANDIDATES_PER_ITEM)
+
+    ranking = [nazwa for nazwa in ZAWSZE if reference.id_for(nazwa) is not None]
+    for zapytanie in zapytania:
+        ranking.extend(indeks.candidates(zapytanie, na_zapytanie))
+    ranking.extend(wszystkie)
+
+    limit_znakow = max(0, budzet) * ZNAKI_NA_TOKEN
+    wybrane = []
+    widziane = set()
+    znaki = 0
+    for nazwa in ranking:
+        if nazwa in widziane:
+            continue
+        koszt = len(nazwa) + len(_SEPARATOR)
+        # Co najmniej jedna etykieta, nawet przy wyczerpanym budżecie
+        if wybrane and znaki + koszt > limit_znakow:
+            break
+        widziane.add(nazwa)
+        wybrane.append(nazwa)
+        znaki += koszt
+    return wybrane
+
+
+def zbuduj(nazwa: str, szablon: str, indeks, zapytania: Sequence[str], **pola) -> Tuple[str, List[str]]:
+    """
+    Składa prompt z szablonu (str.format z polem {etykiety}) w limicie tokenów
+
+    Args:
+        nazwa: Nazwa promptu w metrykach ('kategorie', 'firma', 'miasto')
+        szablon: Szablon z polem {etykiety} i polami z **pola
+        indeks: fuzzy_matcher.FuzzyIndex słownika etykiet
+        zapytania: Klasyfikowane nazwy - źródło kandydatów
+
+    Returns:
+        (prompt, etykiety użyte w prompcie)
+    """
+    budzet = budzet_tokenow()
+    bez_etykiet = szacuj_tokeny(szablon.format(etykiety='', **pola))
+    etykiety = wybierz_etykiety(indeks, zapytania, budzet - bez_etykiet)
+    prompt = szablon.format(etykiety=_SEPARATOR.join(etykiety), **pola)
+    _zapisz(nazwa, szacuj_tokeny(prompt), budzet, len(etykiety), len(indeks.reference.rows()))
+    return prompt, etykiety
+
+
+def paczki(elementy: Sequence, tekst: Callable[[object], str], budzet: Optional[int] = None) -> List[List]:
+    """
+    Dzieli długą listę (np. produkty paragonu) na paczki do osobnych promptów
+
+    Paczka ma najwyżej PROMPT_CHUNK_ITEMS elementów, a ich teksty zajmują
+    najwyżej połowę budżetu - druga połowa zostaje na listę etykiet.
+    """
+    max_elementow = max(1, _config_int('PROMPT_CHUNK_ITEMS', DEFAULT_CHUNK_ITEMS))
+    limit = max(1, (budzet if budzet is not None else budzet_tokenow()) // 2)
+    wynik = []
+    biezaca = []
+    tokeny = 0
+    for element in elementy:
+        koszt = szacuj_tokeny(tekst(element)) + 2
+        if biezaca and (len(biezaca) >= max_elementow or tokeny + koszt > limit):
+            wynik.append(biezaca)
+            biezaca = []
+            tokeny = 0
+        biezaca.append(element)
+        tokeny += koszt
+    if biezaca:
+        wynik.append(biezaca)
+    return wynik
+
+
+# ----------------------------------------------------------------------
+# Metryki
+# ----------------------------------------------------------------------
+
+_stats: Dict[str, Dict[str, int]] = {}
+_stats_lock = threading.Lock()
+
+
+def _zapisz(nazwa: str, tokeny: int, budzet: int, oferowane: int, slownik: int):
+    with _stats_lock:
+        liczniki = _stats.setdefault(nazwa, {
+            'prompts': 0, 'tokens': 0, 'max_tokens': 0, 'over_budget': 0,
+            'labels_offered': 0, 'labels_in_dictionary': 0,
+        })
+        liczniki['prompts'] += 1
+        liczniki['tokens'] += tokeny
+        liczniki['max_tokens'] = max(liczniki['max_tokens'], tokeny)
+        if tokeny > budzet:
+            liczniki['over_budget'] += 1
+        liczniki['labels_offered'] += oferowane
+        liczniki['labels_in_dictionary'] += slownik
+
+
+def stats() -> Dict:
+    wynik = {}
+    with _stats_lock:
+        for nazwa, liczniki in _stats.items():
+            wpis = dict(liczniki)
+            wpis['avg_tokens'] = round(liczniki['tokens'] / liczniki['prompts'], 1) if liczniki['prompts'] else 0
+            wynik[nazwa] = wpis
+    return wynik
+
+
+metrics.register('prompt_builder', stats)
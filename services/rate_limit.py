@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+"""
+Limit zapytań do Gemini per klucz API (token bucket)
+Obsługuje polskie znaki: ą, ć, ę, ł, ń, ó, ś, ź, ż
+
+Import wielu paragonów naraz może w kilka sekund wysłać dziesiątki zapytań
+jednym kluczem użytkownika i wyczerpać jego limit RPM. Każdy klucz ma
+własny kubełek: wywołanie acquire() czeka, aż w kubełku będzie żeton.
+Żeton pobiera GeminiClientPool przed każdym zapytaniem (OCR, firma, miasto,
+każda paczka kategorii), więc limit dotyczy faktycznych zapytań, a nie
+etapów przetwarzania - ale tylko w pracy w tle (import wielu paragonów,
+kolejka skanów, blok w_tle()). Interaktywne żądania (skan synchroniczny,
+czat asystenta) nie czekają na żeton: acquire() bez limitu czasu
+blokowałoby wątki żądań na minuty, gdy wielu użytkowników współdzieli
+GEMINI_API_KEY. GEMINI_REQUESTS_PER_MINUTE=0 wyłącza limit.
+"""
+import contextvars
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+from services import metrics
+
+DEFAULT_REQUESTS_PER_MINUTE = 15
+MAX_BUCKETS = 1024
+
+# Czy bieżący wątek/kontekst przetwarza pracę w tle (przekazywane do puli przez contextvars.copy_context)
+_w_tle = contextvars.ContextVar('gemini_w_tle', default=False)
+
+
+@contextmanager
+def w_tle():
+    """Zapytania do Gemini w tym bloku (import, kolejka skanów) czekają na żeton limitu"""
+    token = _w_tle.set(True)
+    try:
+        yield
+    finally:
+        _w_tle.reset(token)
+
+
+def aktywny() -> bool:
+    """True, gdy bieżące zapytanie do Gemini podlega limitowi (praca w tle)"""
+    return _w_tle.get()
+
+
+class TokenBucket:
+    """Kubełek żetonów: `rate` żetonów na sekundę, najwyżej `capacity` naraz"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, tokens: float = 1.0, timeout: Optional[float] = None) -> float:
+        """
+        Pobiera żetony, czekając na ich uzupełnienie
+
+        Returns:
+            Czas oczekiwania w sekundach
+
+        Raises:
+            TimeoutError: gdy żetonów nie będzie przed upływem timeout
+        """
+        started = time.monotonic()
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return now - started
+                wait = (tokens - self.tokens) / self.rate
+            if timeout is not None and now - started + wait > timeout:
+                raise TimeoutError("Przekroczono limit zapytań do Gemini")
+            time.sleep(wait)
+
+
+class KeyedRateLimiter:
+    """Osobny kubełek dla każdego klucza API (klucze trzymane jako skrót SHA-256)"""
+
+    def __init__(self, max_buckets: int = MAX_BUCKETS):
+        self.max_buckets = max_buckets
+        self._buckets: "OrderedDict[str, TokenBucket]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.acquired = 0
+        self.waited = 0
+        self.wait_seconds = 0.0
+
+    @staticmethod
+    def _requests_per_minute() -> int:
+        try:
+            from flask import current_app
+            return int(current_app.config.get('GEMINI_REQUESTS_PER_MINUTE', DEFAULT_REQUESTS_PER_MINUTE))
+        except RuntimeError:
+            return DEFAULT_REQUESTS_PER_MINUTE
+
+    def _bucket(self, api_key: str) -> TokenBucket:
+        key = hashlib.sha256((api_key or '').encode('utf-8')).hexdigest()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                per_minute = max(1, self._requests_per_minute())
+                bucket = TokenBucket(per_minute / 60.0, per_minute)
+                self._buckets[key] = bucket
+                while len(self._buckets) > self.max_buckets:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+            return bucket
+
+    def acquire(self, api_key: str, tokens: float = 1.0, timeout: Optional[float] = None) -> float:
+        """Czeka na zgodę na zapytanie danym kluczem i zwraca czas oczekiwania"""
+        if self._requests_per_minute() <= 0:
+            return 0.0
+        waited = self._bucket(api_key).acquire(tokens, timeout)
+        self.acquired += 1
+        if waited > 0.001:
+            self.waited += 1
+            self.wait_seconds += waited
+        return waited
+
+    def stats(self) -> Dict:
+        return {
+            'keys': len(self._buckets),
+            'acquired': self.acquired,
+            'waited': self.waited,
+            'wait_seconds': round(self.wait_seconds, 3),
+        }
+
+
+gemini = KeyedRateLimiter()
+
+metrics.register('rate_limit', gemini.stats)
@@ -0,0 +1,398 @@
+# -*- coding: utf-8 -*-
+"""
+Schematy odpowiedzi Gemini (structured output) i szybki parser z walidacją
+Obsługuje polskie znaki: ą, ć, ę, ł, ń, ó, ś, ź, ż
+
+Schematy przekazujemy modelowi jako response_schema z response_mime_type
+"application/json" - model generuje wtedy poprawny JSON o zadanej
+strukturze, więc nie trzeba wycinać bloków markdown ani ponawiać zapytań.
+Ten sam schemat jest kompilowany do walidatora (zagnieżdżone funkcje
+zamiast interpretowania schematu przy każdym wywołaniu), który w jednym
+przejściu sprawdza typy i normalizuje wartości (np. "3,50" -> 3.5).
+Liczniki błędów parsowania per schemat trafiają do /metryki.
+"""
+import json
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+from services import metrics
+
+
+class SchemaError(ValueError):
+    """Odpowiedź modelu nie pasuje do schematu"""
+
+
+Validator = Callable[[Any, str], Any]
+
+
+# ----------------------------------------------------------------------
+# Kompilacja schematu
+# ----------------------------------------------------------------------
+
+def _liczba(value, path: str) -> float:
+    if isinstance(value, bool):
+        raise SchemaError(f"{path}: oczekiwano liczby, otrzymano {value!r}")
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        try:
+            return float(value.replace(' ', '').replace(',', '.'))
+        except ValueError:
+            pass
+    raise SchemaError(f"{path}: oczekiwano liczby, otrzymano {value!r}")
+
+
+def _calkowita(value, path: str) -> int:
+    liczba = _liczba(value, path)
+    if liczba != int(liczba):
+        raise SchemaError(f"{path}: oczekiwano liczby całkowitej, otrzymano {value!r}")
+    return int(liczba)
+
+
+def _tekst(value, path: str) -> str:
+    if isinstance(value, str):
+        return value
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return str(value)
+    raise SchemaError(f"{path}: oczekiwano tekstu, otrzymano {value!r}")
+
+
+def _logiczna(value, path: str) -> bool:
+    if isinstance(value, bool):
+        return value
+    raise SchemaError(f"{path}: oczekiwano wartości logicznej, otrzymano {value!r}")
+
+
+_SKALARY = {
+    'number': _liczba,
+    'integer': _calkowita,
+    'string': _tekst,
+    'boolean': _logiczna,
+}
+
+
+def compile_schema(schema: Dict) -> Validator:
+    """
+    Kompiluje schemat (podzbiór OpenAPI używany przez Gemini: object, array,
+    string, number, integer, boolean, nullable, required, enum) do walidatora
+
+    Returns:
+        Funkcja (wartość, ścieżka) -> znormalizowana wartość; rzuca SchemaError
+    """
+    typ = schema.get('type', 'object').lower()
+    nullable = schema.get('nullable', False)
+
+    if typ == 'object':
+        pola = [(nazwa, compile_schema(podschemat)) for nazwa, podschemat in schema.get('properties', {}).items()]
+        wymagane = frozenset(schema.get('required', ()))
+
+        def walidator(value, path):
+            if not isinstance(value, dict):
+                raise SchemaError(f"{path}: oczekiwano obiektu, otrzymano {type(value).__name__}")
+            wynik = {}
+            for nazwa, pole in pola:
+                if nazwa in value and value[nazwa] is not None:
+                    wynik[nazwa] = pole(value[nazwa], f"{path}.{nazwa}")
+                elif nazwa in wymagane:
+                    raise SchemaError(f"{path}.{nazwa}: brak wymaganego pola")
+                else:
+                    wynik[nazwa] = None
+            return wynik
+    elif typ == 'array':
+        element = compile_schema(schema.get('items', {'type': 'string'}))
+
+        def walidator(value, path):
+            if not isinstance(value, list):
+                raise SchemaError(f"{path}: oczekiwano listy, otrzymano {type(value).__name__}")
+            return [element(item, f"{path}[{index}]") for index, item in enumerate(value)]
+    elif typ in _SKALARY:
+        walidator = _SKALARY[typ]
+        dozwolone = schema.get('enum')
+        if dozwolone:
+            dozwolone = frozenset(dozwolone)
+            bazowy = walidator
+
+            def walidator(value, path):
+                value = bazowy(value, path)
+                if value not in dozwolone:
+                    raise SchemaError(f"{path}: wartość {value!r} spoza listy dozwolonych")
+                return value
+    else:
+        raise ValueError(f"Nieobsługiwany typ w schemacie: {typ}")
+
+    if not nullable:
+        return walidator
+    niepusty = walidator
+
+    def walidator_nullable(value, path):
+        return None if value is None else niepusty(value, path)
+    return walidator_nullable
+
+
+_compiled: Dict[str, Validator] = {}
+_compiled_lock = threading.Lock()
+MAX_COMPILED = 256
+
+
+def validator_for(schema: Dict) -> Validator:
+    """Walidator ze schematu, kompilowany raz (schematy kategorii zależą od słownika)"""
+    klucz = json.dumps(schema, sort_keys=True)
+    walidator = _compiled.get(klucz)
+    if walidator is None:
+        walidator = compile_schema(schema)
+        with _compiled_lock:
+            if len(_compiled) >= MAX_COMPILED:
+                _compiled.clear()
+            _compiled[klucz] = walidator
+    return walidator
+
+
+# ----------------------------------------------------------------------
+# Parsowanie odpowiedzi z metrykami
+# ----------------------------------------------------------------------
+
+_stats: Dict[str, Dict[str, int]] = {}
+
+
+def _licznik(nazwa: str, pole: str):
+    liczniki = _stats.setdefault(nazwa, {'calls': 0, 'ok': 0, 'extracted': 0, 'json_errors': 0, 'schema_errors': 0})
+    liczniki[pole] += 1
+
+
+def extract_first_json_block(raw_text: str) -> Optional[str]:
+    """Wycina pierwszy kompletny obiekt JSON z tekstu (np. odpowiedź w bloku markdown)"""
+    depth = 0
+    in_string = False
+    escape = False
+    start_index = None
+    for index, char in enumerate(raw_text):
+        if escape:
+            escape = False
+            continue
+        if char == "\\":
+            escape = True
+            continue
+        if char == '"':
+            in_string = not in_string
+            continue
+        if in_string:
+            continue
+        if char in '{[' and depth == 0:
+            start_index = index
+            depth = 1
+            continue
+        if char in '{[':
+            depth += 1
+            continue
+        if char in '}]':
+            depth -= 1
+            if depth == 0 and start_index is not None:
+                return raw_text[start_index:index + 1]
+    return None
+
+
+def parse(nazwa: str, text: str, schema: Dict):
+    """
+    Parsuje odpowiedź modelu i waliduje ją schematem
+
+    Args:
+        nazwa: Nazwa schematu w metrykach (np. 'paragon', 'kategorie')
+        text: Tekst odpowiedzi (response.text)
+        schema: Schemat przekazany modelowi jako response_schema
+
+    Raises:
+        SchemaError: gdy odpowiedź nie jest poprawnym JSON-em zgodnym ze schematem
+    """
+    _licznik(nazwa, 'calls')
+    try:
+        value = json.loads(text)
+    except ValueError:
+        # Z response_mime_type odpowiedź jest czystym JSON-em; wycinanie to tylko zabezpieczenie
+        blok = extract_first_json_block(text or '')
+        try:
+            value = json.loads(blok) if blok else None
+        except ValueError:
+            value = None
+        if value is None:
+            _licznik(nazwa, 'json_errors')
+            raise SchemaError(f"{nazwa}: odpowiedź modelu nie jest poprawnym JSON-em")
+        _licznik(nazwa, 'extracted')
+    try:
+        wynik = validator_for(schema)(value, nazwa)
+    except SchemaError:
+        _licznik(nazwa, 'schema_errors')
+        raise
+    _licznik(nazwa, 'ok')
+    return wynik
+
+
+def stats() -> Dict:
+    wynik = {}
+    for nazwa, liczniki in list(_stats.items()):
+        bledy = liczniki['json_errors'] + liczniki['schema_errors']
+        wynik[nazwa] = dict(liczniki, failure_rate=round(bledy / liczniki['calls'], 4) if liczniki['calls'] else 0.0)
+    return wynik
+
+
+metrics.register('structured_output', stats)
+
+
+# ----------------------------------------------------------------------
+# Schematy
+# ----------------------------------------------------------------------
+
+# Zmieniaj przy każdej zmianie RECEIPT_SCHEMA - wersja jest częścią klucza cache OCR
+WERSJA = 1
+
+
+def _pole(typ: str) -> Dict:
+    return {'type': typ, 'nullable': True}
+
+
+PODATKI = ('podatekA', 'podatekB', 'podatekC', 'podatekD', 'PTU A', 'PTU B', 'PTU C', 'PTU D', 'RABAT')
+
+RECEIPT_SCHEMA = {
+    'type': 'object',
+    'properties': {
+        'adres': {
+            'type': 'object',
+            'properties': {
+                'nazwafirmy': _pole('string'),
+                'ulica': _pole('string'),
+                'miasto': _pole('string'),
+                'kodpocztowy': _pole('string'),
+            },
+        },
+        'produkty': {
+            'type': 'array',
+            'items': {
+                'type': 'object',
+                'properties': {
+                    'nazwa': {'type': 'string'},
+                    'ilosc': _pole('number'),
+                    'jednostka': _pole('string'),
+                    'cena': _pole('number'),
+                    'cenajednostkowa': _pole('number'),
+                    'podatek': _pole('string'),
+                },
+                'required': ['nazwa'],
+            },
+        },
+        'podatki': {
+            'type': 'object',
+            'properties': {nazwa: _pole('number') for nazwa in PODATKI},
+        },
+        'suma': {
+            'type': 'object',
+            'properties': {'TOTAL': _pole('number')},
+        },
+    },
+    'required': ['adres', 'produkty', 'podatki', 'suma'],
+}
+
+# Odpowiedź klasyfikacji firmy / miasta: {"nazwa": "..."}
+NAME_SCHEMA = {
+    'type': 'object',
+    'properties': {'nazwa': {'type': 'string'}},
+    'required': ['nazwa'],
+}
+
+
+def category_schema(nazwy_kategorii: List[str]) -> Dict:
+    """Lista {"nr": numer produktu, "kategoria": nazwa ze słownika}"""
+    return {
+        'type': 'array',
+        'items': {
+            'type': 'object',
+            'properties': {
+                'nr': {'type': 'integer'},
+                'kategoria': {'type': 'string', 'format': 'enum', 'enum': list(nazwy_kategorii)},
+            },
+            'required': ['nr', 'kategoria'],
+        },
+    }
+
+
+def generation_config(schema: Dict, max_output_tokens: int = 8192) -> Dict:
+    """Konfiguracja generowania z wymuszonym JSON-em zgodnym ze schematem"""
+    from services import llm_client
+    return llm_client.generation_config(
+        max_output_tokens,
+        response_mime_type='application/json',
+        response_schema=schema,
+    )
+
+
+# ----------------------------------------------------------------------
+# Typowany paragon
+# ----------------------------------------------------------------------
+
+@dataclass
+class Adres:
+    nazwafirmy: Optional[str] = None
+    ulica: Optional[str] = None
+    miasto: Optional[str] = None
+    kodpocztowy: Optional[str] = None
+
+
+@dataclass
+class Pozycja:
+    nazwa: str
+    ilosc: Optional[float] = None
+    jednostka: Optional[str] = None
+    cena: Optional[float] = None
+    cenajednostkowa: Optional[float] = None
+    podatek: Optional[str] = None
+
+
+@dataclass
+class Paragon:
+    adres: Adres
+    produkty: List[Pozycja]
+    podatki: Dict[str, float] = field(default_factory=dict)
+    suma: float = 0.0
+
+    @property
+    def rabat(self) -> float:
+        return self.podatki.get('RABAT', 0.0)
+
+    @classmethod
+    def z_odpowiedzi(cls, text: str) -> 'Paragon':
+        """Paragon z odpowiedzi modelu (parsowanie i walidacja w jednym przejściu)"""
+        return cls._z_poprawnego(parse('paragon', text, RECEIPT_SCHEMA))
+
+    @classmethod
+    def z_dict(cls, data: Dict) -> 'Paragon':
+        """Paragon ze słownika (np. z cache OCR) - walidowany tym samym schematem"""
+        return cls._z_poprawnego(validator_for(RECEIPT_SCHEMA)(data, 'paragon'))
+
+    @classmethod
+    def _z_poprawnego(cls, data: Dict) -> 'Paragon':
+        suma = (data['suma'] or {}).get('TOTAL')
+        return cls(
+            adres=Adres(**(data['adres'] or {})),
+            produkty=[Pozycja(**produkt) for produkt in data['produkty']],
+            # Brakujące kwoty podatków i rabatu traktujemy jako 0
+            podatki={nazwa: ((data['podatki'] or {}).get(nazwa) or 0.0) for nazwa in PODATKI},
+            suma=suma if suma is not None else 0.0,
+        )
+
+    def jako_slownik(self) -> Dict:
+        """
+        Słownik w dotychczasowym formacie potoku (data['adres'], data['produkty'], ...)
+
+        Brakujące pola adresu mają wartość "TrudnoOkreslic", kwoty 0; pozycje
+        zostają słownikami, które uzupełnia i klasyfikuje dalsza część potoku.
+        """
+        return {
+            'adres': {
+                'nazwafirmy': self.adres.nazwafirmy or "TrudnoOkreslic",
+                'ulica': self.adres.ulica or "TrudnoOkreslic",
+                'miasto': self.adres.miasto or "TrudnoOkreslic",
+                'kodpocztowy': self.adres.kodpocztowy,
+            },
+            'produkty': [dict(vars(produkt)) for produkt in self.produkty],
+            'podatki': dict(self.podatki),
+            'suma': {'TOTAL': self.suma},
+        }
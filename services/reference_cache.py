@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+"""
+Cache słowników referencyjnych (firmy, miasta, kategorie)
+Obsługuje polskie znaki: ą, ć, ę, ł, ń, ó, ś, ź, ż
+
+Tabele słownikowe są małe i prawie się nie zmieniają, a czytane są przy
+każdym paragonie i przy każdym załadowaniu strony. Trzymamy je w pamięci
+procesu razem z mapą nazwa -> id, odświeżając po TTL albo natychmiast po
+zapisie do danej tabeli (DatabaseHelper.execute wywołuje invalidate_for_query).
+"""
+import re
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from services import metrics
+
+DEFAULT_TTL = 300
+
+# INSERT INTO / UPDATE / DELETE FROM / REPLACE INTO `tabela`
+_WRITE_TARGET = re.compile(
+    r"^\s*(?:INSERT\s+(?:IGNORE\s+)?INTO|REPLACE\s+INTO|UPDATE|DELETE\s+FROM)\s+`?(\w+)`?",
+    re.IGNORECASE,
+)
+
+
+class ReferenceTable:
+    """Wczytana w całości tabela słownikowa z indeksem nazwa -> id"""
+
+    def __init__(self, table: str, id_column: str, name_column: str = 'nazwa'):
+        self.table = table
+        self.id_column = id_column
+        self.name_column = name_column
+
+        self._lock = threading.Lock()
+        self._rows: Optional[List[Dict]] = None
+        self._by_name: Dict[str, int] = {}
+        self._by_casefold: Dict[str, int] = {}
+        self._by_id: Dict[int, str] = {}
+        self._loaded_at = 0.0
+        self.version = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.lookup_hits = 0
+        self.lookup_misses = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def _ttl() -> float:
+        try:
+            from flask import current_app
+            return float(current_app.config.get('REFERENCE_CACHE_TTL', DEFAULT_TTL))
+        except RuntimeError:
+            return DEFAULT_TTL
+
+    def _load(self) -> Tuple[List[Dict], Dict[str, int], Dict[str, int], Dict[int, str]]:
+        from db import DatabaseHelper
+        rows = DatabaseHelper.fetch_all(
+            f"SELECT * FROM `{self.table}` ORDER BY `{self.id_column}`", {}
+        )
+        by_name = {}
+        by_casefold = {}
+        by_id = {}
+        for row in rows:
+            name = row.get(self.name_column)
+            if name is None:
+                continue
+            by_id[row[self.id_column]] = name
+            by_name.setdefault(name, row[self.id_column])
+            by_casefold.setdefault(name.strip().casefold(), row[self.id_column])
+        self._rows = rows
+        self._by_name = by_name
+        self._by_casefold = by_casefold
+        self._by_id = by_id
+        self._loaded_at = time.monotonic()
+        self.version += 1
+        return rows, by_name, by_casefold, by_id
+
+    def _ensure_loaded(self) -> Tuple[List[Dict], Dict[str, int], Dict[str, int], Dict[int, str]]:
+        """
+        Zwraca spójną migawkę (wiersze, nazwa -> id, nazwa bez wielkości liter -> id, id -> nazwa)
+
+        Migawka jest pobierana pod blokadą - invalidate() w innym wątku
+        (self._rows = None) nie może jej zmienić w trakcie odczytu.
+        """
+        with self._lock:
+            if self._rows is not None and time.monotonic() - self._loaded_at < self._ttl():
+                self.hits += 1
+                return self._rows, self._by_name, self._by_casefold, self._by_id
+            self.misses += 1
+            return self._load()
+
+    def rows(self) -> List[Dict]:
+        """Zwraca wszystkie wiersze tabeli (tylko do odczytu)"""
+        rows, _, _, _ = self._ensure_loaded()
+        return list(rows)
+
+    def id_for(self, name: Optional[str], case_insensitive: bool = False) -> Optional[int]:
+        """
+        Zwraca id dla dokładnej nazwy w O(1)
+
+        Args:
+            name: Nazwa z tabeli
+            case_insensitive: Dopuść różnicę wielkości liter (jak kolacja *_ci w bazie)
+
+        Returns:
+            id lub None gdy nazwy nie ma w słowniku
+        """
+        if name is None:
+            return None
+        _, by_name, by_casefold, _ = self._ensure_loaded()
+        found = by_name.get(name)
+        if found is None and case_insensitive:
+            found = by_casefold.get(name.strip().casefold())
+        if found is None:
+            self.lookup_misses += 1
+        else:
+            self.lookup_hits += 1
+        return found
+
+    def name_for(self, id_value) -> Optional[str]:
+        """Zwraca nazwę dla id (None gdy brak)"""
+        if id_value is None:
+            return None
+        _, _, _, by_id = self._ensure_loaded()
+        return by_id.get(id_value)
+
+    def invalidate(self):
+        """Wymusza ponowne wczytanie tabeli przy następnym odczycie"""
+        with self._lock:
+            self._rows = None
+            self.invalidations += 1
+
+    def stats(self) -> Dict:
+        rows = self._rows
+        return {
+            'rows': len(rows) if rows is not None else 0,
+            'version': self.version,
+            'hits': self.hits,
+            'misses': self.misses,
+            'lookup_hits': self.lookup_hits,
+            'lookup_misses': self.lookup_misses,
+            'invalidations': self.invalidations,
+        }
+
+
+firmy = ReferenceTable('firmy', 'id_firmy')
+miasta = ReferenceTable('miasta', 'id_miasta')
+kategorie = ReferenceTable('kategorie', 'id_kategorii')
+
+_tables = {table.table: table for table in (firmy, miasta, kategorie)}
+
+
+def invalidate(table: Optional[str] = None):
+    """Unieważnia cache jednej tabeli albo wszystkich (table=None)"""
+    if table is None:
+        for cached in _tables.values():
+            cached.invalidate()
+    elif table in _tables:
+        _tables[table].invalidate()
+
+
+def invalidate_for_query(query: str):
+    """Unieważnia cache tabeli, do której pisze zapytanie INSERT/UPDATE/DELETE"""
+    match = _WRITE_TARGET.match(query)
+    if match and match.group(1).lower() in _tables:
+        _tables[match.group(1).lower()].invalidate()
+
+
+metrics.register('reference_cache', lambda: {name: table.stats() for name, table in _tables.items()})
@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+"""
+Warianty obrazu paragonu (miniatura, podgląd, oryginał) generowane w tle
+Obsługuje polskie znaki: ą, ć, ę, ł, ń, ó, ś, ź, ż
+
+Po zapisaniu paragonu wątek w tle tworzy warianty w formatach, które
+obsługuje zainstalowany Pillow (JPEG zawsze, WebP/AVIF jeśli dostępne),
+zapisuje je w magazynie plików i rejestruje w tabeli `paragony_obrazy`.
+Endpoint /paragon/<id>/obraz wybiera wariant (?wariant=) i format (Accept).
+"""
+import io
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+from PIL import Image
+
+from services import metrics
+from services.image_pipeline import PreprocessedImage
+
+WARIANT_THUMB = 'thumb'
+WARIANT_MEDIUM = 'medium'
+WARIANT_ORIGINAL = 'original'
+
+# wariant -> (maksymalny bok w px, jakość); oryginał archiwizujemy bez skalowania
+WARIANTY = {
+    WARIANT_THUMB: (320, 60),
+    WARIANT_MEDIUM: (1280, 75),
+}
+
+MIME = {
+    'jpeg': 'image/jpeg',
+    'webp': 'image/webp',
+    'avif': 'image/avif',
+    'png': 'image/png',
+}
+
+# Formaty, w których oryginał archiwizujemy bez ponownego kodowania
+FORMATY_ORYGINALU = {'JPEG': 'jpeg', 'MPO': 'jpeg', 'PNG': 'png', 'WEBP': 'webp'}
+
+_stats = {'generated': 0, 'errors': 0, 'bytes': {}}
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def dostepne_formaty() -> List[str]:
+    """Formaty zapisu obsługiwane przez zainstalowany Pillow (najlepsza kompresja na początku)"""
+    Image.init()
+    formaty = []
+    if 'AVIF' in Image.SAVE:
+        formaty.append('avif')
+    if 'WEBP' in Image.SAVE:
+        formaty.append('webp')
+    formaty.append('jpeg')
+    return formaty
+
+
+def wybierz_format(accept: Optional[str], dostepne: Iterable[str]) -> str:
+    """Wybiera najlepszy format z dostępnych, który klient deklaruje w nagłówku Accept"""
+    accept = (accept or '').lower()
+    for fmt in ('avif', 'webp'):
+        if fmt in dostepne and MIME[fmt] in accept:
+            return fmt
+    return 'jpeg'
+
+
+def _zakoduj(img: Image.Image, fmt: str, quality: int) -> bytes:
+    buffer = io.BytesIO()
+    if fmt == 'jpeg':
+        img.save(buffer, format='JPEG', quality=quality, optimize=True, progressive=True)
+    elif fmt == 'webp':
+        img.save(buffer, format='WEBP', quality=quality, method=4)
+    else:
+        img.save(buffer, format='AVIF', quality=quality)
+    return buffer.getvalue()
+
+
+def generuj_warianty(img: Image.Image, oryginal: bytes, oryginal_format: Optional[str] = None) -> List[Dict]:
+    """
+    Tworzy warianty z obrazu po EXIF/RGB
+
+    Args:
+        img: Obraz RGB z poprawioną orientacją
+        oryginal: Bajty przesłanego pliku (archiwizowane bez zmian)
+        oryginal_format: Format oryginału z PIL (np. 'JPEG', 'PNG')
+
+    Returns:
+        Lista słowników: wariant, format, dane, szerokosc, wysokosc
+    """
+    wyniki = []
+    for wariant, (bok, jakosc) in WARIANTY.items():
+        kopia = img.copy()
+        kopia.thumbnail((bok, bok))
+        for fmt in dostepne_formaty():
+            wyniki.append({
+                'wariant': wariant,
+                'format': fmt,
+                'dane': _zakoduj(kopia, fmt, jakosc),
+                'szerokosc': kopia.width,
+                'wysokosc': kopia.height,
+            })
+    format_oryginalu = FORMATY_ORYGINALU.get(oryginal_format or '')
+    if format_oryginalu is None:
+        # Np. HEIC/TIFF - archiwizujemy jako JPEG wysokiej jakości
+        format_oryginalu, oryginal = 'jpeg', _zakoduj(img, 'jpeg', 95)
+    wyniki.append({
+        'wariant': WARIANT_ORIGINAL,
+        'format': format_oryginalu,
+        'dane': oryginal,
+        'szerokosc': img.width,
+        'wysokosc': img.height,
+    })
+    return wyniki
+
+
+def zapisz_warianty(id_paragonu: int, warianty: List[Dict]):
+    """Zapisuje warianty w magazynie plików i rejestruje je w paragony_obrazy"""
+    from db import DatabaseHelper
+    from services.blob_store import get_blob_store
+
+    store = get_blob_store()
+    wiersze = []
+    for wariant in warianty:
+        digest = store.put(wariant['dane'], MIME.get(wariant['format'], 'application/octet-stream'))
+        wiersze.append({
+            'id_paragonu': id_paragonu,
+            'wariant': wariant['wariant'],
+            'format': wariant['format'],
+            'obraz_hash': digest,
+            'szerokosc': wariant['szerokosc'],
+            'wysokosc': wariant['wysokosc'],
+            'rozmiar': len(wariant['dane']),
+        })
+        klucz = f"{wariant['wariant']}_{wariant['format']}"
+        _stats['bytes'][klucz] = _stats['bytes'].get(klucz, 0) + len(wariant['dane'])
+    DatabaseHelper.execute_many(
+        """INSERT INTO paragony_obrazy (id_paragonu, wariant, format, obraz_hash, szerokosc, wysokosc, rozmiar)
+           VALUES (:id_paragonu, :wariant, :format, :obraz_hash, :szerokosc, :wysokosc, :rozmiar)
+           ON DUPLICATE KEY UPDATE obraz_hash = VALUES(obraz_hash), szerokosc = VALUES(szerokosc),
+               wysokosc = VALUES(wysokosc), rozmiar = VALUES(rozmiar)""",
+        wiersze,
+    )
+
+
+def przetworz_paragon(id_paragonu: int, oryginal: Union[PreprocessedImage, bytes]):
+    """Generuje i zapisuje wszystkie warianty (wywoływane w tle)"""
+    try:
+        # Obraz z paragonik jest już zdekodowany - bez ponownego Image.open/EXIF/RGB
+        obraz = PreprocessedImage.z_danych(oryginal)
+        zapisz_warianty(id_paragonu, generuj_warianty(obraz.image, obraz.oryginal, obraz.format))
+        _stats['generated'] += 1
+    except Exception as e:
+        _stats['errors'] += 1
+        print(f"Warianty obrazu paragonu {id_paragonu}: błąd: {e}")
+
+
+def _wykonawca(app) -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=app.config.get('RENDITION_WORKERS', 2),
+                thread_name_prefix='warianty-obrazu',
+            )
+    return _executor
+
+
+def zaplanuj(app, id_paragonu: int, oryginal: Union[PreprocessedImage, bytes]):
+    """Zleca wygenerowanie wariantów w tle (w kontekście aplikacji)"""
+    def _zadanie():
+        with app.app_context():
+            przetworz_paragon(id_paragonu, oryginal)
+    if app is None:
+        przetworz_paragon(id_paragonu, oryginal)
+        return
+    _wykonawca(app).submit(_zadanie)
+
+
+def znajdz_wariant(id_paragonu, wariant: str, accept: Optional[str]) -> Optional[Tuple[str, str]]:
+    """
+    Zwraca (obraz_hash, mimetype) najlepszego dostępnego wariantu dla klienta
+
+    Returns:
+        None gdy warianty nie zostały (jeszcze) wygenerowane
+    """
+    from db import DatabaseHelper
+    wiersze = DatabaseHelper.fetch_all(
+        "SELECT format, obraz_hash FROM paragony_obrazy WHERE id_paragonu = :id_paragonu AND wariant = :wariant",
+        {'id_paragonu': id_paragonu, 'wariant': wariant},
+    )
+    if not wiersze:
+        return None
+    po_formacie = {wiersz['format']: wiersz['obraz_hash'] for wiersz in wiersze}
+    if wariant == WARIANT_ORIGINAL:
+        fmt = next(iter(po_formacie))
+    else:
+        fmt = wybierz_format(accept, po_formacie)
+        if fmt not in po_formacie:
+            fmt = 'jpeg' if 'jpeg' in po_formacie else next(iter(po_formacie))
+    return po_formacie[fmt], MIME.get(fmt, 'application/octet-stream')
+
+
+metrics.register('renditions', lambda: {
+    'generated': _stats['generated'],
+    'errors': _stats['errors'],
+    'bytes': dict(_stats['bytes']),
+    'formats': dostepne_formaty(),
+})
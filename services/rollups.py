@@ -0,0 +1,249 @@
+# -*- coding: utf-8 -*-
+"""
+Agregaty wydatków: użytkownik x dzień x kategoria i użytkownik x miesiąc x sklep
+Obsługuje polskie znaki: ą, ć, ę, ł, ń, ó, ś, ź, ż
+
+Raporty, limity i trendy miesięczne sumowały przy każdym zapytaniu surowe
+wiersze produkty JOIN paragony, często z filtrem DATE()/MONTH() na
+data_dodania, który wyłącza indeksy. Tabele wydatki_dzien_kategoria
+i wydatki_miesiac_sklep trzymają gotowe sumy. Po dodaniu, zmianie lub
+usunięciu paragonu przeliczane są tylko dotknięte komórki (dzień i miesiąc
+paragonu przed zmianą i po niej) - przeliczenie od nowa zamiast delty jest
+odporne na zmianę daty, kategorii czy sklepu. Przeliczenie przerwane blokadą
+lub deadlockiem jest ponawiane; gdy mimo to się nie uda, dni trafiają do
+tabeli wydatki_do_przeliczenia i są przeliczane przy następnym odczycie
+raportów użytkownika (napraw). Pełną przebudowę wykonuje flask rebuild-rollups.
+
+Granice bieżącego miesiąca liczy baza (CURDATE()), tak jak dawne zapytania -
+strefa czasowa aplikacji nie ma znaczenia.
+"""
+import random
+import time
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, Optional, Set, Tuple
+
+from sqlalchemy import text
+
+from services import metrics
+
+DZIEN_KATEGORIA = 'wydatki_dzien_kategoria'
+MIESIAC_SKLEP = 'wydatki_miesiac_sklep'
+DO_PRZELICZENIA = 'wydatki_do_przeliczenia'
+
+# Bieżący miesiąc wg zegara bazy: [pierwszy dzień, pierwszy dzień następnego)
+POCZATEK_MIESIACA_SQL = "CAST(DATE_FORMAT(CURDATE(), '%Y-%m-01') AS DATE)"
+KONIEC_MIESIACA_SQL = f"({POCZATEK_MIESIACA_SQL} + INTERVAL 1 MONTH)"
+
+# Błędy MariaDB/MySQL, po których przeliczenie ponawiamy: lock wait timeout, deadlock
+_BLEDY_BLOKAD = (1205, 1213)
+MAX_PROB = 3
+
+_stats = {'refreshes': 0, 'days': 0, 'months': 0, 'retries': 0, 'errors': 0,
+          'marked_dirty': 0, 'repaired': 0, 'seconds': 0.0}
+
+
+def poczatek_miesiaca(dzien: date) -> date:
+    return dzien.replace(day=1)
+
+
+def nastepny_miesiac(dzien: date) -> date:
+    return (dzien.replace(day=1) + timedelta(days=32)).replace(day=1)
+
+
+def _dzien_paragonu(connection, id_paragonu) -> Optional[Tuple[int, date]]:
+    row = connection.execute(
+        text("SELECT id_uzytkownika, data_dodania FROM paragony WHERE id_paragonu = :id_paragonu"),
+        {'id_paragonu': id_paragonu},
+    ).fetchone()
+    if row is None or row.data_dodania is None:
+        return None
+    data = row.data_dodania
+    return row.id_uzytkownika, data.date() if isinstance(data, datetime) else data
+
+
+def przelicz(connection, id_uzytkownika: int, dni: Iterable[date]):
+    """
+    Przelicza od nowa komórki agregatów dla podanych dni użytkownika (i ich miesięcy)
+
+    Args:
+        connection: Połączenie z DatabaseHelper.transaction()
+        id_uzytkownika: Właściciel paragonów
+        dni: Dni, których dotyczyła zmiana
+    """
+    from db import DatabaseHelper
+    dni = set(dni)
+    # Stała kolejność komórek - równoległe przeliczenia blokują wiersze w tej samej kolejności
+    for dzien in sorted(dni):
+        params = {'id_uzytkownika': id_uzytkownika, 'dzien': dzien, 'nastepny': dzien + timedelta(days=1)}
+        DatabaseHelper.execute(
+            f"DELETE FROM {DZIEN_KATEGORIA} WHERE id_uzytkownika = :id_uzytkownika AND dzien = :dzien",
+            params, connection=connection,
+        )
+        DatabaseHelper.execute(
+            f"DELETE FROM {DO_PRZELICZENIA} WHERE id_uzytkownika = :id_uzytkownika AND dzien = :dzien",
+            params, connection=connection,
+        )
+        DatabaseHelper.execute(
+            f"""INSERT INTO {DZIEN_KATEGORIA} (id_uzytkownika, dzien, id_kategorii, suma, liczba_produktow)
+                SELECT par.id_uzytkownika, :dzien, p.id_kategorii, SUM(p.cena), COUNT(*)
+                FROM produkty p
+                JOIN paragony par ON p.id_paragonu = par.id_paragonu
+                WHERE par.id_uzytkownika = :id_uzytkownika
+                  AND par.data_dodania >= :dzien AND par.data_dodania < :nastepny
+                GROUP BY par.id_uzytkownika, p.id_kategorii""",
+            params, connection=connection,
+        )
+    miesiace = {poczatek_miesiaca(dzien) for dzien in dni}
+    for miesiac in sorted(miesiace):
+        params = {'id_uzytkownika': id_uzytkownika, 'miesiac': miesiac, 'nastepny': nastepny_miesiac(miesiac)}
+        DatabaseHelper.execute(
+            f"DELETE FROM {MIESIAC_SKLEP} WHERE id_uzytkownika = :id_uzytkownika AND miesiac = :miesiac",
+            params, connection=connection,
+        )
+        DatabaseHelper.execute(
+            f"""INSERT INTO {MIESIAC_SKLEP} (id_uzytkownika, miesiac, id_firmy, suma, liczba_paragonow)
+                SELECT id_uzytkownika, :miesiac, id_firmy, SUM(suma), COUNT(*)
+                FROM paragony
+                WHERE id_uzytkownika = :id_uzytkownika
+                  AND data_dodania >= :miesiac AND data_dodania < :nastepny
+                GROUP BY id_uzytkownika, id_firmy""",
+            params, connection=connection,
+        )
+    _stats['days'] += len(dni)
+    _stats['months'] += len(miesiace)
+
+
+def _blokada(e: Exception) -> bool:
+    kod = getattr(getattr(e, 'orig', None), 'args', (None,))
+    return bool(kod) and kod[0] in _BLEDY_BLOKAD
+
+
+def _oznacz(komorki: Set[Tuple[int, date]]):
+    """Zapisuje komórki, których nie udało się przeliczyć - napraw() przeliczy je przy odczycie"""
+    from db import DatabaseHelper
+    try:
+        DatabaseHelper.execute_many(
+            f"INSERT IGNORE INTO {DO_PRZELICZENIA} (id_uzytkownika, dzien) VALUES (:id_uzytkownika, :dzien)",
+            [{'id_uzytkownika': uzytkownik, 'dzien': dzien} for uzytkownik, dzien in sorted(komorki)],
+        )
+        _stats['marked_dirty'] += len(komorki)
+    except Exception as e:
+        print(f"Agregaty wydatków: nie zapisano komórek do przeliczenia {sorted(komorki)}: {e} "
+              f"- uruchom flask rebuild-rollups")
+
+
+def _przelicz_komorki(komorki: Set[Tuple[int, date]]) -> bool:
+    # Agregaty w osobnej transakcji: błąd nie cofa zmiany paragonu. Blokady i deadlocki
+    # (równoległe przeliczenia tej samej komórki przez kolejkę / import) ponawiamy,
+    # inne błędy i wyczerpane próby zostawiają komórki w wydatki_do_przeliczenia
+    from db import DatabaseHelper
+    if not komorki:
+        return True
+    start = time.perf_counter()
+    udane = False
+    for proba in range(1, MAX_PROB + 1):
+        try:
+            with DatabaseHelper.transaction() as connection:
+                for id_uzytkownika in sorted({uzytkownik for uzytkownik, _ in komorki}):
+                    przelicz(connection, id_uzytkownika, [dzien for uzytkownik, dzien in komorki if uzytkownik == id_uzytkownika])
+            _stats['refreshes'] += 1
+            udane = True
+            break
+        except Exception as e:
+            if _blokada(e) and proba < MAX_PROB:
+                _stats['retries'] += 1
+                time.sleep(0.05 * proba * (1 + random.random()))
+                continue
+            _stats['errors'] += 1
+            print(f"Agregaty wydatków: błąd przeliczenia (próba {proba}): {e}")
+            _oznacz(komorki)
+            break
+    _stats['seconds'] += time.perf_counter() - start
+    return udane
+
+
+def odswiez_paragon(id_paragonu):
+    """Przelicza agregaty dnia i miesiąca nowo dodanego paragonu"""
+    from db import db
+    with db.engine.connect() as connection:
+        komorka = _dzien_paragonu(connection, id_paragonu)
+    _przelicz_komorki({komorka} if komorka else set())
+
+
+@contextmanager
+def sledz_paragon(id_paragonu):
+    """
+    Blok zmieniający paragon lub jego produkty - po wyjściu przelicza agregaty
+    dnia paragonu sprzed zmiany i po niej (zmiana daty, usunięcie)
+
+    Użycie:
+        with rollups.sledz_paragon(id_paragonu):
+            DatabaseHelper.execute("DELETE FROM produkty ...")
+    """
+    from db import db
+    with db.engine.connect() as connection:
+        przed = _dzien_paragonu(connection, id_paragonu)
+    yield
+    with db.engine.connect() as connection:
+        po = _dzien_paragonu(connection, id_paragonu)
+    _przelicz_komorki({komorka for komorka in (przed, po) if komorka})
+
+
+def napraw(id_uzytkownika: int):
+    """
+    Przelicza komórki użytkownika oznaczone jako nieaktualne - wywoływane przed
+    odczytem agregatów w raportach, limitach i narzędziach asystenta
+    """
+    from db import DatabaseHelper
+    try:
+        wiersze = DatabaseHelper.fetch_all(
+            f"SELECT dzien FROM {DO_PRZELICZENIA} WHERE id_uzytkownika = :id_uzytkownika",
+            {'id_uzytkownika': id_uzytkownika},
+        )
+    except Exception as e:
+        DatabaseHelper.rollback()
+        print(f"Agregaty wydatków: nie odczytano komórek do przeliczenia: {e}")
+        return
+    if not wiersze:
+        return
+    komorki = {(id_uzytkownika, date.fromisoformat(str(wiersz['dzien'])[:10])) for wiersz in wiersze}
+    if _przelicz_komorki(komorki):
+        _stats['repaired'] += len(komorki)
+
+
+def przebuduj(id_uzytkownika: int):
+    """Pełna przebudowa agregatów jednego użytkownika (flask rebuild-rollups)"""
+    from db import DatabaseHelper
+    params = {'id_uzytkownika': id_uzytkownika}
+    with DatabaseHelper.transaction() as connection:
+        DatabaseHelper.execute(f"DELETE FROM {DZIEN_KATEGORIA} WHERE id_uzytkownika = :id_uzytkownika",
+                               params, connection=connection)
+        DatabaseHelper.execute(
+            f"""INSERT INTO {DZIEN_KATEGORIA} (id_uzytkownika, dzien, id_kategorii, suma, liczba_produktow)
+                SELECT par.id_uzytkownika, DATE(par.data_dodania), p.id_kategorii, SUM(p.cena), COUNT(*)
+                FROM produkty p
+                JOIN paragony par ON p.id_paragonu = par.id_paragonu
+                WHERE par.id_uzytkownika = :id_uzytkownika AND par.data_dodania IS NOT NULL
+                GROUP BY par.id_uzytkownika, DATE(par.data_dodania), p.id_kategorii""",
+            params, connection=connection,
+        )
+        DatabaseHelper.execute(f"DELETE FROM {MIESIAC_SKLEP} WHERE id_uzytkownika = :id_uzytkownika",
+                               params, connection=connection)
+        DatabaseHelper.execute(f"DELETE FROM {DO_PRZELICZENIA} WHERE id_uzytkownika = :id_uzytkownika",
+                               params, connection=connection)
+        DatabaseHelper.execute(
+            f"""INSERT INTO {MIESIAC_SKLEP} (id_uzytkownika, miesiac, id_firmy, suma, liczba_paragonow)
+                SELECT id_uzytkownika, DATE_FORMAT(data_dodania, '%Y-%m-01'), id_firmy, SUM(suma), COUNT(*)
+                FROM paragony
+                WHERE id_uzytkownika = :id_uzytkownika AND data_dodania IS NOT NULL
+                GROUP BY id_uzytkownika, DATE_FORMAT(data_dodania, '%Y-%m-01'), id_firmy""",
+            params, connection=connection,
+        )
+
+
+def stats() -> Dict:
+    return dict(_stats, seconds=round(_stats['seconds'], 3))
+
+
+metrics.register('rollups', stats)
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""
+Cache statusu użytkownika (kolumna uzytkownicy.status) dla logów aktywności
+Obsługuje polskie znaki: ą, ć, ę, ł, ń, ó, ś, ź, ż
+
+Status trafia do każdego wpisu w logi (user_status_at_log), więc prawie
+każde żądanie robiło dodatkowy SELECT status FROM uzytkownicy. Status
+zmienia się rzadko (np. aktywacja premium), dlatego trzymamy go w pamięci
+procesu przez USER_STATUS_CACHE_TTL sekund. Zapis do tabeli uzytkownicy
+przez DatabaseHelper.execute unieważnia cache od razu; zmiana wykonana
+poza aplikacją (ręcznie w bazie) jest widoczna najpóźniej po TTL.
+"""
+import re
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+from services import metrics
+
+DEFAULT_TTL = 60
+NIEZNANY = 'unknown'
+
+_WRITE_USERS = re.compile(
+    r"^\s*(?:INSERT\s+(?:IGNORE\s+)?INTO|REPLACE\s+INTO|UPDATE|DELETE\s+FROM)\s+`?uzytkownicy`?\b",
+    re.IGNORECASE,
+)
+
+_cache: Dict[int, Tuple[str, float]] = {}
+_lock = threading.Lock()
+_stats = {'hits': 0, 'misses': 0, 'errors': 0, 'invalidations': 0}
+
+
+def _ttl() -> float:
+    try:
+        from flask import current_app
+        return float(current_app.config.get('USER_STATUS_CACHE_TTL', DEFAULT_TTL))
+    except RuntimeError:
+        return DEFAULT_TTL
+
+
+def get_user_status(user_id) -> str:
+    """Fetch latest user status for logging (cached per process for USER_STATUS_CACHE_TTL seconds)."""
+    from db import DatabaseHelper
+    teraz = time.monotonic()
+    with _lock:
+        wpis = _cache.get(user_id)
+        if wpis is not None and teraz - wpis[1] < _ttl():
+            _stats['hits'] += 1
+            return wpis[0]
+        _stats['misses'] += 1
+    try:
+        record = DatabaseHelper.fetch_one(
+            "SELECT status FROM uzytkownicy WHERE id_uzytkownika = :user_id",
+            {"user_id": user_id},
+        )
+    except Exception as e:
+        print(f"Error getting user status: {e}")
+        _stats['errors'] += 1
+        return NIEZNANY
+    status = (record.get("status") if record else None) or NIEZNANY
+    with _lock:
+        _cache[user_id] = (status, teraz)
+    return status
+
+
+def invalidate(user_id: Optional[int] = None):
+    """Usuwa status jednego użytkownika z cache albo wszystkich (user_id=None)"""
+    with _lock:
+        if user_id is None:
+            _cache.clear()
+        else:
+            _cache.pop(user_id, None)
+        _stats['invalidations'] += 1
+
+
+def invalidate_for_query(query: str):
+    """Czyści cache po zapisie do tabeli uzytkownicy (wywoływane przez DatabaseHelper)"""
+    if _WRITE_USERS.match(query):
+        invalidate()
+
+
+def stats() -> Dict:
+    with _lock:
+        return dict(_stats, cached=len(_cache))
+
+
+metrics.register('user_status', stats)
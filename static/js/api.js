@@ -245,12 +245,39 @@ class ApiService {
         return typeof response === 'string' ? JSON.parse(response) : response;
     }
 
+    // Keyset pagination: pass '' for the first page, then the returned next_cursor
+    async getReceiptsPage(cursor = '', size = CONFIG.DEFAULT_PAGE_SIZE) {
+        const response = await this.get(CONFIG.ENDPOINTS.RECEIPTS, { cursor, size });
+        const parsed = typeof response === 'string' ? JSON.parse(response) : response;
+        return { items: parsed.items || [], next_cursor: parsed.next_cursor || null };
+    }
+
     async getReceipt(id) {
         const response = await this.get(`${CONFIG.ENDPOINTS.RECEIPT}/${id}`);
         const parsed = typeof response === 'string' ? JSON.parse(response) : response;
         return parsed[0] || parsed; // Backend returns array with single element
     }
 
+    // Receipt image is served as a binary (cacheable) resource, fetched with the auth header
+    async getReceiptImageUrl(imageUrl) {
+        if (!this.isSessionValid()) {
+            this.removeToken();
+            throw new Error('Sesja wygasła. Zaloguj się ponownie.');
+        }
+        const headers = this.getHeaders(true, null);
+        // Backend picks WebP/AVIF renditions when the client accepts them
+        headers['Accept'] = 'image/avif,image/webp,image/jpeg;q=0.9,*/*;q=0.5';
+        const response = await fetch(`${this.baseURL}${imageUrl}`, {
+            method: 'GET',
+            headers
+        });
+        if (!response.ok) {
+            throw new Error('Nie udało się pobrać obrazu paragonu');
+        }
+        const blob = await response.blob();
+        return URL.createObjectURL(blob);
+    }
+
     async updateReceipt(id, data) {
         return this.put(`${CONFIG.ENDPOINTS.RECEIPT_UPDATE}/${id}`, data);
     }
@@ -265,6 +292,19 @@ class ApiService {
         return typeof response === 'string' ? response.replace(/"/g, '') : response;
     }
 
+    // Multipart upload - the file is streamed as-is, without the 33% base64 overhead
+    async analyzeReceiptFile(file) {
+        const formData = new FormData();
+        formData.append('image', file, file.name || 'receipt.jpg');
+        const response = await this.request(CONFIG.ENDPOINTS.ANALYZE_RECEIPT, {
+            method: 'POST',
+            body: formData,
+            // The browser sets multipart/form-data with the boundary itself
+            contentType: null
+        });
+        return typeof response === 'string' ? response.replace(/"/g, '') : response;
+    }
+
     // Products endpoints
     async getProducts(receiptId) {
         const response = await this.get(`${CONFIG.ENDPOINTS.PRODUCTS}/${receiptId}`);
@@ -358,6 +398,20 @@ class ApiService {
         return typeof response === 'string' ? JSON.parse(response) : response;
     }
 
+    async getLogsPage(cursor = '', size = 50, filters = {}) {
+        const params = { cursor, size };
+
+        if (filters.details) params.details = filters.details;
+        if (filters.dateFrom) params.date_from = filters.dateFrom;
+        if (filters.dateTo) params.date_to = filters.dateTo;
+        if (filters.userStatus) params.user_status = filters.userStatus;
+        if (filters.action) params.action = filters.action;
+
+        const response = await this.get(CONFIG.ENDPOINTS.LOGS, params);
+        const parsed = typeof response === 'string' ? JSON.parse(response) : response;
+        return { items: parsed.items || [], next_cursor: parsed.next_cursor || null };
+    }
+
     // Reports endpoints
     async getReport(startDate, endDate) {
         const response = await this.get(CONFIG.ENDPOINTS.REPORT, { startDate, endDate });
@@ -3,6 +3,9 @@ class ProfileManager {
     constructor() {
         this.currentLogsPage = 0;
         this.logsPageSize = 10;
+        // Cursor of each visited logs page (keyset pagination), '' = first page
+        this.logsCursors = [''];
+        this.logsNextCursor = null;
         this.allLogs = [];
         this.filteredLogs = [];
         this.initializeEventListeners();
@@ -324,14 +327,18 @@ class ProfileManager {
         try {
             ui.showLoader();
             this.currentLogsPage = page;
+            if (page === 0) {
+                this.logsCursors = [''];
+            }
             
             // Prepare filters object from form inputs
             const filters = applyFilters ? this.getActiveFilters() : {};
             
             console.log('Loading logs - Page:', page, 'Size:', this.logsPageSize, 'Filters:', filters);
             
-            const logs = await api.getLogs(page, this.logsPageSize, filters);
-            this.allLogs = Array.isArray(logs) ? logs : [];
+            const logsPage = await api.getLogsPage(this.logsCursors[page], this.logsPageSize, filters);
+            this.allLogs = Array.isArray(logsPage.items) ? logsPage.items : [];
+            this.logsNextCursor = logsPage.next_cursor;
             this.filteredLogs = [...this.allLogs];
             
             console.log('Loaded logs:', this.allLogs.length, 'records');
@@ -348,6 +355,7 @@ class ProfileManager {
             console.error('Error loading logs:', error);
             ui.showToast(error.message || 'Błąd podczas ładowania logów', 'error');
             this.allLogs = [];
+            this.logsNextCursor = null;
             this.filteredLogs = [];
             this.renderLogs();
         } finally {
@@ -775,8 +783,8 @@ class ProfileManager {
         }
 
         if (nextBtn) {
-            // Disable next if we got less than page size (last page)
-            nextBtn.disabled = this.allLogs.length < this.logsPageSize;
+            // Backend returns no next cursor on the last page
+            nextBtn.disabled = !this.logsNextCursor;
         }
 
         if (pageInfo) {
@@ -791,6 +799,10 @@ class ProfileManager {
     }
 
     loadLogsNextPage() {
+        if (!this.logsNextCursor) {
+            return;
+        }
+        this.logsCursors[this.currentLogsPage + 1] = this.logsNextCursor;
         this.loadLogs(this.currentLogsPage + 1, true);
     }
 }
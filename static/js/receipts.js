@@ -2,8 +2,12 @@
 class ReceiptsManager {
     constructor() {
         this.currentPage = 0;
+        // Cursor of each visited page (keyset pagination), '' = first page
+        this.cursors = [''];
+        this.nextCursor = null;
         this.pageSize = CONFIG.DEFAULT_PAGE_SIZE;
         this.currentReceiptId = null;
+        this.receiptImageObjectUrl = null;
         this.aiPdfConfig = {
             dishes: {
                 buttonId: 'download-dishes-pdf',
@@ -191,7 +195,9 @@ class ReceiptsManager {
 
     async loadReceipts() {
         try {
-            const receipts = await api.getReceipts(this.currentPage, this.pageSize);
+            const page = await api.getReceiptsPage(this.cursors[this.currentPage], this.pageSize);
+            const receipts = page.items;
+            this.nextCursor = page.next_cursor;
             const container = document.getElementById('receipts-list');
 
             if (!receipts || receipts.length === 0) {
@@ -229,15 +235,13 @@ class ReceiptsManager {
     }
 
     async nextPage() {
-        this.currentPage++;
-        const receipts = await api.getReceipts(this.currentPage, this.pageSize);
-        
-        if (!receipts || receipts.length === 0) {
-            this.currentPage--;
+        if (!this.nextCursor) {
             ui.showToast('To jest ostatnia strona', 'info');
-        } else {
-            await this.loadReceipts();
+            return;
         }
+        this.cursors[this.currentPage + 1] = this.nextCursor;
+        this.currentPage++;
+        await this.loadReceipts();
     }
 
     async searchReceipts() {
@@ -298,8 +302,23 @@ class ReceiptsManager {
             const imageSection = document.querySelector('.receipt-image-section');
             if (receiptImage && imageSection) {
                 const placeholder = imageSection.querySelector('.receipt-image-empty-state');
-                if (receipt.obraz) {
-                    const imageSrc = `data:image/jpeg;base64,${receipt.obraz}`;
+                if (this.receiptImageObjectUrl) {
+                    URL.revokeObjectURL(this.receiptImageObjectUrl);
+                    this.receiptImageObjectUrl = null;
+                }
+                let imageSrc = null;
+                if (receipt.obraz_url) {
+                    try {
+                        // Medium rendition is enough for the detail view (much smaller on mobile)
+                        this.receiptImageObjectUrl = await api.getReceiptImageUrl(`${receipt.obraz_url}?wariant=medium`);
+                        imageSrc = this.receiptImageObjectUrl;
+                    } catch (imageError) {
+                        console.error('Receipt image error:', imageError);
+                    }
+                } else if (receipt.obraz) {
+                    imageSrc = `data:image/jpeg;base64,${receipt.obraz}`;
+                }
+                if (imageSrc) {
                     receiptImage.src = imageSrc;
                     receiptImage.classList.remove('hidden');
                     receiptImage.style.cursor = 'default';
@@ -204,14 +204,8 @@ class ScanManager {
         ui.showReceiptLoader();
 
         try {
-            // Convert file to base64
-            const base64 = await this.fileToBase64(this.selectedFile);
-            
-            // Remove data URL prefix
-            const base64Data = base64.split(',')[1];
-
-            // Send to API - when it responds, immediately show the result
-            const receiptId = await api.analyzeReceipt(base64Data);
+            // Send the file as multipart upload - when it responds, immediately show the result
+            const receiptId = await api.analyzeReceiptFile(this.selectedFile);
 
             // Hide loader immediately when backend responds
             ui.hideReceiptLoader();